@@ -0,0 +1,225 @@
+"""
+Garbage collector for the attachment store.
+
+Files end up unreferenced when issues or comments are deleted (the rows
+cascade, the blobs stay), when a request dies between storing an upload and
+committing its row, or when a chunked upload is abandoned. collect_garbage()
+reconciles the upload tree with the attachments table as a merge join of two
+sorted streams: referenced hashes come from an indexed, ordered query read in
+batches, and the sharded <ab>/<cd>/<hash> tree is walked in sorted order one
+leaf directory at a time. Memory stays bounded by a single leaf directory and
+one result batch regardless of how many files the store holds.
+
+Nothing younger than the grace period is removed, since a blob may have just
+been written (or deduplicated against) by an upload whose row is not yet
+committed.
+"""
+
+from datetime import datetime, timedelta
+import os
+import re
+import time
+
+from app import app, db
+from models import Attachment, UploadSession
+from serving import absolute_path
+from storage import attachment_store
+
+app.config.setdefault('ATTACHMENT_GC_GRACE_SECONDS', 24 * 3600)
+app.config.setdefault('UPLOAD_SESSION_TTL_DAYS', 7)
+
+SHARD_RE = re.compile(r'^[0-9a-f]{2}$')
+HASH_LENGTH = 64
+REPORT_SAMPLE_SIZE = 100
+
+
+class GCReport:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.counts = {
+            'blobs_scanned': 0,
+            'orphan_blobs': 0,
+            'orphan_legacy_files': 0,
+            'stale_temp_files': 0,
+            'expired_upload_sessions': 0,
+            'skipped_in_grace_period': 0,
+            'missing_blobs': 0,
+        }
+        self.reclaimed_bytes = 0
+        self.samples = []
+
+    def record(self, category, paths):
+        self.counts[category] += 1
+        for path in paths:
+            try:
+                self.reclaimed_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+            if len(self.samples) < REPORT_SAMPLE_SIZE:
+                self.samples.append({'category': category, 'path': os.path.relpath(path, attachment_store.base)})
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'counts': self.counts,
+            'reclaimed_bytes': self.reclaimed_bytes,
+            'samples': self.samples
+        }
+
+
+def _referenced_hashes(batch_size):
+    """Distinct content hashes in ascending order, fetched in keyset-paginated batches"""
+    last = ''
+    while True:
+        rows = (db.session.query(Attachment.content_hash)
+                .filter(Attachment.content_hash > last)
+                .distinct()
+                .order_by(Attachment.content_hash)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return
+        for (content_hash,) in rows:
+            yield content_hash
+        last = rows[-1][0]
+
+
+def _referenced_legacy_names(batch_size):
+    """Store-relative names of pre-store flat uploads that rows still reference"""
+    # Legacy rows are a fixed, shrinking set (recompress_attachments.py migrates
+    # them into the store), so holding their names in memory is bounded.
+    last_id = 0
+    names = set()
+    while True:
+        rows = (db.session.query(Attachment.id, Attachment.file_path)
+                .filter(Attachment.content_hash.is_(None), Attachment.id > last_id)
+                .order_by(Attachment.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        for attachment_id, file_path in rows:
+            names.add(os.path.relpath(absolute_path(file_path), attachment_store.base))
+        last_id = rows[-1][0]
+    return names
+
+
+def _derived_from(name, names):
+    """Whether `name` is a file derived from one of `names` (<name>.lines, <name>.thumb-256.webp, ...)"""
+    index = name.find('.')
+    while index != -1:
+        if name[:index] in names:
+            return True
+        index = name.find('.', index + 1)
+    return False
+
+
+def _sorted_dirs(path):
+    try:
+        return sorted(entry.name for entry in os.scandir(path) if entry.is_dir() and SHARD_RE.match(entry.name))
+    except FileNotFoundError:
+        return []
+
+
+def _stored_blobs():
+    """Yield (content_hash, [files]) for every blob in the tree, in hash order"""
+    base = attachment_store.base
+    for first in _sorted_dirs(base):
+        for second in _sorted_dirs(os.path.join(base, first)):
+            leaf = os.path.join(base, first, second)
+            groups = {}
+            for entry in os.scandir(leaf):
+                if entry.is_file():
+                    groups.setdefault(entry.name[:HASH_LENGTH], []).append(entry.path)
+            for content_hash in sorted(groups):
+                yield content_hash, groups[content_hash]
+
+
+def _scan_files(path):
+    try:
+        return [entry for entry in os.scandir(path) if entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def _older_than(paths, cutoff):
+    try:
+        return all(os.path.getmtime(path) < cutoff for path in paths)
+    except FileNotFoundError:
+        return False
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def collect_garbage(dry_run=True, grace_seconds=None, batch_size=5000):
+    """Reclaim unreferenced blobs, legacy files and abandoned temp files; returns a report dict"""
+    if grace_seconds is None:
+        grace_seconds = app.config['ATTACHMENT_GC_GRACE_SECONDS']
+    cutoff = time.time() - grace_seconds
+    report = GCReport(dry_run)
+
+    # 1. Content-addressed blobs: merge join of two sorted streams
+    referenced = _referenced_hashes(batch_size)
+    current = next(referenced, None)
+    for content_hash, paths in _stored_blobs():
+        report.counts['blobs_scanned'] += 1
+        while current is not None and current < content_hash:
+            report.counts['missing_blobs'] += 1
+            current = next(referenced, None)
+        if current == content_hash:
+            current = next(referenced, None)
+            continue
+        if not _older_than(paths, cutoff):
+            report.counts['skipped_in_grace_period'] += 1
+            continue
+        report.record('orphan_blobs', paths)
+        if not dry_run:
+            _remove(paths)
+    while current is not None:
+        report.counts['missing_blobs'] += 1
+        current = next(referenced, None)
+
+    # 2. Legacy flat uploads directly under the upload folder, with the line
+    # indexes and thumbnails kept beside the ones still referenced
+    legacy_names = _referenced_legacy_names(batch_size)
+    for entry in _scan_files(attachment_store.base):
+        if entry.name in legacy_names or _derived_from(entry.name, legacy_names):
+            continue
+        if entry.stat().st_mtime >= cutoff:
+            report.counts['skipped_in_grace_period'] += 1
+            continue
+        report.record('orphan_legacy_files', [entry.path])
+        if not dry_run:
+            _remove([entry.path])
+
+    # 3. Abandoned chunked uploads, then temp files nobody owns
+    expiry = datetime.now() - timedelta(days=app.config['UPLOAD_SESSION_TTL_DAYS'])
+    active_parts = set()
+    for upload in UploadSession.query.filter_by(status='uploading').yield_per(batch_size):
+        if upload.updated_at and upload.updated_at < expiry:
+            part_path = os.path.join(attachment_store.tmp_dir, f'{upload.id}.part')
+            report.record('expired_upload_sessions', [part_path] if os.path.exists(part_path) else [])
+            if not dry_run:
+                _remove([part_path])
+                db.session.delete(upload)
+        else:
+            active_parts.add(f'{upload.id}.part')
+    if not dry_run:
+        db.session.commit()
+
+    for entry in _scan_files(attachment_store.tmp_dir):
+        if entry.name in active_parts:
+            continue
+        if entry.stat().st_mtime >= cutoff:
+            continue
+        report.record('stale_temp_files', [entry.path])
+        if not dry_run:
+            _remove([entry.path])
+
+    return report.to_dict()
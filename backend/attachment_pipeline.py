@@ -0,0 +1,35 @@
+"""
+Post-upload processing for attachments.
+
+Routes call schedule_attachment_processing() once new attachment rows are
+committed; each attachment is then processed on the background pool.
+"""
+
+from background import run_in_background
+from compression import compress_attachment, is_compressible, is_text_attachment
+from image_similarity import hash_attachment
+from models import Attachment
+from serving import absolute_path, is_image_attachment
+from signatures import extract_attachment_signature
+from thumbnails import generate_thumbnails
+
+
+def process_attachment(attachment_id):
+    attachment = Attachment.query.get(attachment_id)
+    if not attachment:
+        return
+    path = absolute_path(attachment.file_path)
+    if is_image_attachment(attachment):
+        generate_thumbnails(path)
+        hash_attachment(attachment)
+        return
+    if is_text_attachment(attachment):
+        # Read the log for its failure signature before it is compressed
+        extract_attachment_signature(attachment)
+    if is_compressible(attachment):
+        compress_attachment(attachment)
+
+
+def schedule_attachment_processing(attachments):
+    for attachment in attachments:
+        run_in_background(process_attachment, attachment.id)
@@ -0,0 +1,41 @@
+"""
+In-process background worker pool.
+
+Post-upload work (thumbnails and other derived data) runs here so requests can
+return as soon as the upload is committed. Tasks run inside an application
+context with their own database session. Set BACKGROUND_TASKS_EAGER to run
+tasks inline in the caller's context instead (useful for scripts and tests).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from app import app, db
+
+app.config.setdefault('BACKGROUND_WORKERS', int(os.getenv('BACKGROUND_WORKERS', '2')))
+app.config.setdefault('BACKGROUND_TASKS_EAGER', False)
+
+executor = ThreadPoolExecutor(
+    max_workers=app.config['BACKGROUND_WORKERS'],
+    thread_name_prefix='background'
+)
+
+
+def run_in_background(fn, *args, **kwargs):
+    def task():
+        with app.app_context():
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Background task {fn.__name__} failed: {e}")
+            finally:
+                db.session.remove()
+
+    if app.config['BACKGROUND_TASKS_EAGER']:
+        # Inline: share the caller's context and session
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Background task {fn.__name__} failed: {e}")
+        return None
+    return executor.submit(task)
@@ -0,0 +1,189 @@
+"""
+Change feed for in-memory indexes.
+
+Every flush that inserts, updates or deletes an Issue, Comment or additional
+TestcasePath appends a row to change_log in the same transaction, so the log
+commits (or rolls back) together with the change itself. Indexes held in process memory remember the
+position in the log in a ChangeCursor and read from it to catch up, which
+keeps every worker process consistent without a message bus; catching up is
+a primary-key range scan that is empty most of the time.
+
+Ids are AUTO_INCREMENT values, taken when a row is inserted but visible
+only once its transaction commits, so a change can appear below ids that
+were already read. A cursor remembers the ids it stepped over and looks for
+them again until they turn up or GAP_TIMEOUT has passed (a rolled back
+transaction leaves its ids unused for good). Replaying a change must be
+harmless, since a consumer started from stable_change_id() may see changes
+its initial load already reflects.
+"""
+
+from datetime import datetime, timedelta
+import os
+import threading
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import app, db
+from background import run_in_background
+from models import ChangeLog, Comment, Issue, TestcasePath
+
+TRACKED_ENTITIES = {Issue: 'issue', Comment: 'comment', TestcasePath: 'testcase_path'}
+GAP_TIMEOUT = timedelta(minutes=5)  # Longer than any transaction that writes tracked rows
+MAX_GAPS = 1000
+
+
+def index_path(name):
+    """Location of an index snapshot file under INDEX_FOLDER"""
+    folder = os.path.join(app.root_path, app.config['INDEX_FOLDER'])
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
+def _entry(obj, action):
+    entity = TRACKED_ENTITIES[type(obj)]
+    issue_id = obj.id if entity == 'issue' else obj.issue_id
+    return {'entity': entity, 'entity_id': obj.id, 'issue_id': issue_id, 'action': action, 'created_at': datetime.now()}
+
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    # new/dirty/deleted still describe the flush that just ran; ids are assigned
+    entries = []
+    for obj in session.new:
+        if type(obj) in TRACKED_ENTITIES:
+            entries.append(_entry(obj, 'insert'))
+    for obj in session.dirty:
+        if type(obj) in TRACKED_ENTITIES and session.is_modified(obj):
+            entries.append(_entry(obj, 'update'))
+    for obj in session.deleted:
+        if type(obj) in TRACKED_ENTITIES:
+            entries.append(_entry(obj, 'delete'))
+    if entries:
+        session.connection().execute(ChangeLog.__table__.insert(), entries)
+
+
+class LazyIndex:
+    """
+    Holder for a process-wide index that is loaded once, in the background.
+    get() returns None until `load` has finished, so requests never wait on
+    a cold start; a failed load is retried by the next get().
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._index = None
+        self._loading = threading.Lock()
+
+    def get(self):
+        if self._index is None and self._loading.acquire(blocking=False):
+            # The lock stays held after a successful load
+            run_in_background(self._run)
+        return self._index
+
+    def _run(self):
+        try:
+            self._index = self._load()
+        except Exception:
+            self._loading.release()
+            raise
+
+
+def latest_change_id():
+    return db.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+
+class ChangeCursor:
+    """
+    A consumer's position in the change log, or in another append-only table
+    read in id order (`query` builds the query, whose rows have id and
+    created_at; `column` is its id column).
+
+        changes = cursor.read(limit)   # Late arrivals first, then newer rows
+        ...apply them...
+        cursor.advance(changes)
+    """
+
+    def __init__(self, position=0, query=None, column=None):
+        self.position = position  # Highest id read
+        self.gaps = {}  # Skipped id -> created_at of the row that skipped it
+        self._query = query or (lambda: ChangeLog.query)
+        self._column = column if column is not None else ChangeLog.id
+
+    def _expire_gaps(self):
+        cutoff = datetime.now() - GAP_TIMEOUT
+        self.gaps = {row_id: seen for row_id, seen in self.gaps.items() if seen >= cutoff}
+
+    @property
+    def watermark(self):
+        """Id at and below which every row has been read or never will be; the position to persist"""
+        self._expire_gaps()
+        return min(self.gaps) - 1 if self.gaps else self.position
+
+    def read(self, limit=1000):
+        """Rows that filled a gap, then up to `limit` rows past the position, oldest first"""
+        self._expire_gaps()
+        late = []
+        if self.gaps:
+            late = self._query().filter(self._column.in_(sorted(self.gaps))).order_by(self._column).all()
+        return late + (self._query()
+                       .filter(self._column > self.position)
+                       .order_by(self._column)
+                       .limit(limit)
+                       .all())
+
+    def advance(self, rows):
+        """Record `rows`, as returned by read(), as applied"""
+        for row in rows:
+            self.gaps.pop(row.id, None)
+            if row.id > self.position:
+                for skipped in range(max(self.position + 1, row.id - MAX_GAPS), row.id):
+                    self.gaps[skipped] = row.created_at or datetime.now()
+                self.position = row.id
+        if len(self.gaps) > MAX_GAPS:
+            for skipped in sorted(self.gaps)[:len(self.gaps) - MAX_GAPS]:
+                del self.gaps[skipped]
+
+
+def stable_change_id():
+    """
+    Latest change id at and below which every change is visible. An index
+    loaded from the tables starts its cursor here: starting at
+    latest_change_id() would skip a change still committing below it.
+    """
+    latest = latest_change_id()
+    cursor = ChangeCursor(max(latest - MAX_GAPS, 0), query=lambda: db.session.query(ChangeLog.id, ChangeLog.created_at))
+    cursor.advance(cursor.read(limit=MAX_GAPS))
+    return min(cursor.watermark, latest)
+
+
+def changed_issues(changes):
+    """
+    Collapse a batch of changes into (issue ids to refresh, issue ids deleted).
+    A comment or testcase path change refreshes its issue. Issue ids are never reused, so a
+    deleted issue stays deleted whatever order its cascade was logged in.
+    """
+    refreshed = set()
+    deleted = set()
+    for change in changes:
+        if change.issue_id is None:
+            continue
+        if change.entity == 'issue' and change.action == 'delete':
+            deleted.add(change.issue_id)
+        else:
+            refreshed.add(change.issue_id)
+    return refreshed - deleted, deleted
+
+
+def prune_changes(older_than_days=30):
+    """Delete old change log rows; consumers that fell further behind rebuild from scratch"""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    deleted = ChangeLog.query.filter(ChangeLog.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def is_pruned_past(after_id):
+    """True if changes after `after_id` may already have been pruned"""
+    oldest = db.session.query(func.min(ChangeLog.id)).scalar()
+    return oldest is not None and after_id < oldest - 1
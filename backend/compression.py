@@ -0,0 +1,162 @@
+"""
+Compression at rest for text attachments.
+
+Plain-text logs compress 10-20x, so once a text attachment is stored its blob
+is gzip-compressed in the background to `<blob>.gz` and the identity copy is
+removed. Every attachment row sharing the blob records content_encoding='gzip'
+and the compressed stored_size; file_size and mime_type keep describing the
+original file. serving.py either passes the gzip stream through with
+Content-Encoding or decompresses it on the fly.
+
+gzip (stdlib) is used rather than zstd so no native dependency is needed.
+"""
+
+import gzip
+import os
+
+from app import app, db
+from models import Attachment
+from serving import absolute_path, stored_encoding
+from storage import attachment_store, CHUNK_SIZE
+
+COMPRESSIBLE_EXTENSIONS = {
+    'txt', 'log', 'out', 'err', 'csv', 'tsv', 'json', 'xml', 'html', 'htm',
+    'diff', 'patch', 'md', 'yaml', 'yml', 'ini', 'cfg', 'tcl', 'sh', 'py',
+}
+COMPRESSIBLE_MIME_TYPES = {
+    'application/json', 'application/xml', 'application/x-sh', 'application/x-yaml',
+}
+
+app.config.setdefault('COMPRESSION_MIN_SIZE', 4 * 1024)
+# Keep the identity copy unless gzip saves at least this fraction
+app.config.setdefault('COMPRESSION_MIN_SAVING', 0.2)
+
+
+def is_text_attachment(attachment):
+    mime_type = (attachment.mime_type or '').split(';')[0].strip().lower()
+    extension = os.path.splitext(attachment.filename or '')[1].lower().lstrip('.')
+    return (mime_type.startswith('text/') or mime_type in COMPRESSIBLE_MIME_TYPES
+            or extension in COMPRESSIBLE_EXTENSIONS)
+
+
+def is_compressible(attachment):
+    if not is_text_attachment(attachment):
+        return False
+    return (attachment.file_size or 0) >= app.config['COMPRESSION_MIN_SIZE']
+
+
+def gzip_file(source_path, target_path):
+    """Stream `source_path` into a gzip file at `target_path` atomically; returns its size"""
+    tmp_path = f'{target_path}.{os.getpid()}.tmp'
+    try:
+        with open(source_path, 'rb') as source, open(tmp_path, 'wb') as raw:
+            # mtime=0 and no embedded filename keep the output deterministic
+            with gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=6, mtime=0) as out:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return os.path.getsize(target_path)
+
+
+def compress_attachment(attachment):
+    """
+    Compress a content-addressed text attachment's blob in place.
+    Returns the compressed size, or None if the blob was left as is.
+    """
+    if not attachment.content_hash or not is_compressible(attachment):
+        return None
+    path = absolute_path(attachment.file_path)
+    gz_path = path + '.gz'
+    if stored_encoding(attachment, path) != 'gzip':
+        stored_size = gzip_file(path, gz_path)
+        if stored_size > (attachment.file_size or 0) * (1 - app.config['COMPRESSION_MIN_SAVING']):
+            os.unlink(gz_path)
+            return None
+    else:
+        stored_size = os.path.getsize(gz_path)
+
+    # Flip every row that shares the blob before dropping the identity copy
+    Attachment.query.filter_by(content_hash=attachment.content_hash).update(
+        {'content_encoding': 'gzip', 'stored_size': stored_size},
+        synchronize_session=False
+    )
+    db.session.commit()
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    return stored_size
+
+
+def migrate_legacy_attachment(attachment):
+    """
+    Move a pre-store flat upload (uploads/<timestamp>_<name>) into the
+    content-addressed store so it can be deduplicated and compressed.
+    """
+    legacy_path = absolute_path(attachment.file_path)
+    with open(legacy_path, 'rb') as source:
+        blob = attachment_store.put_stream(source)
+    Attachment.query.filter_by(file_path=attachment.file_path).update(
+        {'file_path': blob.path, 'content_hash': blob.content_hash, 'file_size': blob.size},
+        synchronize_session=False
+    )
+    db.session.commit()
+    os.unlink(legacy_path)
+    db.session.refresh(attachment)
+    return blob
+
+
+def recompress_existing(batch_size=500, dry_run=False, limit=None):
+    """
+    Walk every attachment (in id order, one batch at a time), moving legacy
+    flat uploads into the store and compressing text blobs that are still
+    stored uncompressed. Returns a summary dict.
+    """
+    summary = {'scanned': 0, 'migrated': 0, 'compressed': 0, 'bytes_before': 0, 'bytes_after': 0, 'errors': 0}
+    last_id = 0
+    while limit is None or summary['scanned'] < limit:
+        batch = (Attachment.query
+                 .filter(Attachment.id > last_id)
+                 .order_by(Attachment.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        for attachment in batch:
+            last_id = attachment.id
+            summary['scanned'] += 1
+            if attachment.content_encoding == 'gzip':
+                continue
+            try:
+                if not attachment.content_hash:
+                    if not os.path.exists(absolute_path(attachment.file_path)):
+                        continue
+                    summary['migrated'] += 1
+                    if not dry_run:
+                        migrate_legacy_attachment(attachment)
+                if not is_compressible(attachment):
+                    continue
+                summary['bytes_before'] += attachment.file_size or 0
+                if dry_run:
+                    summary['compressed'] += 1
+                    continue
+                stored_size = compress_attachment(attachment)
+                if stored_size is not None:
+                    summary['compressed'] += 1
+                    summary['bytes_after'] += stored_size
+                else:
+                    summary['bytes_after'] += attachment.file_size or 0
+            except OSError as e:
+                db.session.rollback()
+                summary['errors'] += 1
+                print(f"Error recompressing attachment {attachment.id}: {e}")
+            if limit is not None and summary['scanned'] >= limit:
+                break
+        db.session.expunge_all()
+    return summary
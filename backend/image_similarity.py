@@ -0,0 +1,269 @@
+"""
+Perceptual hashes for screenshots, and lookup of visually similar ones.
+
+Image attachments get two 64-bit perceptual hashes in the background: a
+pHash (signs of the low-frequency DCT coefficients of a 32x32 grayscale
+image) and a dHash (horizontal gradient signs of a 9x8 image). Re-encoding,
+resizing and small rendering differences flip only a few bits, so the same
+broken dialog captured twice is a few bits apart in Hamming distance.
+
+Similar screenshots are found with multi-index hashing on the pHash: the
+64 bits are split into four 16-bit chunks, and any hash within distance d of
+the query agrees with it to within d // 4 bits on at least one chunk. Each
+chunk is a counting-sort bucket table (offsets per 16-bit value), so a lookup
+probes a few dozen buckets and verifies the candidates' full distance. Rows
+hashed since the tables were built are scanned directly. The index is kept in
+memory and tails image_hashes by id with a ChangeCursor, so a hash committed
+after a higher id was read is still picked up; hashes of deleted attachments
+are dropped when results are resolved against the database.
+"""
+
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+from scipy.fft import dctn
+
+from app import app, db
+from background import run_in_background
+from changefeed import ChangeCursor, LazyIndex
+from models import Attachment, ImageHash, Issue
+from serving import absolute_path, is_image_attachment
+
+app.config.setdefault('SIMILAR_IMAGE_MAX_DISTANCE', 8)
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+MAX_DISTANCE = 12
+REBUILD_THRESHOLD = 4096
+LOAD_BATCH_SIZE = 20000
+
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], np.uint8)
+# XOR masks reaching every 16-bit value within k bits, for k = 0..MAX_DISTANCE // CHUNKS
+_chunk_popcount = POPCOUNT[np.arange(1 << CHUNK_BITS) & 0xFF] + POPCOUNT[np.arange(1 << CHUNK_BITS) >> 8]
+PROBE_MASKS = [np.flatnonzero(_chunk_popcount <= k).astype(np.uint64) for k in range(MAX_DISTANCE // CHUNKS + 1)]
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def _grayscale(path, size):
+    image = Image.open(path)
+    image.draft('L', (size[0] * 4, size[1] * 4))  # Let JPEG decode at reduced scale
+    image = ImageOps.exif_transpose(image).convert('L')
+    return np.asarray(image.resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def phash(path):
+    coefficients = dctn(_grayscale(path, (32, 32)), norm='ortho')[:8, :8]
+    median = np.median(coefficients.ravel()[1:])  # The DC term only tracks brightness
+    return _pack(coefficients > median)
+
+
+def dhash(path):
+    pixels = _grayscale(path, (9, 8))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def to_signed(value):
+    """Store unsigned 64-bit hashes in signed BIGINT columns"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distances(codes, code):
+    """Bit differences between each of `codes` (uint64 array) and `code`"""
+    return POPCOUNT[(codes ^ np.uint64(code)).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def hash_attachment(attachment):
+    """Compute and store the perceptual hashes of an image attachment; returns the row"""
+    existing = ImageHash.query.filter_by(attachment_id=attachment.id).first()
+    if existing:
+        return existing
+    twin = None
+    if attachment.content_hash:
+        # Identical uploads share a blob, and so share hashes
+        twin = (ImageHash.query
+                .join(Attachment, ImageHash.attachment_id == Attachment.id)
+                .filter(Attachment.content_hash == attachment.content_hash)
+                .first())
+    if twin:
+        p_hash, d_hash = twin.phash, twin.dhash
+    else:
+        path = absolute_path(attachment.file_path)
+        p_hash, d_hash = to_signed(phash(path)), to_signed(dhash(path))
+    row = ImageHash(attachment_id=attachment.id, issue_id=attachment.issue_id, phash=p_hash, dhash=d_hash)
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+class ImageHashIndex:
+    def __init__(self):
+        self.codes = np.zeros(0, np.uint64)
+        self.dhashes = np.zeros(0, np.uint64)
+        self.attachment_ids = np.zeros(0, np.int64)
+        self.rows = ChangeCursor(query=lambda: db.session.query(
+            ImageHash.id, ImageHash.attachment_id, ImageHash.phash, ImageHash.dhash, ImageHash.created_at
+        ), column=ImageHash.id)
+        self.indexed = 0  # Rows [0, indexed) are in the bucket tables
+        self.tables = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._rebuilding = False
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, rows):
+        if not rows:
+            return
+        codes = np.array([row.phash for row in rows], np.int64).view(np.uint64)
+        dhashes = np.array([row.dhash for row in rows], np.int64).view(np.uint64)
+        attachment_ids = np.array([row.attachment_id for row in rows], np.int64)
+        with self._lock:
+            self.codes = np.concatenate([self.codes, codes])
+            self.dhashes = np.concatenate([self.dhashes, dhashes])
+            self.attachment_ids = np.concatenate([self.attachment_ids, attachment_ids])
+
+    def build_tables(self):
+        """Bucket every row by each 16-bit chunk (counting sort)"""
+        with self._lock:
+            codes = self.codes
+        tables = []
+        for chunk in range(CHUNKS):
+            keys = ((codes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.int64)
+            order = np.argsort(keys, kind='stable')
+            offsets = np.zeros((1 << CHUNK_BITS) + 1, np.int64)
+            np.cumsum(np.bincount(keys, minlength=1 << CHUNK_BITS), out=offsets[1:])
+            tables.append((offsets, order))
+        with self._lock:
+            self.tables, self.indexed = tables, len(codes)
+            self._rebuilding = False
+
+    def sync(self):
+        with self._sync_lock:  # Two threads reading the same rows would append them twice
+            while True:
+                rows = self.rows.read(LOAD_BATCH_SIZE)
+                self.append(rows)
+                self.rows.advance(rows)
+                if len(rows) < LOAD_BATCH_SIZE:
+                    break
+        with self._lock:
+            rebuild = len(self.codes) - self.indexed > REBUILD_THRESHOLD and not self._rebuilding
+            if rebuild:
+                self._rebuilding = True
+        if rebuild:
+            run_in_background(self.build_tables)
+
+    def search(self, code, max_distance):
+        """[(row, phash distance)] for every indexed hash within `max_distance` of `code`"""
+        with self._lock:
+            codes, tables, indexed = self.codes, self.tables, self.indexed
+        masks = PROBE_MASKS[max_distance // CHUNKS]
+        candidates = []
+        for chunk, (offsets, order) in enumerate(tables):
+            value = (np.uint64(code) >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(0xFFFF)
+            probes = (masks ^ value).astype(np.int64)
+            starts, ends = offsets[probes], offsets[probes + 1]
+            for start, end in zip(starts[ends > starts].tolist(), ends[ends > starts].tolist()):
+                candidates.append(order[start:end])
+        if len(codes) > indexed:
+            candidates.append(np.arange(indexed, len(codes)))
+        if not candidates:
+            return []
+        rows = np.unique(np.concatenate(candidates))
+        distances = hamming_distances(codes[rows], code)
+        keep = distances <= max_distance
+        return list(zip(rows[keep].tolist(), distances[keep].tolist()))
+
+
+def _load_index():
+    index = ImageHashIndex()
+    index.sync()
+    index.build_tables()
+    return index
+
+
+image_index = LazyIndex(_load_index)
+
+
+def find_similar_images(attachments, max_distance=None, limit=20):
+    """
+    Issues with a screenshot visually similar to any of `attachments`, best
+    match per issue, closest first. Returns None while the index is loading.
+    """
+    index = image_index.get()
+    if index is None:
+        return None
+    index.sync()
+    max_distance = min(MAX_DISTANCE, app.config['SIMILAR_IMAGE_MAX_DISTANCE'] if max_distance is None else max_distance)
+    own_ids = {attachment.id for attachment in attachments}
+    hashes = ImageHash.query.filter(ImageHash.attachment_id.in_(own_ids)).all() if own_ids else []
+
+    best = {}  # other attachment id -> (phash distance, dhash distance, our attachment id)
+    for own in hashes:
+        code = np.int64(own.phash).view(np.uint64)
+        d_code = np.int64(own.dhash).view(np.uint64)
+        for row, distance in index.search(code, max_distance):
+            other_id = int(index.attachment_ids[row])
+            if other_id in own_ids:
+                continue
+            d_distance = int(hamming_distances(index.dhashes[row:row + 1], d_code)[0])
+            if other_id not in best or (distance, d_distance) < best[other_id][:2]:
+                best[other_id] = (distance, d_distance, own.attachment_id)
+    if not best:
+        return []
+
+    # Resolve against the database; attachments deleted since hashing drop out here
+    rows = (db.session.query(Attachment.id, Attachment.filename, Issue.id, Issue.testcase_title, Issue.status)
+            .join(Issue, Issue.id == Attachment.issue_id)
+            .filter(Attachment.id.in_(list(best)))
+            .all())
+    own_issue_ids = {attachment.issue_id for attachment in attachments}
+    by_issue = {}
+    for attachment_id, filename, issue_id, title, status in rows:
+        if issue_id in own_issue_ids:
+            continue
+        distance, d_distance, matched_id = best[attachment_id]
+        current = by_issue.get(issue_id)
+        if current is None or (distance, d_distance) < (current['distance'], current['dhash_distance']):
+            by_issue[issue_id] = {
+                'issue_id': issue_id,
+                'testcase_title': title,
+                'status': status,
+                'attachment_id': attachment_id,
+                'filename': filename,
+                'matched_attachment_id': matched_id,
+                'distance': distance,
+                'dhash_distance': d_distance
+            }
+    return sorted(by_issue.values(), key=lambda match: (match['distance'], match['dhash_distance']))[:limit]
+
+
+def backfill_image_hashes(batch_size=500):
+    """Hash existing image attachments that have no hashes yet; returns the number stored"""
+    stored = 0
+    last_id = 0
+    while True:
+        batch = (Attachment.query
+                 .filter(Attachment.id > last_id)
+                 .order_by(Attachment.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        for attachment in batch:
+            last_id = attachment.id
+            if not is_image_attachment(attachment):
+                continue
+            try:
+                hash_attachment(attachment)
+                stored += 1
+            except OSError as e:
+                db.session.rollback()
+                print(f"Error hashing attachment {attachment.id}: {e}")
+        db.session.expunge_all()
+    return stored
@@ -0,0 +1,273 @@
+"""
+Server-side viewer for large text attachments.
+
+Line slices, tails and greps are answered straight from a memory-mapped copy
+of the log, so only the requested lines are ever decoded and sent. Locating
+line N uses a sparse line-offset index (the byte offset of every
+LINE_INDEX_STRIDE-th line), built lazily on first use with a chunked
+newline count and persisted as `<file>.lines` next to the log. Logs stored
+gzip-compressed are decompressed into a view cache under the upload folder
+for mapping; the cache is held to LOG_VIEWER_CACHE_BYTES by evicting the
+least recently viewed copies.
+
+Grep matches fixed strings only: a user-supplied regular expression could
+backtrack for minutes over a multi-gigabyte map.
+"""
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+import gzip
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from app import app
+from serving import absolute_path, stored_encoding
+from storage import attachment_store
+
+LINE_INDEX_STRIDE = 1024
+SCAN_BLOCK_SIZE = 4 * 1024 * 1024
+MAX_LINE_LENGTH = 4096
+
+app.config.setdefault('LOG_VIEWER_MAX_LINES', 5000)
+app.config.setdefault('LOG_VIEWER_MAX_MATCHES', 500)
+app.config.setdefault('LOG_VIEWER_MAX_PATTERN_LENGTH', 200)
+app.config.setdefault('LOG_VIEWER_CACHE_BYTES', 2 * 1024 ** 3)
+
+VIEW_CACHE_DIR = os.path.join(attachment_store.base, 'views')
+
+
+class LogViewerError(Exception):
+    pass
+
+
+class LineIndex:
+    """Byte offsets of lines 0, STRIDE, 2*STRIDE, ... plus the total line count"""
+
+    def __init__(self, checkpoints, total_lines):
+        self.checkpoints = checkpoints
+        self.total_lines = total_lines
+
+    @classmethod
+    def build(cls, mm):
+        checkpoints = array('Q', [0])
+        lines = 0
+        next_checkpoint = LINE_INDEX_STRIDE
+        size = len(mm)
+        for block_start in range(0, size, SCAN_BLOCK_SIZE):
+            block = mm[block_start:block_start + SCAN_BLOCK_SIZE]
+            count = block.count(b'\n')
+            # Only search for exact offsets in blocks that cross a checkpoint
+            pos = 0
+            seen = lines
+            while lines + count >= next_checkpoint:
+                for _ in range(next_checkpoint - seen):
+                    pos = block.index(b'\n', pos) + 1
+                seen = next_checkpoint
+                checkpoints.append(block_start + pos)
+                next_checkpoint += LINE_INDEX_STRIDE
+            lines += count
+        # A final line without a trailing newline still counts
+        if size and mm[size - 1:size] != b'\n':
+            lines += 1
+        return cls(checkpoints, lines)
+
+    def save(self, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as out:
+            array('Q', [self.total_lines]).tofile(out)
+            self.checkpoints.tofile(out)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        values = array('Q')
+        with open(path, 'rb') as source:
+            values.frombytes(source.read())
+        return cls(values[1:], values[0])
+
+    def offset_of(self, mm, line_number):
+        """Byte offset where 1-based `line_number` starts"""
+        line = line_number - 1
+        checkpoint = line // LINE_INDEX_STRIDE
+        pos = self.checkpoints[checkpoint]
+        for _ in range(line - checkpoint * LINE_INDEX_STRIDE):
+            pos = mm.find(b'\n', pos) + 1
+        return pos
+
+    def line_number_at(self, mm, offset):
+        """1-based number of the line containing byte `offset`"""
+        checkpoint = bisect_right(self.checkpoints, offset) - 1
+        start = self.checkpoints[checkpoint]
+        return checkpoint * LINE_INDEX_STRIDE + mm[start:offset].count(b'\n') + 1
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+INDEX_CACHE_SIZE = 64
+
+
+def _get_index(path, mm):
+    key = (path, os.path.getmtime(path))
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index_path = path + '.lines'
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= key[1]:
+        index = LineIndex.load(index_path)
+    else:
+        index = LineIndex.build(mm)
+        try:
+            index.save(index_path)
+        except OSError as e:
+            print(f"Could not persist line index for {path}: {e}")
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def viewable_path(attachment):
+    """Path of an uncompressed copy of the attachment that can be memory-mapped"""
+    path = absolute_path(attachment.file_path)
+    if stored_encoding(attachment, path) != 'gzip':
+        return path
+    view_path = os.path.join(VIEW_CACHE_DIR, os.path.basename(path))
+    try:
+        os.utime(view_path)  # Most recently viewed copies are evicted last
+    except FileNotFoundError:
+        os.makedirs(VIEW_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=VIEW_CACHE_DIR, suffix='.tmp')
+        try:
+            with gzip.open(path + '.gz', 'rb') as source, os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(source, out, 1024 * 1024)
+            os.replace(tmp_path, view_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        for leftover in (path + '.view', path + '.view.lines'):  # Copies kept beside the blob by older versions
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+        evict_views(keep=view_path)
+    return view_path
+
+
+def evict_views(keep=None):
+    """Delete the least recently viewed decompressed copies until the cache fits its budget"""
+    views = []
+    for entry in os.scandir(VIEW_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith(('.lines', '.tmp')) and entry.path != keep:
+            stat = entry.stat()
+            views.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in views) + (os.path.getsize(keep) if keep else 0)
+    for _, size, view_path in sorted(views):
+        if total <= app.config['LOG_VIEWER_CACHE_BYTES']:
+            break
+        try:
+            os.unlink(view_path)
+        except OSError:
+            continue  # Already evicted, or still mapped on a platform that refuses
+        total -= size
+        try:
+            os.unlink(view_path + '.lines')
+        except FileNotFoundError:
+            pass
+
+
+class LogView:
+    def __init__(self, attachment):
+        self.path = viewable_path(attachment)
+        try:
+            self._file = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.path = viewable_path(attachment)  # Evicted in between
+            self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.index = _get_index(self.path, self.mm) if size else LineIndex(array('Q', [0]), 0)
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _line_end(self, start):
+        end = self.mm.find(b'\n', start)
+        return len(self.mm) if end == -1 else end
+
+    def _line(self, number, start, end):
+        raw = self.mm[start:min(end, start + MAX_LINE_LENGTH)]
+        line = {'number': number, 'text': raw.decode('utf-8', errors='replace').rstrip('\r')}
+        if end - start > MAX_LINE_LENGTH:
+            line['truncated'] = True
+        return line
+
+    def lines(self, first, last):
+        """Lines first..last (1-based, inclusive)"""
+        total = self.index.total_lines
+        first = max(1, first)
+        last = min(total, last, first + app.config['LOG_VIEWER_MAX_LINES'] - 1)
+        result = []
+        if first > last:
+            return result
+        pos = self.index.offset_of(self.mm, first)
+        for number in range(first, last + 1):
+            end = self._line_end(pos)
+            result.append(self._line(number, pos, end))
+            pos = end + 1
+        return result
+
+    def tail(self, count):
+        """The last `count` lines, found by scanning backwards from the end"""
+        count = max(0, min(count, app.config['LOG_VIEWER_MAX_LINES']))
+        total = self.index.total_lines
+        end = len(self.mm)
+        if end and self.mm[end - 1:end] == b'\n':
+            end -= 1
+        result = []
+        number = total
+        while len(result) < count and number > 0:
+            start = self.mm.rfind(b'\n', 0, end) + 1
+            result.append(self._line(number, start, end))
+            end = start - 1
+            number -= 1
+        result.reverse()
+        return result
+
+    def grep(self, pattern, ignore_case=False, max_matches=100):
+        """Lines containing the string `pattern` (first match per line), with their line numbers"""
+        if not pattern:
+            raise LogViewerError('Pattern is required')
+        if len(pattern) > app.config['LOG_VIEWER_MAX_PATTERN_LENGTH']:
+            raise LogViewerError('Pattern is too long')
+        regex = re.compile(re.escape(pattern.encode('utf-8')), re.IGNORECASE if ignore_case else 0)
+        max_matches = max(1, min(max_matches, app.config['LOG_VIEWER_MAX_MATCHES']))
+
+        matches = []
+        pos = 0
+        size = len(self.mm)
+        while pos <= size and len(matches) < max_matches:
+            match = regex.search(self.mm, pos)
+            if not match:
+                break
+            start = self.mm.rfind(b'\n', 0, match.start()) + 1
+            end = self._line_end(match.end() if match.end() > match.start() else match.start())
+            line = self._line(self.index.line_number_at(self.mm, start), start, end)
+            line['match_start'] = len(self.mm[start:match.start()].decode('utf-8', errors='replace'))
+            line['match_end'] = line['match_start'] + len(match.group(0).decode('utf-8', errors='replace'))
+            matches.append(line)
+            pos = end + 1
+        return matches, len(matches) >= max_matches
@@ -3,7 +3,7 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 import random
 import string
-import re
+from path_parser import parse_path
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -48,6 +48,7 @@ class Issue(db.Model):
     # Extracted path parameters
     release = db.Column(db.String(10))  # e.g., '251', '261', '231'
     platform = db.Column(db.String(20))  # e.g., 'lnx86', 'lr', 'rhel7.6', etc.
+    bucket = db.Column(db.String(100), index=True)  # First directory after etautotest/, upper-cased
     
     # User input fields
     build = db.Column(db.String(20))  # Weekly, Daily, Daily Plus
@@ -78,18 +79,8 @@ class Issue(db.Model):
         Parse testcase path to extract release and platform information.
         Expected format: /lan/fed/etpv5/release/<Release>/<Platform>/etautotest/<<path_to_testcase>
         """
-        if not path:
-            return None, None
-            
-        # Regular expression to match the path pattern
-        pattern = r'/lan/fed/etpv5/release/(\d+)/([^/]+)/etautotest/'
-        match = re.match(pattern, path)
-        
-        if match:
-            release = match.group(1)
-            platform = match.group(2)
-            return release, platform
-        return None, None
+        parsed = parse_path(path)
+        return parsed.release, parsed.platform
     
     @staticmethod
     def extract_bucket_name(path):
@@ -98,18 +89,7 @@ class Issue(db.Model):
         Expected format: /lan/fed/etpv5/release/<Release>/<Platform>/etautotest/<bucket_name>/...
         Returns the bucket name (first directory after etautotest/) in uppercase for proper mapping
         """
-        if not path:
-            return None
-            
-        # Regular expression to match the path pattern and extract bucket name
-        pattern = r'/lan/fed/etpv5/release/\d+/[^/]+/etautotest/([^/]+)'
-        match = re.match(pattern, path)
-        
-        if match:
-            bucket_name = match.group(1)
-            # Normalize to uppercase for proper mapping to reviewers
-            return bucket_name.upper()
-        return None
+        return parse_path(path).bucket
     
     @staticmethod
     def get_reviewer_for_bucket(bucket_name):
@@ -259,6 +239,7 @@ class Issue(db.Model):
             'release': self.release,
             'platform': self.platform,
             'platform_display': self.get_platform_display_name(self.platform) if self.platform else None,
+            'bucket': self.bucket,
             'build': self.build,
             'target': self.target,
             'description': self.description,
@@ -337,11 +318,19 @@ class Attachment(db.Model):
     comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'))
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
-    file_size = db.Column(db.Integer)
+    file_size = db.Column(db.BigInteger)
     mime_type = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the blob in the attachment store
+    content_encoding = db.Column(db.String(20))  # 'gzip' when stored compressed; file_size stays the original size
+    stored_size = db.Column(db.BigInteger)  # Bytes on disk
     uploaded_by = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
-    
+
+    @staticmethod
+    def count_references(content_hash):
+        """Number of attachments sharing a stored blob (its reference count)"""
+        return Attachment.query.filter_by(content_hash=content_hash).count()
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -350,10 +339,93 @@ class Attachment(db.Model):
             'filename': self.filename,
             'file_size': self.file_size,
             'mime_type': self.mime_type,
+            'content_hash': self.content_hash,
+            'content_encoding': self.content_encoding,
+            'stored_size': self.stored_size,
             'uploaded_by': self.uploaded_by,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, handed to the client
+    issue_id = db.Column(db.Integer, db.ForeignKey('issues.id', ondelete='CASCADE'), nullable=False)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE'))
+    filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(100))
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    chunks_received = db.Column(db.Integer, default=0)  # Chunks 0..n-1 are on disk and verified
+    bytes_received = db.Column(db.BigInteger, default=0)
+    expected_hash = db.Column(db.String(64))  # Optional SHA-256 of the whole file
+    status = db.Column(db.Enum('uploading', 'complete'), default='uploading')
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachments.id', ondelete='SET NULL'))
+    created_by = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+    
+    def expected_chunk_length(self, index):
+        """Length of chunk `index`; every chunk is full-sized except the last"""
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+    
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'issue_id': self.issue_id,
+            'comment_id': self.comment_id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'chunks_received': self.chunks_received,
+            'bytes_received': self.bytes_received,
+            'next_chunk': self.chunks_received if self.status == 'uploading' else None,
+            'status': self.status,
+            'attachment_id': self.attachment_id,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class AttachmentSignature(db.Model):
+    __tablename__ = 'attachment_signatures'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachments.id', ondelete='CASCADE'), nullable=False, unique=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('issues.id', ondelete='CASCADE'), nullable=False, index=True)  # Denormalized for lookups
+    fingerprint = db.Column(db.String(40), nullable=False, index=True)  # SHA-1 of the normalized signature
+    first_error = db.Column(db.String(500), nullable=False)
+    signature = db.Column(db.Text, nullable=False)  # Normalized error line, stack frames and assertion text
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    attachment = db.relationship('Attachment', backref=db.backref('signature', uselist=False, cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        return {
+            'attachment_id': self.attachment_id,
+            'issue_id': self.issue_id,
+            'fingerprint': self.fingerprint,
+            'first_error': self.first_error,
+            'signature': self.signature
+        }
+
+class ImageHash(db.Model):
+    __tablename__ = 'image_hashes'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Append-only; indexes tail by id
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachments.id', ondelete='CASCADE'), nullable=False, unique=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('issues.id', ondelete='CASCADE'), nullable=False, index=True)  # Denormalized for lookups
+    phash = db.Column(db.BigInteger, nullable=False)  # 64-bit DCT hash, stored signed
+    dhash = db.Column(db.BigInteger, nullable=False)  # 64-bit gradient hash, stored signed
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    attachment = db.relationship('Attachment', backref=db.backref('image_hash', uselist=False, cascade='all, delete-orphan'))
+
 class TestcasePath(db.Model):
     __tablename__ = 'testcase_paths'
     
@@ -362,6 +434,7 @@ class TestcasePath(db.Model):
     testcase_path = db.Column(db.String(200), nullable=False)
     release = db.Column(db.String(10))  # Extracted from path
     platform = db.Column(db.String(20))  # Extracted from path
+    bucket = db.Column(db.String(100), index=True)  # Extracted from path
     added_by = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     
@@ -376,6 +449,7 @@ class TestcasePath(db.Model):
             'release': self.release,
             'platform': self.platform,
             'platform_display': Issue.get_platform_display_name(self.platform) if self.platform else None,
+            'bucket': self.bucket,
             'added_by': self.added_by,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -396,4 +470,69 @@ class BucketReviewer(db.Model):
             'reviewer_name': self.reviewer_name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+class ChangeLog(db.Model):
+    """Append-only record of issue, comment and testcase path writes, consumed by the in-memory indexes"""
+    __tablename__ = 'change_log'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Consumers remember the last id they applied
+    entity = db.Column(db.String(20), nullable=False)  # 'issue', 'comment' or 'testcase_path'
+    entity_id = db.Column(db.Integer, nullable=False)
+    issue_id = db.Column(db.Integer)  # The issue affected (the comment's issue for comments)
+    action = db.Column(db.Enum('insert', 'update', 'delete'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+class PathNode(db.Model):
+    """Materialized directory tree of testcase paths, kept current by path_tree"""
+    __tablename__ = 'path_nodes'
+    __table_args__ = (db.Index('idx_parent_name', 'parent', 'name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    prefix = db.Column(db.String(200), unique=True, nullable=False)  # e.g. '/lan/fed/etpv5/release/251'
+    parent = db.Column(db.String(200), nullable=False)  # Prefix of the parent node ('' for top level)
+    name = db.Column(db.String(200), nullable=False)  # Last path segment
+    path_count = db.Column(db.Integer, nullable=False, default=0)  # Testcase paths at or below this node
+    leaf_count = db.Column(db.Integer, nullable=False, default=0)  # Testcase paths ending exactly here
+    issue_count = db.Column(db.Integer, nullable=False, default=0)  # Distinct issues with a path at or below this node
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.prefix,
+            'count': self.issue_count,
+            'is_testcase': self.leaf_count > 0,
+            'has_children': self.path_count > self.leaf_count
+        }
+
+class SavedSearch(db.Model):
+    """A user's saved query, with its matches materialized in saved_search_results by saved_searches"""
+    __tablename__ = 'saved_searches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    query_text = db.Column(db.Text, nullable=False)  # In the search query language, normalized
+    change_id = db.Column(db.Integer, nullable=False, default=0)  # Every change log entry up to this one is applied
+    viewed_change_id = db.Column(db.Integer, nullable=False, default=0)  # change_id when the owner last viewed it
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    viewed_at = db.Column(db.DateTime)
+    
+    results = db.relationship('SavedSearchResult', backref='saved_search', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'query': self.query_text,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'viewed_at': self.viewed_at.isoformat() if self.viewed_at else None
+        }
+
+class SavedSearchResult(db.Model):
+    __tablename__ = 'saved_search_results'
+    __table_args__ = (db.Index('idx_search_added', 'saved_search_id', 'added_change_id'),)
+    
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_searches.id', ondelete='CASCADE'), primary_key=True)
+    issue_id = db.Column(db.Integer, db.ForeignKey('issues.id', ondelete='CASCADE'), primary_key=True, index=True)
+    added_change_id = db.Column(db.Integer, nullable=False)  # Change that brought the issue into the results
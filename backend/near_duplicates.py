@@ -0,0 +1,318 @@
+"""
+Near-duplicate detection for new issues (MinHash sketches + LSH).
+
+Each issue is reduced to a set of features (word bigrams of its title and
+description, plus the testcase path below etautotest/, so the release and
+platform do not matter) and sketched with NUM_PERM MinHash permutations,
+keeping the low 16 bits of each minimum (b-bit MinHash). Every BAND_ROWS
+consecutive values form one 64-bit LSH band key, so the sketch matrix doubles
+as the band table: each band keeps a sorted key array searched with
+np.searchsorted, and rows added since the last merge are compared directly.
+Candidates are verified by their estimated Jaccard similarity.
+
+The index lives in process memory. It is loaded from a snapshot written by
+rebuild_index() (python rebuild_indexes.py, parallel across
+processes) or built from the database on first use, then kept current from
+the change log (see changefeed.py).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from app import app, db
+from background import run_in_background
+from changefeed import ChangeCursor, LazyIndex, changed_issues, index_path, is_pruned_past, stable_change_id
+from models import Issue
+
+app.config.setdefault('DUPLICATE_SIMILARITY_THRESHOLD', 0.6)
+app.config.setdefault('DUPLICATE_MAX_RESULTS', 5)
+# Time allowed for catching up on the change log during a lookup
+app.config.setdefault('DUPLICATE_CHECK_BUDGET_MS', 5)
+
+NUM_PERM = 64
+BAND_ROWS = 4
+BANDS = NUM_PERM // BAND_ROWS
+SEED = 20240601
+# Largest prime below 2**32: with 32-bit feature hashes and A, B < PRIME,
+# A * hash + B stays below 2**64, so the uint64 arithmetic never wraps
+PRIME = np.uint64(4294967291)
+MERGE_THRESHOLD = 8192
+SYNC_BATCH_SIZE = 1000
+SNAPSHOT_NAME = 'minhash.npz'
+
+_rng = np.random.RandomState(SEED)
+PERM_A = _rng.randint(1, int(PRIME), NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.randint(0, int(PRIME), NUM_PERM, dtype=np.uint64)
+SNAPSHOT_PARAMS = [NUM_PERM, BAND_ROWS, SEED, int(PRIME)]
+
+WORD_RE = re.compile(r'[a-z0-9_]+')
+MAX_WORDS = 2000
+
+
+def issue_features(title, description, path):
+    words = WORD_RE.findall(f'{title or ""} {description or ""}'.lower())[:MAX_WORDS]
+    # Build numbers, counts and ids vary between otherwise identical reports
+    words = ['#' if word.isdigit() else word for word in words]
+    features = {f'{a} {b}' for a, b in zip(words, words[1:])}
+    if len(words) == 1:
+        features.add(words[0])
+    segments = [segment for segment in (path or '').lower().split('/') if segment]
+    if 'etautotest' in segments:
+        segments = segments[segments.index('etautotest') + 1:]
+    features.update(f'path:{segment}' for segment in segments)
+    return features
+
+
+def sketch(features):
+    """b-bit MinHash signature (NUM_PERM uint16 values) of a feature set, or None if empty"""
+    if not features:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=4).digest(), 'little')
+         for feature in features),
+        dtype=np.uint64, count=len(features)
+    )
+    permuted = (hashes[:, None] * PERM_A + PERM_B) % PRIME
+    return (permuted.min(axis=0) & np.uint64(0xFFFF)).astype(np.uint16)
+
+
+def issue_sketch(title, description, path):
+    return sketch(issue_features(title, description, path))
+
+
+class MinHashIndex:
+    def __init__(self, ids=None, sigs=None, change_id=0):
+        ids = np.zeros(0, np.int64) if ids is None else np.asarray(ids, np.int64)
+        sigs = np.zeros((0, NUM_PERM), np.uint16) if sigs is None else np.ascontiguousarray(sigs, np.uint16)
+        self.ids = ids.copy()
+        self.sigs = sigs.copy()
+        self.alive = np.ones(len(ids), bool)
+        self.count = len(ids)
+        self.row_of = {issue_id: row for row, issue_id in enumerate(ids.tolist())}
+        self.changes = ChangeCursor(change_id)
+        self.sorted_keys = [np.zeros(0, np.uint64)] * BANDS
+        self.sorted_rows = [np.zeros(0, np.int64)] * BANDS
+        self.merged = 0
+        self._merging = False
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.merge()
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def add(self, issue_id, sig):
+        with self._lock:
+            self._remove(issue_id)
+            if self.count == len(self.ids):
+                capacity = max(1024, 2 * len(self.ids))
+                self.ids = np.resize(self.ids, capacity)
+                self.alive = np.resize(self.alive, capacity)
+                sigs = np.zeros((capacity, NUM_PERM), np.uint16)
+                sigs[:self.count] = self.sigs[:self.count]
+                self.sigs = sigs
+            row = self.count
+            self.sigs[row] = sig
+            self.ids[row] = issue_id
+            self.alive[row] = True
+            self.row_of[issue_id] = row
+            self.count += 1
+
+    def remove(self, issue_id):
+        with self._lock:
+            self._remove(issue_id)
+
+    def _remove(self, issue_id):
+        row = self.row_of.pop(issue_id, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def merge(self):
+        """Re-sort the band tables to cover every live row (dead rows are dropped)"""
+        with self._lock:
+            count, sigs, alive = self.count, self.sigs, self.alive[:self.count].copy()
+        rows = np.nonzero(alive)[0]
+        keys = sigs[rows].view(np.uint64)
+        sorted_keys, sorted_rows = [], []
+        for band in range(BANDS):
+            order = np.argsort(keys[:, band], kind='stable')
+            sorted_keys.append(keys[order, band])
+            sorted_rows.append(rows[order])
+        with self._lock:
+            self.sorted_keys, self.sorted_rows, self.merged = sorted_keys, sorted_rows, count
+            self._merging = False
+
+    def query(self, sig, threshold, limit, exclude_id=None):
+        """[(issue_id, estimated similarity)] for indexed issues at or above `threshold`"""
+        keys = sig.view(np.uint64)
+        with self._lock:
+            sorted_keys, sorted_rows, merged = self.sorted_keys, self.sorted_rows, self.merged
+            count, sigs, alive, ids = self.count, self.sigs, self.alive, self.ids
+        candidates = []
+        for band in range(BANDS):
+            lo = np.searchsorted(sorted_keys[band], keys[band], 'left')
+            hi = np.searchsorted(sorted_keys[band], keys[band], 'right')
+            if hi > lo:
+                candidates.append(sorted_rows[band][lo:hi])
+        if count > merged:
+            recent = sigs[merged:count].view(np.uint64)
+            candidates.append(np.nonzero((recent == keys).any(axis=1))[0] + merged)
+        if not candidates:
+            return []
+        rows = np.unique(np.concatenate(candidates))
+        rows = rows[alive[rows]]
+        if exclude_id is not None:
+            rows = rows[ids[rows] != exclude_id]
+        similarity = (sigs[rows] == sig).mean(axis=1)
+        keep = similarity >= threshold
+        rows, similarity = rows[keep], similarity[keep]
+        best = np.argsort(-similarity, kind='stable')[:limit]
+        return [(int(ids[rows[i]]), float(similarity[i])) for i in best]
+
+    def sync(self, deadline=None):
+        """Apply change-log entries written since the last sync (by any process)"""
+        if not self._sync_lock.acquire(blocking=False):
+            return  # Another thread is already catching up
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                changes = self.changes.read(SYNC_BATCH_SIZE)
+                if not changes:
+                    break
+                refreshed, deleted = changed_issues(changes)
+                for issue_id in deleted:
+                    self.remove(issue_id)
+                if refreshed:
+                    rows = (db.session.query(Issue.id, Issue.testcase_title, Issue.description, Issue.testcase_path)
+                            .filter(Issue.id.in_(refreshed))
+                            .all())
+                    for row in rows:
+                        sig = issue_sketch(row.testcase_title, row.description, row.testcase_path)
+                        if sig is None:
+                            self.remove(row.id)
+                        else:
+                            self.add(row.id, sig)
+                    for issue_id in refreshed - {row.id for row in rows}:
+                        self.remove(issue_id)
+                self.changes.advance(changes)
+        finally:
+            self._sync_lock.release()
+        with self._lock:
+            start_merge = self.count - self.merged > MERGE_THRESHOLD and not self._merging
+            if start_merge:
+                self._merging = True
+        if start_merge:
+            run_in_background(self.merge)
+
+
+def sketch_range(id_range):
+    """Sketch issues with ids in [start, stop); returns (ids, sigs). Runs in rebuild workers."""
+    start, stop = id_range
+    with app.app_context():
+        rows = (db.session.query(Issue.id, Issue.testcase_title, Issue.description, Issue.testcase_path)
+                .filter(Issue.id >= start, Issue.id < stop)
+                .order_by(Issue.id)
+                .all())
+        db.session.remove()
+    ids, sigs = [], []
+    for row in rows:
+        sig = issue_sketch(row.testcase_title, row.description, row.testcase_path)
+        if sig is not None:
+            ids.append(row.id)
+            sigs.append(sig)
+    if not sigs:
+        return np.zeros(0, np.int64), np.zeros((0, NUM_PERM), np.uint16)
+    return np.array(ids, np.int64), np.vstack(sigs)
+
+
+def _init_rebuild_worker():
+    # Forked workers must not reuse the parent's pooled connections
+    db.engine.dispose(close=False)
+
+
+def save_snapshot(ids, sigs, change_id):
+    path = index_path(SNAPSHOT_NAME)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, ids=ids, sigs=sigs, change_id=np.int64(change_id),
+             params=np.array(SNAPSHOT_PARAMS, np.int64))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot():
+    """(ids, sigs, change_id) from the snapshot file, or None if missing or stale"""
+    path = index_path(SNAPSHOT_NAME)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if data['params'].tolist() != SNAPSHOT_PARAMS:
+            return None
+        return data['ids'], data['sigs'], int(data['change_id'])
+
+
+def rebuild_index(workers=None, batch_size=20000):
+    """
+    Sketch every issue, split into id ranges across `workers` processes
+    (in-process when workers == 1), and write a snapshot. Returns the number
+    of issues indexed.
+    """
+    # Take the watermark first: changes made while sketching are replayed on load
+    change_id = stable_change_id()
+    low, high = db.session.query(db.func.min(Issue.id), db.func.max(Issue.id)).one()
+    ranges = [] if low is None else [(start, start + batch_size) for start in range(low, high + 1, batch_size)]
+    if workers == 1 or len(ranges) <= 1:
+        results = [sketch_range(id_range) for id_range in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_rebuild_worker) as pool:
+            results = list(pool.map(sketch_range, ranges))
+    ids = np.concatenate([r[0] for r in results]) if results else np.zeros(0, np.int64)
+    sigs = np.vstack([r[1] for r in results]) if results else np.zeros((0, NUM_PERM), np.uint16)
+    save_snapshot(ids, sigs, change_id)
+    return len(ids)
+
+
+def _load_index():
+    snapshot = load_snapshot()
+    if snapshot is None or is_pruned_past(snapshot[2]):
+        rebuild_index(workers=1)
+        snapshot = load_snapshot()
+    index = MinHashIndex(*snapshot)
+    index.sync()
+    return index
+
+
+duplicate_index = LazyIndex(_load_index)
+
+
+def find_possible_duplicates(title, description, path, exclude_id=None):
+    """
+    Existing issues that look like near-duplicates of the given report, most
+    similar first. Returns [] rather than waiting while the index loads.
+    """
+    index = duplicate_index.get()
+    if index is None:
+        return []
+    index.sync(deadline=time.perf_counter() + app.config['DUPLICATE_CHECK_BUDGET_MS'] / 1000)
+    sig = issue_sketch(title, description, path)
+    if sig is None:
+        return []
+    matches = index.query(sig, app.config['DUPLICATE_SIMILARITY_THRESHOLD'],
+                          app.config['DUPLICATE_MAX_RESULTS'], exclude_id=exclude_id)
+    if not matches:
+        return []
+    issues = {issue.id: issue for issue in Issue.query.filter(Issue.id.in_([m[0] for m in matches]))}
+    return [
+        {
+            'id': issue_id,
+            'testcase_title': issues[issue_id].testcase_title,
+            'testcase_path': issues[issue_id].testcase_path,
+            'target': issues[issue_id].target,
+            'status': issues[issue_id].status,
+            'similarity': round(similarity, 3)
+        }
+        for issue_id, similarity in matches if issue_id in issues
+    ]
@@ -0,0 +1,42 @@
+"""
+Testcase path parsing.
+
+Testcase paths look like
+/lan/fed/etpv5/release/<Release>/<Platform>/etautotest/<bucket>/<subpath>.
+One precompiled pattern pulls every component out in a single match.
+parse_path() caches recent paths, since the same few thousand are parsed
+over and over by requests; parse_paths() is for backfills and bulk
+ingestion, parsing each distinct path once without churning that cache.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+PATH_CACHE_SIZE = 16384
+
+ParsedPath = namedtuple('ParsedPath', ['release', 'platform', 'bucket', 'subpath'])
+UNPARSED = ParsedPath(None, None, None, None)
+
+_PATH_RE = re.compile(r'/lan/fed/etpv5/release/(\d+)/([^/]+)/etautotest/(?:([^/]+)(?:/(.*))?)?', re.DOTALL)
+
+
+def _parse(path):
+    match = _PATH_RE.match(path) if path else None
+    if not match:
+        return UNPARSED
+    release, platform, bucket, subpath = match.groups()
+    # Buckets are upper-cased to match the bucket_reviewers mapping
+    return ParsedPath(release, platform, bucket.upper() if bucket else None, subpath or None)
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def parse_path(path):
+    """Release, platform, bucket and subpath of a testcase path (None for parts that don't match)"""
+    return _parse(path)
+
+
+def parse_paths(paths):
+    """Parse many paths at once; returns a list of ParsedPath in the same order"""
+    parsed = {path: _parse(path) for path in set(paths)}
+    return [parsed[path] for path in paths]
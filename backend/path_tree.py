@@ -0,0 +1,266 @@
+"""
+Materialized directory tree of testcase paths.
+
+path_nodes holds one row per directory prefix of every issue's primary and
+additional testcase paths, with the number of distinct issues that have a
+path at or below it, so browsing the tree is an index range scan on
+(parent, name) instead of a scan over every path string. Flush listeners
+diff the paths each flush adds and removes (new and deleted issues and
+testcase_paths rows, and edited testcase_path values) and apply the net
+count changes in the same transaction, so the tree commits or rolls back
+with the paths themselves. Path counts decide when a node goes away; issue
+counts come from re-reading the stored paths of just the issues the flush
+touched, before and after it, since an issue with several paths under one
+node counts there once.
+Bulk query updates bypass the listener; run `python rebuild_indexes.py paths`
+after those.
+"""
+
+from collections import Counter, defaultdict
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Issue, PathNode, TestcasePath
+
+BATCH_SIZE = 5000
+
+nodes = PathNode.__table__
+
+
+def split_path(path):
+    """Directory segments of a path, ignoring empty ones ('/a//b/' -> ['a', 'b'])"""
+    return [segment for segment in (path or '').split('/') if segment]
+
+
+def normalize_prefix(prefix):
+    segments = split_path(prefix)
+    return '/' + '/'.join(segments) if segments else ''
+
+
+def _prefixes(path):
+    """Every directory prefix of a path ('/a/b' -> {'/a', '/a/b'})"""
+    prefixes, prefix = set(), ''
+    for segment in split_path(path):
+        prefix = f'{prefix}/{segment}'
+        prefixes.add(prefix)
+    return prefixes
+
+
+def _count_path(deltas, leaves, path, sign):
+    segments = split_path(path)
+    prefix = ''
+    for segment in segments:
+        prefix = f'{prefix}/{segment}'
+        deltas[prefix] += sign
+    if segments:
+        leaves[prefix] += sign
+
+
+def _loaded_path(session, obj, column='testcase_path'):
+    """A column as stored (the path by default), for an object whose edit replaced an unloaded value"""
+    table = type(obj).__table__
+    return session.connection().execute(
+        db.select(table.c[column]).where(table.c.id == obj.id)
+    ).scalar()
+
+
+def _path_changes(session):
+    """Net (path_count, leaf_count) changes per prefix for the flush about to run"""
+    deltas, leaves = Counter(), Counter()
+    for obj in session.new:
+        if isinstance(obj, (Issue, TestcasePath)):
+            _count_path(deltas, leaves, obj.testcase_path, 1)
+    for obj in session.deleted:
+        if isinstance(obj, (Issue, TestcasePath)):
+            # The stored value, not any unflushed edit made before the delete
+            history = inspect(obj).attrs.testcase_path.history
+            path = history.deleted[0] if history.deleted else None
+            if path is None:
+                path = _loaded_path(session, obj) if history.added else obj.testcase_path
+            _count_path(deltas, leaves, path, -1)
+    for obj in session.dirty:
+        if isinstance(obj, (Issue, TestcasePath)) and obj not in session.deleted:
+            history = inspect(obj).attrs.testcase_path.history
+            if history.added:
+                old = history.deleted[0] if history.deleted else _loaded_path(session, obj)
+                if old != history.added[0]:
+                    _count_path(deltas, leaves, old, -1)
+                    _count_path(deltas, leaves, history.added[0], 1)
+    return deltas, leaves
+
+
+def _touched_issues(session):
+    """(ids of stored issues whose paths the flush about to run changes, issues it inserts)"""
+    issue_ids, new_issues = set(), []
+    for obj in chain(session.new, session.deleted, session.dirty):
+        if not isinstance(obj, (Issue, TestcasePath)):
+            continue
+        state = inspect(obj)
+        if obj in session.new:
+            if isinstance(obj, Issue):
+                new_issues.append(obj)
+                continue
+        elif obj not in session.deleted:
+            moved = isinstance(obj, TestcasePath) and (
+                state.attrs.issue_id.history.has_changes() or state.attrs.issue.history.has_changes())
+            if not state.attrs.testcase_path.history.added and not moved:
+                continue
+        if isinstance(obj, Issue):
+            issue_ids.add(obj.id)
+            continue
+        # A path may be attached by issue_id or through the relationship, and moved between issues
+        if obj not in session.new:
+            issue_ids.add(_loaded_path(session, obj, 'issue_id'))
+        issue_ids.update(state.attrs.issue_id.history.added or ())
+        issue_ids.update(issue.id for issue in state.attrs.issue.history.added or () if issue is not None)
+    issue_ids.discard(None)
+    return issue_ids, new_issues
+
+
+def _issue_prefixes(connection, issue_ids):
+    """{issue id: prefixes of its stored primary and additional paths}"""
+    prefixes = defaultdict(set)
+    issue_ids = list(issue_ids)
+    issues, paths = Issue.__table__, TestcasePath.__table__
+    for start in range(0, len(issue_ids), BATCH_SIZE):
+        batch = issue_ids[start:start + BATCH_SIZE]
+        for column, path in ((issues.c.id, issues.c.testcase_path), (paths.c.issue_id, paths.c.testcase_path)):
+            for issue_id, testcase_path in connection.execute(db.select(column, path).where(column.in_(batch))):
+                prefixes[issue_id].update(_prefixes(testcase_path))
+    return prefixes
+
+
+def apply_issue_counts(connection, before, after):
+    """Add each issue to the nodes it is now under and remove it from the ones it left"""
+    deltas = Counter()
+    for issue_id in set(before) | set(after):
+        old, new = before.get(issue_id, set()), after.get(issue_id, set())
+        deltas.update(dict.fromkeys(new - old, 1))
+        deltas.subtract(dict.fromkeys(old - new, 1))
+    changed = defaultdict(list)  # issue delta -> prefixes
+    for prefix, delta in deltas.items():
+        if delta:
+            changed[delta].append(prefix)
+    for delta, prefixes in changed.items():
+        connection.execute(
+            nodes.update()
+            .where(nodes.c.prefix.in_(prefixes))
+            .values(issue_count=nodes.c.issue_count + delta)
+        )
+
+
+def _upsert(connection, rows):
+    """Insert nodes, or add to their counts where the prefix exists"""
+    if connection.dialect.name == 'mysql':
+        stmt = mysql_insert(nodes).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            path_count=nodes.c.path_count + stmt.inserted.path_count,
+            leaf_count=nodes.c.leaf_count + stmt.inserted.leaf_count
+        )
+    else:
+        stmt = sqlite_insert(nodes).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=['prefix'], set_={
+            'path_count': nodes.c.path_count + stmt.excluded.path_count,
+            'leaf_count': nodes.c.leaf_count + stmt.excluded.leaf_count
+        })
+    connection.execute(stmt)
+
+
+def apply_changes(connection, deltas, leaves):
+    added = []
+    removed = defaultdict(list)  # (path delta, leaf delta) -> prefixes
+    for prefix in set(deltas) | set(leaves):
+        path_delta, leaf_delta = deltas[prefix], leaves[prefix]
+        if path_delta > 0:
+            parent, _, name = prefix.rpartition('/')
+            added.append({'prefix': prefix, 'parent': parent, 'name': name,
+                          'path_count': path_delta, 'leaf_count': leaf_delta, 'issue_count': 0})
+        elif path_delta < 0 or leaf_delta:
+            removed[path_delta, leaf_delta].append(prefix)
+    if added:
+        _upsert(connection, added)
+    for (path_delta, leaf_delta), prefixes in removed.items():
+        connection.execute(
+            nodes.update()
+            .where(nodes.c.prefix.in_(prefixes))
+            .values(path_count=nodes.c.path_count + path_delta, leaf_count=nodes.c.leaf_count + leaf_delta)
+        )
+    if removed:
+        emptied = [prefix for prefixes in removed.values() for prefix in prefixes]
+        connection.execute(nodes.delete().where(nodes.c.prefix.in_(emptied), nodes.c.path_count <= 0))
+
+
+@event.listens_for(Session, 'before_flush')
+def update_path_tree(session, flush_context, instances):
+    # Before the flush, deleted rows can still be read and pending edits diffed
+    deltas, leaves = _path_changes(session)
+    if deltas:
+        apply_changes(session.connection(), deltas, leaves)
+    issue_ids, new_issues = _touched_issues(session)
+    if issue_ids or new_issues:
+        before = _issue_prefixes(session.connection(), issue_ids)
+        session.info['path_tree_issues'] = (issue_ids, new_issues, before)
+    else:
+        session.info.pop('path_tree_issues', None)
+
+
+@event.listens_for(Session, 'after_flush')
+def update_issue_counts(session, flush_context):
+    # New nodes exist by now, and inserted issues and paths have their ids
+    touched = session.info.pop('path_tree_issues', None)
+    if touched:
+        issue_ids, new_issues, before = touched
+        issue_ids = issue_ids | {issue.id for issue in new_issues}
+        apply_issue_counts(session.connection(), before, _issue_prefixes(session.connection(), issue_ids))
+
+
+def children(prefix, limit=500):
+    """(node for `prefix` or None, child nodes ordered by name, truncated?)"""
+    prefix = normalize_prefix(prefix)
+    node = PathNode.query.filter_by(prefix=prefix).first() if prefix else None
+    rows = (PathNode.query
+            .filter(PathNode.parent == prefix)
+            .order_by(PathNode.name)
+            .limit(limit + 1)
+            .all())
+    return node, rows[:limit], len(rows) > limit
+
+
+def rebuild_tree(batch_size=BATCH_SIZE):
+    """Recount every node from the issues and testcase_paths tables; returns the number of paths"""
+    deltas, leaves, issue_counts = Counter(), Counter(), Counter()
+    total = 0
+    last_id = 0
+    while True:
+        issues = (db.session.query(Issue.id, Issue.testcase_path)
+                  .filter(Issue.id > last_id)
+                  .order_by(Issue.id)
+                  .limit(batch_size)
+                  .all())
+        if not issues:
+            break
+        last_id = issues[-1].id
+        paths = {row.id: [row.testcase_path] for row in issues}
+        for row in (db.session.query(TestcasePath.issue_id, TestcasePath.testcase_path)
+                    .filter(TestcasePath.issue_id.in_(paths))):
+            paths[row.issue_id].append(row.testcase_path)
+        for issue_paths in paths.values():
+            for path in issue_paths:
+                _count_path(deltas, leaves, path, 1)
+            issue_counts.update(set().union(*map(_prefixes, issue_paths)))
+            total += len(issue_paths)
+    db.session.execute(nodes.delete())
+    rows = []
+    for prefix, count in deltas.items():
+        parent, _, name = prefix.rpartition('/')
+        rows.append({'prefix': prefix, 'parent': parent, 'name': name, 'path_count': count,
+                     'leaf_count': leaves[prefix], 'issue_count': issue_counts[prefix]})
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(nodes.insert(), rows[start:start + batch_size])
+    db.session.commit()
+    return total
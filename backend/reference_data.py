@@ -0,0 +1,52 @@
+"""
+Reference data for the filter dropdowns, cached with a version stamp.
+
+The builds, releases, platforms, tags and build targets a page offers only
+change when issues do: releases and platforms are distinct values of issue
+columns, and tags are created and attached through issue writes. The lists
+are therefore computed once and reused until the change log moves on. They
+are then recomputed, but their version (a digest of the content) only
+changes when the content did, so a client holding the current version can be
+told to keep its copy instead of downloading the same lists again.
+"""
+
+import hashlib
+import json
+
+from app import db
+from changefeed import latest_change_id
+from models import Issue, Tag
+from singleflight import coalesced
+
+_cache = None  # (change id, version, reference data)
+
+
+def _load():
+    releases = sorted(
+        (release for (release,) in db.session.query(Issue.release).filter(Issue.release.isnot(None)).distinct()
+         if release),
+        reverse=True
+    )
+    platforms = sorted(platform for (platform,) in
+                       db.session.query(Issue.platform).filter(Issue.platform.isnot(None)).distinct())
+    return {
+        'builds': Issue.get_build_options(),
+        'releases': releases,
+        'platforms': [{'code': platform, 'display': Issue.get_platform_display_name(platform)}
+                      for platform in platforms],
+        'tags': [tag.to_dict() for tag in Tag.query.order_by(Tag.name)],
+        'targets': {release: Issue.get_target_options(release) for release in releases}
+    }
+
+
+def reference_data():
+    """(version, reference data) as of the latest change"""
+    global _cache
+    change_id = latest_change_id()
+    cached = _cache
+    if cached is None or cached[0] != change_id:
+        # Workers that see the same new change share one reload
+        reference = coalesced(('reference', change_id), _load)
+        version = hashlib.sha1(json.dumps(reference, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        cached = _cache = (change_id, version, reference)
+    return cached[1], cached[2]
@@ -0,0 +1,413 @@
+"""
+"Related issues" from TF-IDF cosine similarity.
+
+Every issue is a sparse TF-IDF vector over its title (weighted double), its
+description, its comments and its tags (bucket tags included, as `tag:<name>`
+terms), L2-normalized so a dot product is the cosine similarity. build_snapshot()
+vectorizes all issues with scipy.sparse and writes the matrix twice, by row
+(CSR) and by term (CSC), as plain .npy arrays in a snapshot directory under
+INDEX_FOLDER. Workers open them with mmap, so every process shares one copy in
+the page cache.
+
+A lookup takes the issue's strongest terms and sums their postings from the
+term-major arrays, touching only issues that share a term with it. Issues
+changed since the snapshot (read from the change log) are re-vectorized into
+a small in-memory overlay that shadows their snapshot rows; once the overlay
+grows past RELATED_REBUILD_THRESHOLD, a new snapshot is built in the
+background and every worker switches to it on its next sync.
+"""
+
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import fcntl
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from app import app, db
+from background import run_in_background
+from changefeed import ChangeCursor, LazyIndex, changed_issues, index_path, is_pruned_past, stable_change_id
+from models import Comment, Issue, IssueTag, Tag
+
+app.config.setdefault('RELATED_MAX_RESULTS', 10)
+app.config.setdefault('RELATED_MIN_SCORE', 0.1)
+app.config.setdefault('RELATED_REBUILD_THRESHOLD', 2000)
+
+TITLE_WEIGHT = 2
+QUERY_TERMS = 48
+COMMON_TERM_FRACTION = 0.05
+COMMON_TERM_MIN_POSTINGS = 1000
+MAX_TERM_LENGTH = 40
+TERM_DTYPE = f'<U{MAX_TERM_LENGTH}'
+SYNC_BATCH_SIZE = 1000
+BUILD_BATCH_SIZE = 2000
+CURRENT_POINTER = 'related.current'
+
+WORD_RE = re.compile(r'[a-z0-9_]+')
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have if in into is it its not of on or so that the then '
+    'there this to was were when which while will with after before can could does did should would'.split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens, without stopwords, one-letter words and bare numbers"""
+    return [
+        word[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall((text or '').lower())
+        if len(word) > 1 and not word.isdigit() and word not in STOPWORDS
+    ]
+
+
+def document_terms(title, description, comments, tags):
+    terms = Counter()
+    for word in tokenize(title):
+        terms[word] += TITLE_WEIGHT
+    terms.update(tokenize(description))
+    for content in comments:
+        terms.update(tokenize(content))
+    for tag in tags:
+        terms[f'tag:{tag.lower()}'[:MAX_TERM_LENGTH]] += TITLE_WEIGHT
+    return terms
+
+
+def _load_documents(issue_ids=None, batch_size=2000):
+    """Yield (issue_id, term counts) in id order, for all issues or just `issue_ids`"""
+    last_id = 0
+    while True:
+        query = db.session.query(Issue.id, Issue.testcase_title, Issue.description).filter(Issue.id > last_id)
+        if issue_ids is not None:
+            query = query.filter(Issue.id.in_(issue_ids))
+        issues = query.order_by(Issue.id).limit(batch_size).all()
+        if not issues:
+            return
+        ids = [issue.id for issue in issues]
+        comments = defaultdict(list)
+        for issue_id, content in db.session.query(Comment.issue_id, Comment.content).filter(Comment.issue_id.in_(ids)):
+            comments[issue_id].append(content)
+        tags = defaultdict(list)
+        for issue_id, name in (db.session.query(IssueTag.issue_id, Tag.name)
+                               .join(Tag, Tag.id == IssueTag.tag_id)
+                               .filter(IssueTag.issue_id.in_(ids))):
+            tags[issue_id].append(name)
+        for issue in issues:
+            yield issue.id, document_terms(issue.testcase_title, issue.description,
+                                           comments[issue.id], tags[issue.id])
+        last_id = ids[-1]
+
+
+@contextmanager
+def _build_lock(blocking=True):
+    """Held while a snapshot is built and published, so processes never build at the same time"""
+    with open(index_path('related.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_snapshot(batch_size=BUILD_BATCH_SIZE):
+    """Vectorize every issue and publish a new snapshot; returns the number of issues"""
+    with _build_lock():
+        return _build_snapshot(batch_size)
+
+
+def _build_snapshot(batch_size=BUILD_BATCH_SIZE):
+    change_id = stable_change_id()  # Changes made while building are replayed by readers
+    vocabulary = {}
+    ids = array('q')
+    indptr = array('q', [0])
+    indices = array('i')
+    counts = array('f')
+    for issue_id, terms in _load_documents(batch_size=batch_size):
+        ids.append(issue_id)
+        for term, count in terms.items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+        indptr.append(len(indices))
+
+    n_docs, n_terms = len(ids), len(vocabulary)
+    indices = np.frombuffer(indices, np.int32) if indices else np.zeros(0, np.int32)
+    counts = np.frombuffer(counts, np.float32) if counts else np.zeros(0, np.float32)
+    document_frequency = np.bincount(indices, minlength=n_terms)
+    idf = (np.log((1 + n_docs) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    # Renumber terms in sorted order so lookups can binary-search the term array
+    terms = np.array(sorted(vocabulary), dtype=TERM_DTYPE)
+    renumber = np.empty(n_terms, np.int32)
+    renumber[[vocabulary[term] for term in terms.tolist()]] = np.arange(n_terms, dtype=np.int32)
+
+    weights = (1 + np.log(counts)) * idf[indices]
+    rows = sparse.csr_matrix((weights, renumber[indices], np.frombuffer(indptr, np.int64)),
+                             shape=(n_docs, n_terms), dtype=np.float32)
+    rows.sort_indices()
+    norms = np.sqrt(np.asarray(rows.multiply(rows).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    rows = sparse.csr_matrix(sparse.diags(1 / norms) @ rows, dtype=np.float32)
+    columns = rows.tocsc()
+
+    # A fresh directory: an earlier snapshot may still be mapped by readers
+    folder = tempfile.mkdtemp(prefix=f'related-{change_id}-', dir=os.path.dirname(index_path(CURRENT_POINTER)))
+    arrays = {
+        'ids': np.frombuffer(ids, np.int64) if ids else np.zeros(0, np.int64),
+        'terms': terms,
+        'idf': idf,
+        'row_indptr': rows.indptr, 'row_indices': rows.indices, 'row_data': rows.data,
+        'col_indptr': columns.indptr, 'col_indices': columns.indices, 'col_data': columns.data,
+        'change_id': np.array([change_id], np.int64),
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(folder, f'{name}.npy'), values)
+
+    # Switch readers over atomically, then drop older snapshots (open maps stay
+    # valid). Builds are serialized by _build_lock, so no other directory is in progress.
+    pointer = index_path(CURRENT_POINTER)
+    with open(f'{pointer}.tmp', 'w') as out:
+        out.write(os.path.basename(folder))
+    os.replace(f'{pointer}.tmp', pointer)
+    for name in os.listdir(os.path.dirname(folder)):
+        if name.startswith('related-') and name != os.path.basename(folder):
+            shutil.rmtree(os.path.join(os.path.dirname(folder), name), ignore_errors=True)
+    return n_docs
+
+
+def rebuild_snapshot():
+    """build_snapshot() unless another process is already rebuilding"""
+    with _build_lock(blocking=False) as acquired:
+        return _build_snapshot() if acquired else None
+
+
+def current_snapshot():
+    """The published snapshot, or None if there is none yet"""
+    pointer = index_path(CURRENT_POINTER)
+    for _ in range(3):
+        try:
+            with open(pointer) as source:
+                return Snapshot(source.read().strip())
+        except FileNotFoundError:
+            if not os.path.exists(pointer):
+                return None
+            # Replaced and removed by a build between reading the pointer and the arrays
+    raise RuntimeError('Related issues snapshot keeps changing while being opened')
+
+
+class Snapshot:
+    """Read-only, memory-mapped TF-IDF matrix"""
+
+    def __init__(self, name):
+        self.name = name
+        folder = index_path(name)
+
+        def load(array_name):
+            return np.load(os.path.join(folder, f'{array_name}.npy'), mmap_mode='r')
+
+        self.ids = load('ids')
+        self.terms = load('terms')
+        self.idf = load('idf')
+        self.row_indptr, self.row_indices, self.row_data = load('row_indptr'), load('row_indices'), load('row_data')
+        self.col_indptr, self.col_indices, self.col_data = load('col_indptr'), load('col_indices'), load('col_data')
+        self.change_id = int(load('change_id')[0])
+
+    def row_of(self, issue_id):
+        row = int(np.searchsorted(self.ids, issue_id))
+        return row if row < len(self.ids) and self.ids[row] == issue_id else None
+
+    def term_ids(self, terms):
+        """Column ids of `terms` (-1 for terms not in the snapshot vocabulary)"""
+        terms = np.asarray(terms, dtype=TERM_DTYPE)
+        positions = np.searchsorted(self.terms, terms)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == terms[found]
+        return np.where(found, positions, -1)
+
+    def vectorize(self, terms):
+        """Normalized TF-IDF weights for a document's term counts, as {term: weight}"""
+        if not terms:
+            return {}
+        names = list(terms)
+        term_ids = self.term_ids(names)
+        max_idf = math.log(1 + len(self.ids)) + 1  # Terms new since the snapshot are rare
+        weights = {
+            name: (1 + math.log(terms[name])) * (float(self.idf[term_id]) if term_id >= 0 else max_idf)
+            for name, term_id in zip(names, term_ids.tolist())
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1
+        return {name: weight / norm for name, weight in weights.items()}
+
+    def row_vector(self, row):
+        start, end = self.row_indptr[row], self.row_indptr[row + 1]
+        return dict(zip(self.terms[self.row_indices[start:end]].tolist(), self.row_data[start:end].tolist()))
+
+
+class RelatedIndex:
+    def __init__(self, snapshot):
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._reset(snapshot)
+
+    def _reset(self, snapshot):
+        self.snapshot = snapshot
+        self.changes = ChangeCursor(snapshot.change_id)
+        self.overlay = {}  # issue_id -> {term: weight}, or None once deleted
+        self.postings = defaultdict(dict)  # term -> {issue_id: weight} for overlay vectors
+        self.shadowed_rows = set()  # Snapshot rows superseded by the overlay
+
+    def _set_overlay(self, issue_id, vector):
+        for term in (self.overlay.get(issue_id) or {}):
+            self.postings[term].pop(issue_id, None)
+        self.overlay[issue_id] = vector
+        for term, weight in (vector or {}).items():
+            self.postings[term][issue_id] = weight
+        row = self.snapshot.row_of(issue_id)
+        if row is not None:
+            self.shadowed_rows.add(row)
+
+    def sync(self):
+        """Switch to a newer snapshot if one was published, then apply the change log"""
+        with self._lock:
+            pointer = index_path(CURRENT_POINTER)
+            if os.path.exists(pointer):
+                with open(pointer) as source:
+                    name = source.read().strip()
+                if name != self.snapshot.name:
+                    snapshot = current_snapshot()
+                    if snapshot is not None and snapshot.change_id >= self.snapshot.change_id:
+                        self._reset(snapshot)
+            while True:
+                changes = self.changes.read(SYNC_BATCH_SIZE)
+                if not changes:
+                    break
+                refreshed, deleted = changed_issues(changes)
+                for issue_id in deleted:
+                    self._set_overlay(issue_id, None)
+                found = set()
+                for issue_id, terms in _load_documents(issue_ids=list(refreshed)):
+                    found.add(issue_id)
+                    self._set_overlay(issue_id, self.snapshot.vectorize(terms))
+                for issue_id in refreshed - found:
+                    self._set_overlay(issue_id, None)
+                self.changes.advance(changes)
+            rebuild = len(self.overlay) > app.config['RELATED_REBUILD_THRESHOLD'] and not self._rebuilding
+            if rebuild:
+                self._rebuilding = True
+        if rebuild:
+            run_in_background(self._rebuild)
+
+    def _rebuild(self):
+        try:
+            rebuild_snapshot()
+        finally:
+            self._rebuilding = False
+
+    def vector(self, issue_id):
+        if issue_id in self.overlay:
+            return self.overlay[issue_id]
+        row = self.snapshot.row_of(issue_id)
+        return self.snapshot.row_vector(row) if row is not None else None
+
+    def related(self, issue_id, limit, min_score):
+        """[(issue_id, cosine similarity)] of the issues most similar to `issue_id`"""
+        with self._lock:
+            return self._related(issue_id, limit, min_score)
+
+    def _related(self, issue_id, limit, min_score):
+        vector = self.vector(issue_id)
+        if not vector:
+            return []
+        snapshot = self.snapshot
+        strongest = sorted(vector.items(), key=lambda item: -item[1])[:QUERY_TERMS]
+        names = [term for term, _ in strongest]
+        query_weights = np.array([weight for _, weight in strongest], np.float32)
+
+        # Snapshot issues: sum the postings of each query term per row. Terms
+        # found in a large share of all issues say little and would dominate
+        # the cost, so they are skipped.
+        n_rows = len(snapshot.ids)
+        max_postings = max(COMMON_TERM_MIN_POSTINGS, int(n_rows * COMMON_TERM_FRACTION))
+        term_ids = snapshot.term_ids(names)
+        rows, contributions = [], []
+        for term_id, weight in zip(term_ids.tolist(), query_weights.tolist()):
+            if term_id < 0:
+                continue
+            start, end = snapshot.col_indptr[term_id], snapshot.col_indptr[term_id + 1]
+            if end - start > max_postings:
+                continue
+            rows.append(snapshot.col_indices[start:end])
+            contributions.append(snapshot.col_data[start:end] * weight)
+        scores = {}
+        if rows:
+            row_scores = np.bincount(np.concatenate(rows), weights=np.concatenate(contributions), minlength=n_rows)
+            if self.shadowed_rows:
+                row_scores[np.fromiter(self.shadowed_rows, np.int64)] = 0
+            candidates = np.flatnonzero(row_scores >= min_score)
+            if len(candidates) > limit + 1:
+                top = np.argpartition(-row_scores[candidates], limit)[:limit + 1]
+                candidates = candidates[top]
+            scores = dict(zip(snapshot.ids[candidates].tolist(), row_scores[candidates].tolist()))
+
+        # Overlay issues
+        overlay_scores = defaultdict(float)
+        for term, weight in strongest:
+            for other_id, other_weight in self.postings.get(term, {}).items():
+                overlay_scores[other_id] += weight * other_weight
+        for other_id, score in overlay_scores.items():
+            if score >= min_score:
+                scores[other_id] = score
+
+        scores.pop(issue_id, None)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return [(other_id, min(score, 1.0)) for other_id, score in best]
+
+
+def _load_index():
+    snapshot = current_snapshot()
+    if snapshot is None or is_pruned_past(snapshot.change_id):
+        with _build_lock():
+            snapshot = current_snapshot()  # Another worker may have built one while we waited
+            if snapshot is None or is_pruned_past(snapshot.change_id):
+                _build_snapshot()
+                snapshot = current_snapshot()
+    index = RelatedIndex(snapshot)
+    index.sync()
+    return index
+
+
+related_index = LazyIndex(_load_index)
+
+
+def related_issues(issue_id, limit=None):
+    """
+    Issues most similar to `issue_id`, best first, as dicts with a `score`.
+    Returns None while the index is still loading.
+    """
+    index = related_index.get()
+    if index is None:
+        return None
+    index.sync()
+    limit = limit or app.config['RELATED_MAX_RESULTS']
+    matches = index.related(issue_id, limit, app.config['RELATED_MIN_SCORE'])
+    if not matches:
+        return []
+    issues = {issue.id: issue for issue in Issue.query.filter(Issue.id.in_([m[0] for m in matches]))}
+    return [
+        {
+            'id': other_id,
+            'testcase_title': issues[other_id].testcase_title,
+            'status': issues[other_id].status,
+            'severity': issues[other_id].severity,
+            'score': round(score, 3)
+        }
+        for other_id, score in matches if other_id in issues
+    ]
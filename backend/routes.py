@@ -1,7 +1,36 @@
-from flask import request, jsonify, send_file, session
+from flask import request, jsonify, session
 from app import app, db
-from models import Issue, Comment, Tag, Attachment, User, TestcasePath, BucketReviewer
+from models import Issue, Comment, Tag, Attachment, User, TestcasePath, BucketReviewer, UploadSession, SavedSearch, SavedSearchResult
+from storage import attachment_store
+from serving import send_attachment, send_thumbnail, is_image_attachment
+from attachment_pipeline import schedule_attachment_processing
+from background import run_in_background
+from compression import recompress_existing, is_text_attachment
+from logviewer import LogView, LogViewerError
+from attachment_gc import collect_garbage
+from signatures import same_signature_issues, signature_clusters
+from near_duplicates import find_possible_duplicates
+from related import related_issues
+from path_parser import parse_path
+from path_tree import children as path_tree_children, normalize_prefix
+from trigram_index import search_paths_and_titles, MIN_QUERY_LENGTH
+from search_query import parse_search, plan_query, QueryError
+from text_index import issue_snippets
+from serializers import (
+    resolve_fields, project, serialize_issues, related_records, FieldsError, FULL_FIELDS, RELATED_FIELDS, DETAIL_FIELDS,
+    MAX_BATCH_SIZE
+)
+from saved_searches import materialize, update_saved_searches, result_counts
+from singleflight import coalesced
+from reference_data import reference_data
+from suggest import suggest, KINDS as SUGGEST_KINDS
+from image_similarity import find_similar_images, MAX_DISTANCE
+from uploads import (
+    store_upload, check_upload_allowed, check_sha256, choose_chunk_size, write_chunk, assemble_upload,
+    discard_upload, ChunkError
+)
 import os
+import uuid
 from werkzeug.utils import secure_filename
 import markdown
 from datetime import datetime
@@ -121,8 +150,10 @@ def update_user(user_id):
 @admin_required
 def delete_issue(issue_id):
     issue = Issue.query.get_or_404(issue_id)
+    content_hashes = [att.content_hash for att in issue.attachments if att.content_hash]
     db.session.delete(issue)
     db.session.commit()
+    release_blobs(content_hashes)
     
     return jsonify({'message': 'Issue deleted successfully'})
 
@@ -130,8 +161,10 @@ def delete_issue(issue_id):
 @admin_required
 def delete_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
+    content_hashes = [att.content_hash for att in comment.attachments if att.content_hash]
     db.session.delete(comment)
     db.session.commit()
+    release_blobs(content_hashes)
     return jsonify({'message': 'Comment deleted successfully'})
 
 @app.route('/api/admin/issues/<int:issue_id>/edit', methods=['PUT'])
@@ -202,10 +235,13 @@ def bulk_delete_issues():
     try:
         # Delete issues from database
         issues_to_delete = Issue.query.filter(Issue.id.in_(issue_ids)).all()
+        content_hashes = []
         for issue in issues_to_delete:
+            content_hashes.extend(att.content_hash for att in issue.attachments if att.content_hash)
             db.session.delete(issue)
         
         db.session.commit()
+        release_blobs(content_hashes)
         
         return jsonify({
             'message': f'Successfully deleted {len(issues_to_delete)} issues',
@@ -215,22 +251,54 @@ def bulk_delete_issues():
         db.session.rollback()
         return jsonify({'error': f'Failed to delete issues: {str(e)}'}), 500
 
-# Helper function to save file
-def save_file(file, folder='uploads'):
+@app.route('/api/admin/attachments/recompress', methods=['POST'])
+@admin_required
+def recompress_attachments():
+    """Start the recompression job for existing uploads in the background"""
+    data = request.get_json(silent=True) or {}
+    run_in_background(recompress_existing, dry_run=bool(data.get('dry_run')))
+    return jsonify({'message': 'Recompression job started'}), 202
+
+@app.route('/api/admin/attachments/gc', methods=['POST'])
+@admin_required
+def collect_attachment_garbage():
+    """Report (dry run, the default) or reclaim orphaned attachment files"""
+    data = request.get_json(silent=True) or {}
+    grace_seconds = data.get('grace_seconds')
+    if grace_seconds is not None and (not isinstance(grace_seconds, int) or grace_seconds < 0):
+        return jsonify({'error': 'grace_seconds must be a non-negative integer'}), 400
+    if data.get('dry_run', True):
+        return jsonify(collect_garbage(dry_run=True, grace_seconds=grace_seconds))
+    run_in_background(collect_garbage, dry_run=False, grace_seconds=grace_seconds)
+    return jsonify({'message': 'Garbage collection started'}), 202
+
+# Helper function to save file into the content-addressed attachment store
+def save_file(file):
     if file and file.filename:
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(folder, filename)
-        file.save(file_path)
-        return filename, file_path
+        filename = secure_filename(file.filename) or 'attachment'
+        blob = store_upload(file)
+        return filename, blob
     return None, None
 
+# Helper function to drop stored blobs that lost their last reference
+def release_blobs(content_hashes):
+    for content_hash in set(content_hashes):
+        try:
+            attachment_store.release(content_hash)
+        except OSError as e:
+            print(f"Error releasing blob {content_hash}: {e}")
+
 # Helper function to index issue in Elasticsearch (currently disabled)
 def index_issue(issue):
     # TODO: Implement Elasticsearch indexing when ES is configured
     pass
 
+def bucket_filter(bucket):
+    """Issues whose primary or any additional testcase path is in `bucket` (both columns are indexed)"""
+    bucket = bucket.strip().upper()
+    additional = db.session.query(TestcasePath.issue_id).filter(TestcasePath.bucket == bucket)
+    return db.or_(Issue.bucket == bucket, Issue.id.in_(additional))
+
 # Issues endpoints
 @app.route('/api/issues', methods=['GET'])
 def get_issues():
@@ -240,37 +308,56 @@ def get_issues():
     severity = request.args.get('severity')
     release = request.args.get('release')
     platform = request.args.get('platform')
+    bucket = request.args.get('bucket')
     build = request.args.get('build')
     target = request.args.get('target')
     test_case_id = request.args.get('test_case_id')
     
-    query = Issue.query
-    
-    if status:
-        query = query.filter(Issue.status == status)
-    if severity:
-        query = query.filter(Issue.severity == severity)
-    if release:
-        query = query.filter(Issue.release == release)
-    if platform:
-        query = query.filter(Issue.platform == platform)
-    if build:
-        query = query.filter(Issue.build == build)
-    if target:
-        query = query.filter(Issue.target == target)
-    if test_case_id:
-        query = query.filter(Issue.test_case_ids == test_case_id)
-    
-    issues = query.order_by(Issue.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        fields = resolve_fields(request.args.get('fields'), request.args.get('view', 'summary'))
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'issues': [issue.to_dict() for issue in issues.items],
-        'total': issues.total,
-        'pages': issues.pages,
-        'current_page': page
-    })
+    def load():
+        query = Issue.query
+        
+        if status:
+            query = query.filter(Issue.status == status)
+        if severity:
+            query = query.filter(Issue.severity == severity)
+        if release:
+            query = query.filter(Issue.release == release)
+        if platform:
+            query = query.filter(Issue.platform == platform)
+        if bucket:
+            query = query.filter(bucket_filter(bucket))
+        if build:
+            query = query.filter(Issue.build == build)
+        if target:
+            query = query.filter(Issue.target == target)
+        if test_case_id:
+            query = query.filter(Issue.test_case_ids == test_case_id)
+        
+        query = query.order_by(Issue.created_at.desc())
+        if fields is None:
+            issues = query.paginate(page=page, per_page=per_page, error_out=False)
+            results = [issue.to_dict() for issue in issues.items]
+        else:
+            # Only the columns and relationships the requested fields need
+            issues = project(query, fields).paginate(page=page, per_page=per_page, error_out=False)
+            results = serialize_issues(issues.items, fields)
+        
+        return {
+            'issues': results,
+            'total': issues.total,
+            'pages': issues.pages,
+            'current_page': page
+        }
+    
+    # Identical concurrent requests (everyone opening the same filter) share one query
+    key = ('issues', page, per_page, status, severity, release, platform,
+           bucket.strip().upper() if bucket else None, build, target, test_case_id, fields)
+    return jsonify(coalesced(key, load))
 
 @app.route('/api/issues', methods=['POST'])
 @login_required
@@ -305,8 +392,9 @@ def create_issue():
     # Use only the auto-generated test case ID
     test_case_ids = unique_test_case_id
 
-    # Parse testcase path to extract release and platform
-    release, platform = Issue.parse_testcase_path(data['testcase_path'])
+    # Parse testcase path once for release, platform and bucket
+    parsed_path = parse_path(data['testcase_path'])
+    release, platform = parsed_path.release, parsed_path.platform
     
     # Check if testcase path already exists for the same target
     target = data.get('target')
@@ -336,7 +424,7 @@ def create_issue():
         tag_names = tags_input
     
     # Extract bucket name from testcase path and add as tag
-    bucket_name = Issue.extract_bucket_name(data['testcase_path'])
+    bucket_name = parsed_path.bucket
     if bucket_name:
         # Add bucket name to tags if not already present
         if bucket_name not in tag_names:
@@ -345,6 +433,9 @@ def create_issue():
     # Automatically assign reviewer based on bucket name
     reviewer_name = Issue.get_reviewer_for_bucket(bucket_name) if bucket_name else 'Admin'
     
+    # Look for near-identical reports (e.g. the same failure filed for another target)
+    possible_duplicates = find_possible_duplicates(data['testcase_title'], data['description'], data['testcase_path'])
+    
     # Create issue
     issue = Issue(
         testcase_title=data['testcase_title'],
@@ -353,6 +444,7 @@ def create_issue():
         test_case_ids=test_case_ids,
         release=release,
         platform=platform,
+        bucket=bucket_name,
         build=data.get('build'),
         target=target,
         description=data['description'],
@@ -373,34 +465,147 @@ def create_issue():
     db.session.commit()
     
     # Handle file attachments (screenshots)
+    new_attachments = []
     for file in files:
         if file and file.filename:
-            filename, file_path = save_file(file)
-            if filename and file_path:
+            filename, blob = save_file(file)
+            if filename and blob:
                 attachment = Attachment(
                     issue_id=issue.id,
                     filename=filename,
-                    file_path=file_path,
-                    file_size=os.path.getsize(file_path),
+                    file_path=blob.path,
+                    file_size=blob.size,
                     mime_type=file.content_type,
+                    content_hash=blob.content_hash,
+                    content_encoding=blob.content_encoding,
+                    stored_size=blob.stored_size,
                     uploaded_by=reporter_name  # Use the validated reporter_name variable
                 )
                 db.session.add(attachment)
+                new_attachments.append(attachment)
     
     db.session.commit()
+    schedule_attachment_processing(new_attachments)
     
-    return jsonify(issue.to_dict()), 201
+    issue_dict = issue.to_dict()
+    issue_dict['possible_duplicates'] = possible_duplicates
+    return jsonify(issue_dict), 201
+
+@app.route('/api/issues/check-duplicates', methods=['POST'])
+@login_required
+def check_duplicates():
+    """Near-duplicates of a report that has not been filed yet (or of an existing issue)"""
+    data = request.json or {}
+    if not any(data.get(field) for field in ('testcase_title', 'description', 'testcase_path')):
+        return jsonify({'error': 'testcase_title, description or testcase_path is required'}), 400
+    possible_duplicates = find_possible_duplicates(
+        data.get('testcase_title'), data.get('description'), data.get('testcase_path'),
+        exclude_id=data.get('exclude_id')
+    )
+    return jsonify({'possible_duplicates': possible_duplicates})
 
 @app.route('/api/issues/<int:issue_id>', methods=['GET'])
 def get_issue(issue_id):
-    issue = Issue.query.get_or_404(issue_id)
-    issue_dict = issue.to_dict()
-    # Order comments by creation date descending (newest first)
-    comments = Comment.query.filter_by(issue_id=issue_id).order_by(Comment.created_at.desc()).all()
-    issue_dict['comments'] = [comment.to_dict() for comment in comments]
-    issue_dict['attachments'] = [att.to_dict() for att in issue.attachments]
+    """The full issue with its comments and attachments, or only `fields` (which may name those too)"""
+    try:
+        fields = resolve_fields(request.args.get('fields'), request.args.get('view', 'full'), extra=DETAIL_FIELDS)
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
+    if fields is None:
+        issue = Issue.query.get_or_404(issue_id)
+        issue_dict = issue.to_dict()
+        # Comments newest first
+        issue_dict.update(related_records([issue_id], RELATED_FIELDS)[issue_id])
+        fields = DETAIL_FIELDS
+    else:
+        row = project(Issue.query.filter(Issue.id == issue_id), fields).first_or_404()
+        issue_dict = serialize_issues([row], fields)[0]
+    if 'same_signature_issues' in fields:
+        issue_dict['same_signature_issues'] = same_signature_issues(issue_id)
     return jsonify(issue_dict)
 
+@app.route('/api/issues/batch', methods=['GET', 'POST'])
+def get_issues_batch():
+    """Many issues by id, in the order given (POST a JSON body for long id lists)"""
+    if request.method == 'POST':
+        params = request.get_json() or {}
+        ids = params.get('ids') or []
+        include = params.get('include') or []
+    else:
+        params = request.args.to_dict()
+        ids = params.get('ids', '').split(',')
+        include = params['include'].split(',') if params.get('include') else []
+    try:
+        ids = list(dict.fromkeys(int(issue_id) for issue_id in ids if str(issue_id).strip()))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ids must be a list of issue ids'}), 400
+    if not ids:
+        return jsonify({'error': 'ids is required'}), 400
+    if len(ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} ids per request'}), 400
+    include = [name.strip() for name in include if str(name).strip()]
+    if any(name not in RELATED_FIELDS for name in include):
+        return jsonify({'error': f"include may name {', '.join(RELATED_FIELDS)}"}), 400
+    try:
+        fields = resolve_fields(params.get('fields'), params.get('view', 'full'), extra=RELATED_FIELDS)
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
+    # The full view from the bulk serializer, rather than Issue.to_dict() with its per-issue queries
+    fields = tuple(dict.fromkeys((fields or FULL_FIELDS) + tuple(include)))
+
+    # A fixed number of queries per request, however many ids are asked for
+    rows = project(Issue.query.filter(Issue.id.in_(ids)), fields).all()
+    entries = {entry['id']: entry for entry in serialize_issues(rows, fields)}
+    return jsonify({
+        'issues': [entries[issue_id] for issue_id in ids if issue_id in entries],
+        'missing': [issue_id for issue_id in ids if issue_id not in entries]
+    })
+
+@app.route('/api/issues/<int:issue_id>/related', methods=['GET'])
+def get_related_issues(issue_id):
+    """Issues with similar titles, descriptions, comments and tags (TF-IDF cosine similarity)"""
+    Issue.query.get_or_404(issue_id)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    related = related_issues(issue_id, limit=limit)
+    return jsonify({
+        'issue_id': issue_id,
+        'related': related or [],
+        'ready': related is not None
+    })
+
+@app.route('/api/issues/<int:issue_id>/similar-screenshots', methods=['GET'])
+def get_similar_screenshots(issue_id):
+    """Issues with a screenshot visually similar to one of this issue's (perceptual hash distance)"""
+    issue = Issue.query.get_or_404(issue_id)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    max_distance = request.args.get('max_distance', type=int)
+    if max_distance is not None and not 0 <= max_distance <= MAX_DISTANCE:
+        return jsonify({'error': f'max_distance must be between 0 and {MAX_DISTANCE}'}), 400
+    images = [att for att in issue.attachments if is_image_attachment(att)]
+    similar = find_similar_images(images, max_distance=max_distance, limit=limit)
+    return jsonify({
+        'issue_id': issue_id,
+        'similar': similar or [],
+        'ready': similar is not None
+    })
+
+@app.route('/api/attachments/<int:attachment_id>/similar', methods=['GET'])
+def get_similar_attachment_images(attachment_id):
+    """Issues with a screenshot visually similar to this image attachment"""
+    attachment = Attachment.query.get_or_404(attachment_id)
+    if not is_image_attachment(attachment):
+        return jsonify({'error': 'Attachment is not an image'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    max_distance = request.args.get('max_distance', type=int)
+    if max_distance is not None and not 0 <= max_distance <= MAX_DISTANCE:
+        return jsonify({'error': f'max_distance must be between 0 and {MAX_DISTANCE}'}), 400
+    similar = find_similar_images([attachment], max_distance=max_distance, limit=limit)
+    return jsonify({
+        'attachment_id': attachment_id,
+        'similar': similar or [],
+        'ready': similar is not None
+    })
+
 @app.route('/api/issues/<int:issue_id>', methods=['PUT'])
 @login_required
 def update_issue(issue_id):
@@ -421,12 +626,13 @@ def update_issue(issue_id):
         
         issue.testcase_path = new_testcase_path
         # Re-parse release and platform if testcase_path is updated
-        release, platform = Issue.parse_testcase_path(new_testcase_path)
-        issue.release = release
-        issue.platform = platform
+        parsed_path = parse_path(new_testcase_path)
+        issue.release = parsed_path.release
+        issue.platform = parsed_path.platform
+        issue.bucket = parsed_path.bucket
         
         # Extract bucket name from new testcase path and add as tag
-        bucket_name = Issue.extract_bucket_name(new_testcase_path)
+        bucket_name = parsed_path.bucket
         if bucket_name:
             # Check if bucket name is already a tag for this issue
             existing_tag_names = [tag.name for tag in issue.tags]
@@ -506,8 +712,16 @@ def get_comments(issue_id):
 @app.route('/api/issues/<int:issue_id>/comments', methods=['POST'])
 @login_required
 def create_comment(issue_id):
-    data = request.json
-    files = request.files.getlist('files') if request.files else []
+    # Handle both JSON and FormData (comments with attachments)
+    if request.content_type and 'multipart/form-data' in request.content_type:
+        data = request.form
+        files = request.files.getlist('files') if request.files else []
+    else:
+        data = request.json
+        files = []
+    
+    if not data or not data.get('content'):
+        return jsonify({'error': 'Comment content is required'}), 400
     
     # Get current user from session (same pattern as /api/auth/me)
     if not session.get('user_id'):
@@ -527,22 +741,28 @@ def create_comment(issue_id):
     db.session.commit()
     
     # Handle file attachments
+    new_attachments = []
     for file in files:
         if file and file.filename:
-            filename, file_path = save_file(file)
-            if filename and file_path:
+            filename, blob = save_file(file)
+            if filename and blob:
                 attachment = Attachment(
                     issue_id=issue_id,
                     comment_id=comment.id,
                     filename=filename,
-                    file_path=file_path,
-                    file_size=os.path.getsize(file_path),
+                    file_path=blob.path,
+                    file_size=blob.size,
                     mime_type=file.content_type,
+                    content_hash=blob.content_hash,
+                    content_encoding=blob.content_encoding,
+                    stored_size=blob.stored_size,
                     uploaded_by=user.username
                 )
                 db.session.add(attachment)
+                new_attachments.append(attachment)
     
     db.session.commit()
+    schedule_attachment_processing(new_attachments)
     
     return jsonify(comment.to_dict()), 201
 
@@ -602,79 +822,239 @@ def downvote_comment(comment_id):
 # Search endpoint
 @app.route('/api/search', methods=['GET', 'POST'])
 def search_issues():
+    """Search with the query language in search_query.py, e.g.
+    q=status:open severity:>=High bucket:GUI target:25.11-* "timeout error" -tag:flaky"""
     if request.method == 'POST':
-        data = request.get_json() or {}
-        query = data.get('search', '')
-        status = data.get('status')
-        severity = data.get('severity')
-        release = data.get('release')
-        platform = data.get('platform')
-        build = data.get('build')
-        target = data.get('target')
-        test_case_id = data.get('test_case_id')
-        reporter_name = data.get('reporter_name')
-        tags = data.get('tags', [])
-        size = data.get('size', 20)
-        from_date = data.get('from_date')
-        to_date = data.get('to_date')
+        params = request.get_json() or {}
+        text = params.get('search') or params.get('q') or ''
+        tags = params.get('tags') or []
     else:
-        query = request.args.get('q', '')
-        status = request.args.get('status')
-        severity = request.args.get('severity')
-        release = request.args.get('release')
-        platform = request.args.get('platform')
-        build = request.args.get('build')
-        target = request.args.get('target')
-        test_case_id = request.args.get('test_case_id')
-        reporter_name = request.args.get('reporter_name')
-        tags = request.args.get('tags', '').split(',') if request.args.get('tags') else []
-        size = request.args.get('size', 20, type=int)
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-
-    # Use only SQLAlchemy for all search and filters
-    db_query = Issue.query
-
-    # Full-text search (case-insensitive, partial match)
-    if query:
-        db_query = db_query.filter(
-            db.or_(
-                Issue.testcase_title.ilike(f'%{query}%'),
-                Issue.description.ilike(f'%{query}%'),
-                Issue.test_case_ids.ilike(f'%{query}%')
-            )
-        )
-    if status:
-        db_query = db_query.filter(Issue.status == status)
-    if severity:
-        db_query = db_query.filter(Issue.severity == severity)
-    if release:
-        db_query = db_query.filter(Issue.release == release)
-    if platform:
-        db_query = db_query.filter(Issue.platform == platform)
-    if build:
-        db_query = db_query.filter(Issue.build == build)
-    if target:
-        db_query = db_query.filter(Issue.target == target)
-    if test_case_id:
-        db_query = db_query.filter(Issue.test_case_ids == test_case_id)
-    if reporter_name:
-        db_query = db_query.filter(Issue.reporter_name == reporter_name)
-    if tags:
-        valid_tags = [tag.strip() for tag in tags if tag.strip()]
-        if valid_tags:
-            # This is a simplified tag search - in production you'd want a proper tag relationship
-            pass
-    # Date range filter (if needed)
-    # if from_date or to_date:
-    #     ...
-
-    issues = db_query.order_by(Issue.created_at.desc()).limit(size).all()
-    return jsonify({
-        'issues': [issue.to_dict() for issue in issues],
+        params = request.args.to_dict()
+        text = params.get('q', '')
+        tags = params['tags'].split(',') if params.get('tags') else []
+    results, error = search_results(params, text, tags)
+    if error:
+        return error
+    return jsonify(results)
+
+def search_results(params, text, tags):
+    """(payload, None) for a search with these parameters, or (None, error response)"""
+    try:
+        size = max(1, min(int(params.get('size', 20)), 200))
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'size must be a number'}), 400)
+    explain = str(params.get('explain', '')).lower() in ('1', 'true')
+    try:
+        fields = resolve_fields(params.get('fields'), params.get('view', 'summary'))
+    except FieldsError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+
+    try:
+        node = parse_search(text, params, tags)
+    except QueryError as e:
+        return None, (jsonify({'error': str(e), 'position': e.position}), 400)
+
+    key = ('search', str(node) if node is not None else '', size, fields, explain)
+    return coalesced(key, lambda: run_search(node, size, fields, explain)), None
+
+def run_search(node, size, fields, explain):
+    """Response payload for search_issues"""
+    plan = plan_query(node)
+    db_query = Issue.query.filter(plan.filter).order_by(*plan.order_by()).limit(size)
+    if fields is None:
+        issues = db_query.all()
+        results = [issue.to_dict() for issue in issues]
+    else:
+        # Only the requested columns, without per-issue queries; snippets show where the text matched
+        rows = project(db_query, fields).all()
+        issues = [issue for issue, _ in rows]
+        results = serialize_issues(rows, fields)
+    # Which comment matched the text, for issues found through their comments
+    hits = {issue.id: plan.comment_hits[issue.id] for issue in issues if issue.id in plan.comment_hits}
+    if hits:
+        commenters = dict(db.session.query(Comment.id, Comment.commenter_name)
+                          .filter(Comment.id.in_([hit[1] for hit in hits.values()])).all())
+        for entry in results:
+            if entry['id'] in hits:
+                score, comment_id, verified = hits[entry['id']]
+                entry['matched_comment'] = {
+                    'id': comment_id,
+                    'commenter_name': commenters.get(comment_id),
+                    'is_verified_solution': verified,
+                    'score': round(score, 3)
+                }
+    if plan.terms and issues:
+        snippets = issue_snippets([issue.id for issue in issues], [term.text for term in plan.terms],
+                                  comment_ids={issue_id: hit[1] for issue_id, hit in hits.items()})
+        for entry in results:
+            entry['snippets'] = snippets[entry['id']] if snippets is not None else []
+    result = {
+        'issues': results,
         'total': len(issues)
+    }
+    if explain:
+        result['plan'] = plan.explain(db_query)
+    return result
+
+@app.route('/api/search/substring', methods=['GET'])
+def search_substring():
+    """Substring, prefix and fuzzy matches against testcase titles and paths (trigram index)"""
+    query = request.args.get('q', '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify({'error': f'q must be at least {MIN_QUERY_LENGTH} characters'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    fuzzy = request.args.get('fuzzy', '1') not in ('0', 'false')
+    results = search_paths_and_titles(query, limit=limit, fuzzy=fuzzy)
+    return jsonify({
+        'query': query,
+        'results': results or [],
+        'ready': results is not None
+    })
+
+@app.route('/api/suggest', methods=['GET'])
+def get_suggestions():
+    """Typeahead completions for titles, tags, buckets, paths, reporters and test case ids"""
+    prefix = request.args.get('q', '')
+    kinds = [kind.strip() for kind in request.args.get('kind', '').split(',') if kind.strip()] or list(SUGGEST_KINDS)
+    unknown = [kind for kind in kinds if kind not in SUGGEST_KINDS]
+    if unknown:
+        return jsonify({'error': f"Unknown kind: {', '.join(unknown)}. Use one of: {', '.join(SUGGEST_KINDS)}"}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    suggestions = suggest(prefix, kinds=kinds, limit=limit)
+    return jsonify({
+        'query': prefix,
+        'suggestions': suggestions or {kind: [] for kind in kinds},
+        'ready': suggestions is not None
     })
 
+# Saved searches
+def owned_saved_search(saved_search_id):
+    """The current user's saved search, or None; other users' searches are not visible"""
+    saved = SavedSearch.query.get(saved_search_id)
+    return saved if saved and saved.user_id == session['user_id'] else None
+
+def saved_search_dict(saved, counts):
+    total, new_count = counts.get(saved.id, (0, 0))
+    return dict(saved.to_dict(), total=total, new_count=new_count)
+
+@app.route('/api/saved-searches', methods=['GET'])
+@login_required
+def get_saved_searches():
+    update_saved_searches(session['user_id'])
+    searches = SavedSearch.query.filter_by(user_id=session['user_id']).order_by(SavedSearch.name).all()
+    counts = result_counts(searches)
+    return jsonify([saved_search_dict(saved, counts) for saved in searches])
+
+@app.route('/api/saved-searches', methods=['POST'])
+@login_required
+def create_saved_search():
+    """Save a query (`search`), and/or the same filter parameters /api/search takes"""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    try:
+        node = parse_search(data.get('search') or data.get('q') or '', data, data.get('tags') or [])
+    except QueryError as e:
+        return jsonify({'error': str(e), 'position': e.position}), 400
+    if node is None:
+        return jsonify({'error': 'A query or at least one filter is required'}), 400
+
+    saved = SavedSearch(user_id=session['user_id'], name=name[:100], query_text=str(node))
+    db.session.add(saved)
+    db.session.flush()
+    materialize(saved)
+    saved.viewed_change_id = saved.change_id
+    db.session.commit()
+    return jsonify(saved_search_dict(saved, result_counts([saved]))), 201
+
+@app.route('/api/saved-searches/<int:saved_search_id>', methods=['GET'])
+@login_required
+def get_saved_search(saved_search_id):
+    """Current matches, newest first, flagging those added since the last view (which this marks viewed)"""
+    saved = owned_saved_search(saved_search_id)
+    if not saved:
+        return jsonify({'error': 'Saved search not found'}), 404
+    update_saved_searches(session['user_id'])
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 200))
+    mark_viewed = request.args.get('mark_viewed', '1') not in ('0', 'false')
+    try:
+        fields = resolve_fields(request.args.get('fields'))
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
+
+    new_ids = [issue_id for (issue_id,) in db.session.query(SavedSearchResult.issue_id).filter(
+        SavedSearchResult.saved_search_id == saved.id,
+        SavedSearchResult.added_change_id > saved.viewed_change_id
+    )]
+    query = (Issue.query
+             .join(SavedSearchResult, SavedSearchResult.issue_id == Issue.id)
+             .filter(SavedSearchResult.saved_search_id == saved.id))
+    total = query.count()
+    rows = (project(query, fields)
+            .order_by(Issue.created_at.desc())
+            .offset((page - 1) * per_page)
+            .limit(per_page)
+            .all())
+    issues = serialize_issues(rows, fields)
+    new = set(new_ids)
+    for entry in issues:
+        entry['is_new'] = entry['id'] in new
+
+    result = {
+        'saved_search': dict(saved.to_dict(), total=total, new_count=len(new_ids)),
+        'issues': issues,
+        'total': total,
+        'new': new_ids,
+        'current_page': page,
+        'pages': (total + per_page - 1) // per_page
+    }
+    if mark_viewed:
+        # Rows can be stamped past change_id, which stays below changes still being committed
+        latest_added = db.session.query(db.func.max(SavedSearchResult.added_change_id)).filter(
+            SavedSearchResult.saved_search_id == saved.id).scalar()
+        saved.viewed_change_id = max(saved.change_id, latest_added or 0)
+        saved.viewed_at = datetime.now()
+        db.session.commit()
+    return jsonify(result)
+
+@app.route('/api/saved-searches/<int:saved_search_id>', methods=['DELETE'])
+@login_required
+def delete_saved_search(saved_search_id):
+    saved = owned_saved_search(saved_search_id)
+    if not saved:
+        return jsonify({'error': 'Saved search not found'}), 404
+    db.session.delete(saved)
+    db.session.commit()
+    return jsonify({'message': 'Saved search deleted successfully'})
+
+# Bootstrap endpoint - everything the issue list page needs on first load
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """
+    What the issue list page needs on load in one response: the current user,
+    the dropdown reference data (left out when the client's
+    `reference_version` is current) and the first page of `/api/search`
+    results for the other parameters (left out with `search=0`).
+    """
+    user = User.query.get(session['user_id']) if session.get('user_id') else None
+    if session.get('user_id') and not user:
+        session.pop('user_id', None)
+    params = request.args.to_dict()
+    version, reference = reference_data()
+    result = {
+        'user': user.to_dict() if user else None,
+        'reference_version': version,
+        'reference': None if params.get('reference_version') == version else reference
+    }
+    if params.get('search', '1') not in ('0', 'false'):
+        tags = params['tags'].split(',') if params.get('tags') else []
+        result['search'], error = search_results(params, params.get('q', ''), tags)
+        if error:
+            return error
+    return jsonify(result)
+
 # Tags endpoint
 @app.route('/api/tags', methods=['GET'])
 def get_tags():
@@ -687,6 +1067,22 @@ def get_releases():
     releases = db.session.query(Issue.release).filter(Issue.release.isnot(None)).distinct().all()
     return jsonify([release[0] for release in releases if release[0]])
 
+@app.route('/api/paths/tree', methods=['GET'])
+def get_path_tree():
+    """Child directories (and testcases) under a testcase path prefix, with issue counts"""
+    prefix = normalize_prefix(request.args.get('prefix', ''))
+    limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+    node, nodes, truncated = path_tree_children(prefix, limit=limit)
+    if prefix and node is None:
+        return jsonify({'error': 'No testcase paths under this prefix'}), 404
+    return jsonify({
+        'prefix': prefix,
+        # At the top level an issue can sit under several children, so count issues directly
+        'count': node.issue_count if node else db.session.query(db.func.count(Issue.id)).scalar(),
+        'children': [child.to_dict() for child in nodes],
+        'truncated': truncated
+    })
+
 @app.route('/api/platforms', methods=['GET'])
 def get_platforms():
     platforms = db.session.query(Issue.platform).distinct().filter(Issue.platform.isnot(None)).all()
@@ -720,41 +1116,220 @@ def get_targets(release):
 def serve_attachment(attachment_id):
     attachment = Attachment.query.get_or_404(attachment_id)
     
-    print(f"Serving attachment {attachment_id}: {attachment.filename}, MIME: {attachment.mime_type}")  # Debug log
+    # Check if user wants to force download
+    force_download = request.args.get('download', '').lower() == 'true'
     
-    # Check if this is an image file - try multiple ways
-    is_image_by_mime = attachment.mime_type and attachment.mime_type.startswith('image/')
-    is_image_by_extension = attachment.filename and any(attachment.filename.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'])
-    is_image = is_image_by_mime or is_image_by_extension
+    # Inline previews ask for a thumbnail bucket instead of the full-size image
+    size = request.args.get('size', type=int)
+    if size and size > 0 and not force_download and is_image_attachment(attachment):
+        return send_thumbnail(attachment, size)
     
-    print(f"Is image? {is_image} (by MIME: {is_image_by_mime}, by extension: {is_image_by_extension})")  # Debug log
+    return send_attachment(attachment, force_download=force_download)
+
+# Log viewer endpoints - serve slices of large text attachments without downloading them
+def open_log_view(attachment_id):
+    attachment = Attachment.query.get_or_404(attachment_id)
+    if not is_text_attachment(attachment):
+        return None, (jsonify({'error': 'Attachment is not a text file'}), 400)
+    return LogView(attachment), None
+
+@app.route('/api/attachments/<int:attachment_id>/lines', methods=['GET'])
+@login_required
+def get_attachment_lines(attachment_id):
+    first = request.args.get('from', 1, type=int)
+    last = request.args.get('to', first + 99, type=int)
+    
+    view, error = open_log_view(attachment_id)
+    if error:
+        return error
+    with view:
+        return jsonify({
+            'attachment_id': attachment_id,
+            'total_lines': view.index.total_lines,
+            'lines': view.lines(first, last)
+        })
+
+@app.route('/api/attachments/<int:attachment_id>/tail', methods=['GET'])
+@login_required
+def get_attachment_tail(attachment_id):
+    count = request.args.get('n', 100, type=int)
     
-    # Check if user wants to force download
-    force_download = request.args.get('download', '').lower() == 'true'
+    view, error = open_log_view(attachment_id)
+    if error:
+        return error
+    with view:
+        return jsonify({
+            'attachment_id': attachment_id,
+            'total_lines': view.index.total_lines,
+            'lines': view.tail(count)
+        })
+
+@app.route('/api/attachments/<int:attachment_id>/grep', methods=['GET'])
+@login_required
+def grep_attachment(attachment_id):
+    pattern = request.args.get('pattern', '')
+    ignore_case = request.args.get('ignore_case', '').lower() == 'true'
+    max_matches = request.args.get('max', 100, type=int)
+    
+    view, error = open_log_view(attachment_id)
+    if error:
+        return error
+    with view:
+        try:
+            matches, truncated = view.grep(pattern, ignore_case=ignore_case, max_matches=max_matches)
+        except LogViewerError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'attachment_id': attachment_id,
+            'total_lines': view.index.total_lines,
+            'matches': matches,
+            'truncated': truncated
+        })
+
+@app.route('/api/signatures/clusters', methods=['GET'])
+def get_signature_clusters():
+    """Group issues by the failure signature of their log attachments"""
+    statuses = [status for status in request.args.get('status', 'open').split(',') if status]
+    min_size = max(1, request.args.get('min_size', 2, type=int))
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    clusters = signature_clusters(statuses=statuses, min_size=min_size, limit=limit)
+    return jsonify({'clusters': clusters, 'total': len(clusters)})
+
+# Resumable chunked uploads (init / put-chunk / complete) for files too large for one request
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def init_upload():
+    data = request.json or {}
+    user = User.query.get(session['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
     
-    if is_image and not force_download:
-        # Serve images inline for display
-        print(f"Serving image inline: {attachment.filename}")  # Debug log
-        
-        # If mime_type is missing, try to detect it from file extension
-        mime_type = attachment.mime_type
-        if not mime_type and attachment.filename:
-            if attachment.filename.lower().endswith(('.jpg', '.jpeg')):
-                mime_type = 'image/jpeg'
-            elif attachment.filename.lower().endswith('.png'):
-                mime_type = 'image/png'
-            elif attachment.filename.lower().endswith('.gif'):
-                mime_type = 'image/gif'
-            elif attachment.filename.lower().endswith('.bmp'):
-                mime_type = 'image/bmp'
-            elif attachment.filename.lower().endswith('.webp'):
-                mime_type = 'image/webp'
-        
-        return send_file(attachment.file_path, mimetype=mime_type)
-    else:
-        # Serve other files as downloads
-        print(f"Serving as download: {attachment.filename}")  # Debug log
-        return send_file(attachment.file_path, as_attachment=True, download_name=attachment.filename)
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'error': 'Filename is required'}), 400
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'File size is required'}), 400
+    if total_size <= 0:
+        return jsonify({'error': 'File size must be positive'}), 400
+    if total_size > app.config['MAX_CHUNKED_UPLOAD_SIZE']:
+        return jsonify({'error': f"File exceeds the upload limit of {app.config['MAX_CHUNKED_UPLOAD_SIZE']} bytes"}), 413
+    mime_type = data.get('mime_type')
+    check_upload_allowed(filename, mime_type)
+    
+    try:
+        chunk_size = choose_chunk_size(data.get('chunk_size'))
+        expected_hash = check_sha256(data['sha256'], 'sha256') if data.get('sha256') is not None else None
+    except ChunkError as e:
+        return jsonify({'error': e.message}), e.status
+    
+    issue = Issue.query.get_or_404(data.get('issue_id'))
+    comment_id = data.get('comment_id')
+    if comment_id:
+        comment = Comment.query.get_or_404(comment_id)
+        if comment.issue_id != issue.id:
+            return jsonify({'error': 'Comment does not belong to this issue'}), 400
+    
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        issue_id=issue.id,
+        comment_id=comment_id,
+        filename=filename,
+        mime_type=mime_type,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        chunks_received=0,
+        bytes_received=0,
+        expected_hash=expected_hash,
+        status='uploading',
+        created_by=user.username
+    )
+    db.session.add(upload)
+    db.session.commit()
+    
+    return jsonify(upload.to_dict()), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload(upload_id):
+    """Report upload progress so an interrupted client knows which chunk to resume from"""
+    user = User.query.get(session['user_id'])
+    upload = UploadSession.query.get_or_404(upload_id)
+    if not user or upload.created_by != user.username:
+        return jsonify({'error': 'Only the uploader can view this upload'}), 403
+    return jsonify(upload.to_dict())
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id, index):
+    user = User.query.get(session['user_id'])
+    # Lock the session row so concurrent retries of the same chunk serialize
+    upload = UploadSession.query.filter_by(id=upload_id).with_for_update().first_or_404()
+    if not user or upload.created_by != user.username:
+        return jsonify({'error': 'Only the uploader can add chunks'}), 403
+    if upload.status != 'uploading':
+        return jsonify({'error': 'Upload is already complete'}), 409
+    
+    try:
+        write_chunk(upload, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except ChunkError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message, 'next_chunk': upload.chunks_received}), e.status
+    
+    db.session.commit()
+    return jsonify(upload.to_dict())
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    user = User.query.get(session['user_id'])
+    upload = UploadSession.query.filter_by(id=upload_id).with_for_update().first_or_404()
+    if not user or upload.created_by != user.username:
+        return jsonify({'error': 'Only the uploader can complete this upload'}), 403
+    if upload.status == 'complete':
+        attachment = Attachment.query.get_or_404(upload.attachment_id)
+        return jsonify(attachment.to_dict())
+    
+    try:
+        blob = assemble_upload(upload)
+    except ChunkError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message, 'next_chunk': upload.chunks_received}), e.status
+    
+    attachment = Attachment(
+        issue_id=upload.issue_id,
+        comment_id=upload.comment_id,
+        filename=upload.filename,
+        file_path=blob.path,
+        file_size=blob.size,
+        mime_type=upload.mime_type,
+        content_hash=blob.content_hash,
+        content_encoding=blob.content_encoding,
+        stored_size=blob.stored_size,
+        uploaded_by=user.username
+    )
+    db.session.add(attachment)
+    db.session.flush()
+    upload.status = 'complete'
+    upload.attachment_id = attachment.id
+    db.session.commit()
+    schedule_attachment_processing([attachment])
+    
+    return jsonify(attachment.to_dict()), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    user = User.query.get(session['user_id'])
+    upload = UploadSession.query.get_or_404(upload_id)
+    if not user or upload.created_by != user.username:
+        return jsonify({'error': 'Only the uploader can abort this upload'}), 403
+    if upload.status == 'uploading':
+        discard_upload(upload)
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify({'message': 'Upload aborted'})
 
 @app.route('/api/issues/<int:issue_id>/add-testcase-path', methods=['POST'])
 @login_required
@@ -789,10 +1364,11 @@ def add_testcase_path(issue_id):
             }), 400
     
     # Parse the path to extract release and platform
-    release, platform = Issue.parse_testcase_path(testcase_path)
+    parsed_path = parse_path(testcase_path)
+    release, platform = parsed_path.release, parsed_path.platform
     
     # Extract bucket name from testcase path and add as tag to the issue
-    bucket_name = Issue.extract_bucket_name(testcase_path)
+    bucket_name = parsed_path.bucket
     if bucket_name:
         # Check if bucket name is already a tag for this issue
         existing_tag_names = [tag.name for tag in issue.tags]
@@ -812,6 +1388,7 @@ def add_testcase_path(issue_id):
         testcase_path=testcase_path,
         release=release,
         platform=platform,
+        bucket=bucket_name,
         added_by=added_by
     )
     
@@ -849,6 +1426,14 @@ def health_check():
 def not_found(error):
     return jsonify({'error': 'Resource not found'}), 404
 
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({'error': error.description or 'Uploaded file is too large'}), 413
+
+@app.errorhandler(415)
+def unsupported_media_type(error):
+    return jsonify({'error': error.description or 'Unsupported file type'}), 415
+
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
@@ -0,0 +1,135 @@
+"""
+Saved searches with materialized result sets.
+
+A saved search stores its query in the search query language, and the ids of
+the issues matching it live in saved_search_results. The results are
+computed with SQL once, when the search is saved. After that
+update_saved_searches() follows the change log: every changed issue is
+loaded once and evaluated in memory against each saved query (Node.matches),
+and only the rows whose membership changed are written, so keeping hundreds
+of searches current costs one pass over the changes rather than hundreds of
+queries. A search's change_id is its cursor watermark (see changefeed.py):
+changes past it may be applied again, which only re-evaluates the same
+issues. Each result row records the latest change read when it was added,
+which makes "new since last view" the rows added after the owner's last
+view.
+
+Catching up runs when a user reads their saved searches and covers only
+that user's searches. Their rows are locked for it (SELECT ... FOR UPDATE),
+so concurrent requests from the same user take turns instead of applying
+the same changes twice, and a search too far behind is recomputed with SQL
+rather than replaying the log within the request.
+"""
+
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+
+from app import db
+from changefeed import ChangeCursor, changed_issues, is_pruned_past, latest_change_id, stable_change_id
+from models import Issue, SavedSearch, SavedSearchResult
+from search_query import QueryError, parse_query, plan_query
+
+SYNC_BATCH_SIZE = 500
+MAX_SYNC_BATCHES = 10  # A search further behind is recomputed instead
+WRITE_BATCH_SIZE = 1000
+
+results_table = SavedSearchResult.__table__
+
+
+def _write(saved_search_id, added, removed, change_ids):
+    """Insert and delete result rows; `change_ids` maps added issue ids to the change that added them"""
+    rows = [{'saved_search_id': saved_search_id, 'issue_id': issue_id, 'added_change_id': change_ids[issue_id]}
+            for issue_id in added]
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        db.session.execute(results_table.insert(), rows[start:start + WRITE_BATCH_SIZE])
+    removed = list(removed)
+    for start in range(0, len(removed), WRITE_BATCH_SIZE):
+        db.session.execute(results_table.delete().where(
+            results_table.c.saved_search_id == saved_search_id,
+            results_table.c.issue_id.in_(removed[start:start + WRITE_BATCH_SIZE])
+        ))
+
+
+def materialize(saved_search):
+    """Recompute the results of `saved_search` with SQL; rows that stay keep their added change"""
+    change_id = stable_change_id()  # Read first: a change racing the query is applied again later
+    matching = {issue_id for (issue_id,) in
+                db.session.query(Issue.id).filter(plan_query(parse_query(saved_search.query_text)).filter)}
+    current = {issue_id for (issue_id,) in
+               db.session.query(SavedSearchResult.issue_id).filter_by(saved_search_id=saved_search.id)}
+    added = matching - current
+    _write(saved_search.id, added, current - matching, dict.fromkeys(added, change_id))
+    saved_search.change_id = change_id
+
+
+def _apply(searches, changes):
+    refreshed, deleted = changed_issues(changes)
+    last_id = max(change.id for change in changes)  # Late arrivals come first in a batch
+    issues = []
+    if refreshed:
+        issues = (Issue.query
+                  .options(selectinload(Issue.additional_paths), selectinload(Issue.comments))
+                  .filter(Issue.id.in_(refreshed))
+                  .all())
+    if deleted:
+        db.session.execute(results_table.delete().where(results_table.c.issue_id.in_(deleted)))
+    current = set()
+    if issues:
+        current = set(db.session.query(SavedSearchResult.saved_search_id, SavedSearchResult.issue_id).filter(
+            SavedSearchResult.saved_search_id.in_([search.id for search, _ in searches]),
+            SavedSearchResult.issue_id.in_([issue.id for issue in issues])
+        ))
+    for search, node in searches:
+        added, removed = [], []
+        for issue in issues:
+            matched = node.matches(issue)
+            if matched and (search.id, issue.id) not in current:
+                added.append(issue.id)
+            elif not matched and (search.id, issue.id) in current:
+                removed.append(issue.id)
+        _write(search.id, added, removed, dict.fromkeys(added, last_id))
+
+
+def update_saved_searches(user_id):
+    """Bring the results of `user_id`'s saved searches up to the latest change"""
+    latest = latest_change_id()
+    searches = (SavedSearch.query
+                .filter(SavedSearch.user_id == user_id, SavedSearch.change_id < latest)
+                .order_by(SavedSearch.id)
+                .with_for_update()
+                .all())
+    # One check for the common case where no search has fallen behind the pruned log
+    pruned = bool(searches) and is_pruned_past(min(search.change_id for search in searches))
+    following = []
+    for search in searches:
+        try:
+            if latest - search.change_id > SYNC_BATCH_SIZE * MAX_SYNC_BATCHES or (
+                    pruned and is_pruned_past(search.change_id)):
+                materialize(search)
+            else:
+                following.append((search, parse_query(search.query_text)))
+        except QueryError:
+            continue  # Saved before its query text was guaranteed to parse; its results stay as they were
+    if following:
+        cursor = ChangeCursor(min(search.change_id for search, _ in following))
+        for _ in range(MAX_SYNC_BATCHES):
+            changes = cursor.read(SYNC_BATCH_SIZE)
+            if not changes:
+                break
+            _apply(following, changes)
+            cursor.advance(changes)
+        for search, _ in following:
+            search.change_id = max(search.change_id, cursor.watermark)
+    db.session.commit()
+
+
+def result_counts(searches):
+    """{saved search id: (total, new since last view)} for `searches`"""
+    if not searches:
+        return {}
+    new = db.case((SavedSearchResult.added_change_id > SavedSearch.viewed_change_id, 1), else_=0)
+    rows = (db.session.query(SavedSearchResult.saved_search_id, func.count(), func.sum(new))
+            .join(SavedSearch, SavedSearch.id == SavedSearchResult.saved_search_id)
+            .filter(SavedSearchResult.saved_search_id.in_([search.id for search in searches]))
+            .group_by(SavedSearchResult.saved_search_id))
+    return {search_id: (total, int(new_count or 0)) for search_id, total, new_count in rows}
@@ -0,0 +1,664 @@
+"""
+Search query language.
+
+    status:open severity:>=High bucket:GUI target:25.11-* "timeout error" -tag:flaky
+
+A query is a sequence of clauses, all of which must match. A clause is a
+bare word or "quoted phrase" (matched against titles, descriptions, test
+case ids and testcase paths), or field:value with an optional comparison
+(field:>=value, field:<value, ...). `*` in a value is a wildcard, `-`
+negates a clause, `OR` joins alternatives and parentheses group them.
+Free text keeps working: word:value with an unknown field is a word, a
+stray quote is part of its word, and text whose parentheses or OR don't
+parse is searched as plain words. Within quotes, \\" and \\\\ escape.
+
+parse_query() builds an AST whose nodes compile to SQLAlchemy expressions
+(to_sql) and can also be evaluated against a loaded Issue (matches). Field
+clauses become predicates on indexed columns where there is one; text terms
+use the trigram index for paths (ILIKE when it can't answer: still loading,
+terms under three characters, too many candidates) and ILIKE for titles and
+descriptions.
+plan_query() returns the compiled filter with an explanation of the plan.
+"""
+
+from datetime import datetime, timedelta
+import re
+
+from app import db
+from text_index import comment_matches
+from models import Comment, Issue, Tag, TestcasePath
+from trigram_index import issues_containing
+
+STATUSES = ('open', 'in_progress', 'resolved', 'closed', 'ccr')
+SEVERITIES = ('Low', 'Medium', 'High', 'Critical')
+OPERATORS = ('>=', '<=', '>', '<', '=')
+MAX_CLAUSES = 50
+MAX_DEPTH = 20  # Nested parentheses and negations
+MAX_BOOSTED = 1000  # Issues matched by a verified solution that sort ahead of the rest
+
+_TOKEN_RE = re.compile(r'''
+    (?:
+        (?P<open>\()
+      | (?P<close>\))
+      | (?P<negate>-)(?=\S)
+      | (?P<field>[A-Za-z_]+):(?P<op>>=|<=|>|<|=)?(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<value>\S*))
+      | "(?P<phrase>(?:[^"\\]|\\.)*)"
+      | (?P<word>\S+)
+    )''', re.VERBOSE)
+_UNESCAPE_RE = re.compile(r'\\(["\\])')
+_BARE_WORD_RE = re.compile(r'\S+')
+
+
+class QueryError(Exception):
+    def __init__(self, message, position=None):
+        super().__init__(message)
+        self.position = position
+
+
+class _GroupingError(QueryError):
+    """Parentheses or OR that don't form a query; the text is searched as plain words instead"""
+
+
+def _like_pattern(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace('*', '%')
+
+
+def _quote(value):
+    return '"' + re.sub(r'(["\\])', r'\\\1', value) + '"'
+
+
+def _word_end(text, start, end):
+    """End of the bare word text[start:end] once closing parentheses it did not open are left off"""
+    word = text[start:end]
+    trailing = len(word) - len(word.rstrip(')'))
+    unmatched = word.count(')') - word.count('(')
+    return end - max(0, min(trailing, unmatched))
+
+
+def _wildcard_re(value):
+    return re.compile('^' + '.*'.join(re.escape(part) for part in value.split('*')) + '$', re.IGNORECASE | re.DOTALL)
+
+
+# --- AST -----------------------------------------------------------------
+
+class Node:
+    def to_sql(self):
+        raise NotImplementedError
+
+    def matches(self, issue):
+        raise NotImplementedError
+
+    def clauses(self):
+        """Leaf clauses, for planning and explain"""
+        return []
+
+    def terms(self):
+        """Text terms an issue can match by (those not under a negation)"""
+        return [clause for clause in self.clauses() if isinstance(clause, Text)]
+
+
+class And(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def to_sql(self):
+        return db.and_(*(child.to_sql() for child in self.children))
+
+    def matches(self, issue):
+        return all(child.matches(issue) for child in self.children)
+
+    def clauses(self):
+        return [clause for child in self.children for clause in child.clauses()]
+
+    def terms(self):
+        return [term for child in self.children for term in child.terms()]
+
+    def __str__(self):
+        return ' '.join(f'({child})' if isinstance(child, Or) else str(child) for child in self.children)
+
+
+class Or(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def to_sql(self):
+        return db.or_(*(child.to_sql() for child in self.children))
+
+    def matches(self, issue):
+        return any(child.matches(issue) for child in self.children)
+
+    def clauses(self):
+        return [clause for child in self.children for clause in child.clauses()]
+
+    def terms(self):
+        return [term for child in self.children for term in child.terms()]
+
+    def __str__(self):
+        return ' OR '.join(str(child) for child in self.children)
+
+
+class Not(Node):
+    def __init__(self, child):
+        self.child = child
+
+    def to_sql(self):
+        return db.not_(self.child.to_sql())
+
+    def matches(self, issue):
+        return not self.child.matches(issue)
+
+    def clauses(self):
+        return self.child.clauses()
+
+    def terms(self):
+        return []
+
+    def __str__(self):
+        child = str(self.child)
+        return f'-({child})' if isinstance(self.child, (And, Or)) else f'-{child}'
+
+
+class Text(Node):
+    """
+    A word or phrase matched as a substring of the title, description, test
+    case ids or a path, or as consecutive words of a comment
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._matches = {}
+
+    def _lookup(self, name, lookup):
+        if name not in self._matches:
+            self._matches[name] = lookup(self.text)
+        return self._matches[name]
+
+    def path_matches(self):
+        return self._lookup('paths', issues_containing)
+
+    def comment_matches(self):
+        """{issue id: (score, comment id, verified)} from the comment index, or None"""
+        return self._lookup('comments', comment_matches)
+
+    def to_sql(self):
+        pattern = f'%{_like_pattern(self.text)}%'
+        conditions = [
+            Issue.testcase_title.ilike(pattern, escape='\\'),
+            Issue.description.ilike(pattern, escape='\\'),
+            Issue.test_case_ids.ilike(pattern, escape='\\')
+        ]
+        paths = self.path_matches()
+        if paths is None:
+            additional = db.session.query(TestcasePath.issue_id).filter(
+                TestcasePath.testcase_path.ilike(pattern, escape='\\'))
+            conditions.append(Issue.testcase_path.ilike(pattern, escape='\\'))
+            conditions.append(Issue.id.in_(additional))
+        elif paths:
+            conditions.append(Issue.id.in_(paths))
+        comments = self.comment_matches()
+        if comments is None:
+            conditions.append(Issue.comments.any(Comment.content.ilike(pattern, escape='\\')))
+        elif comments:
+            conditions.append(Issue.id.in_(list(comments)))
+        return db.or_(*conditions)
+
+    def matches(self, issue):
+        text = self.text.lower()
+        fields = [issue.testcase_title, issue.description, issue.test_case_ids, issue.testcase_path]
+        fields += [path.testcase_path for path in issue.additional_paths]
+        fields += [comment.content for comment in issue.comments]
+        return any(text in (field or '').lower() for field in fields)
+
+    def clauses(self):
+        return [self]
+
+    def explain(self):
+        paths = self.path_matches()
+        comments = self.comment_matches()
+        return {
+            'text': self.text,
+            'strategy': 'ILIKE scan of title, description and test case ids'
+                        + (f'; trigram index matched {len(paths)} issues by path' if paths is not None
+                           else '; ILIKE scan of testcase paths')
+                        + (f'; comment index matched {len(comments)} issues' if comments is not None
+                           else '; ILIKE scan of comments')
+        }
+
+    def __str__(self):
+        # Quoted where it would otherwise parse as something else
+        return _quote(self.text) if re.search(r'^-|^(OR|AND)$|[\s():"]', self.text) else self.text
+
+
+class Field(Node):
+    def __init__(self, spec, op, value, raw):
+        self.spec = spec
+        self.op = op
+        self.value = value
+        self.raw = raw
+
+    def to_sql(self):
+        return self.spec.to_sql(self.op, self.value)
+
+    def matches(self, issue):
+        return self.spec.matches(issue, self.op, self.value)
+
+    def clauses(self):
+        return [self]
+
+    def explain(self):
+        return {
+            'field': self.spec.name,
+            'op': self.op,
+            'value': self.raw,
+            'index': self.spec.index
+        }
+
+    def __str__(self):
+        raw = _quote(self.raw) if not self.raw or re.search(r'^[<>=]|[\s()"]', self.raw) else self.raw
+        return f"{self.spec.name}:{'' if self.op == '=' else self.op}{raw}"
+
+
+# --- Fields --------------------------------------------------------------
+
+class FieldSpec:
+    """A searchable field: how to validate a value, compile it to SQL and evaluate it"""
+    def __init__(self, name, column, index=None, nullable=True, ordered=False):
+        self.name = name
+        self.column = column
+        self.index = index
+        self.nullable = nullable
+        self.ordered = ordered
+
+    def parse(self, op, value):
+        if op != '=' and not self.ordered:
+            raise QueryError(f'{self.name} does not support {op} comparisons')
+        if not value:
+            raise QueryError(f'{self.name} needs a value')
+        return value
+
+    def predicate(self, column, op, value):
+        if op == '=':
+            if '*' in value:
+                return column.like(_like_pattern(value), escape='\\')
+            return column == value
+        return {'>=': column >= value, '<=': column <= value, '>': column > value, '<': column < value}[op]
+
+    def to_sql(self, op, value):
+        predicate = self.predicate(self.column, op, value)
+        # Keep NULLs out of three-valued logic so a negated clause still matches them
+        return db.and_(self.column.isnot(None), predicate) if self.nullable else predicate
+
+    def value_of(self, issue):
+        return getattr(issue, self.column.key)
+
+    def compare(self, actual, op, value):
+        if actual is None:
+            return False
+        if op == '=':
+            if isinstance(value, str) and '*' in value:
+                return bool(_wildcard_re(value).match(str(actual)))
+            return str(actual).lower() == str(value).lower() if isinstance(value, str) else actual == value
+        return {'>=': actual >= value, '<=': actual <= value, '>': actual > value, '<': actual < value}[op]
+
+    def matches(self, issue, op, value):
+        return self.compare(self.value_of(issue), op, value)
+
+
+class EnumField(FieldSpec):
+    def __init__(self, name, column, values, index=None, ordered=False):
+        super().__init__(name, column, index=index, nullable=False, ordered=ordered)
+        self.values = values
+
+    def parse(self, op, value):
+        value = super().parse(op, value)
+        canonical = {choice.lower(): choice for choice in self.values}.get(value.lower())
+        if canonical is None:
+            raise QueryError(f"Unknown {self.name} '{value}'. Use one of: {', '.join(self.values)}")
+        return canonical
+
+    def _allowed(self, op, value):
+        rank = self.values.index(value)
+        return {
+            '=': [value],
+            '>=': self.values[rank:], '>': self.values[rank + 1:],
+            '<=': self.values[:rank + 1], '<': self.values[:rank]
+        }[op]
+
+    def to_sql(self, op, value):
+        # Orderings become an IN list, which the column index can serve
+        allowed = self._allowed(op, value)
+        return self.column == allowed[0] if len(allowed) == 1 else self.column.in_(allowed)
+
+    def matches(self, issue, op, value):
+        return self.value_of(issue) in self._allowed(op, value)
+
+
+class NumberField(FieldSpec):
+    def __init__(self, name, column, index=None):
+        super().__init__(name, column, index=index, nullable=False, ordered=True)
+
+    def parse(self, op, value):
+        try:
+            return int(super().parse(op, value))
+        except ValueError:
+            raise QueryError(f'{self.name} needs a whole number, not {value!r}')
+
+    def predicate(self, column, op, value):
+        return column == value if op == '=' else super().predicate(column, op, value)
+
+
+class DateField(FieldSpec):
+    """Dates match the whole day: created:2024-05-01, created:>=2024-05-01, updated:<2024-06-01T12:00"""
+
+    def __init__(self, name, column, index=None):
+        super().__init__(name, column, index=index, ordered=True)
+
+    def parse(self, op, value):
+        value = super().parse(op, value)
+        try:
+            start = datetime.fromisoformat(value)
+        except ValueError:
+            raise QueryError(f'{self.name} needs a date like 2024-05-01, not {value!r}')
+        end = start + timedelta(days=1) if len(value) == 10 else start
+        return start, end
+
+    def predicate(self, column, op, value):
+        start, end = value
+        day = end != start
+        return {
+            '=': db.and_(column >= start, column < end) if day else column == start,
+            '>': column >= end if day else column > start,
+            '>=': column >= start,
+            '<': column < start,
+            '<=': column < end if day else column <= start
+        }[op]
+
+    def compare(self, actual, op, value):
+        if actual is None:
+            return False
+        start, end = value
+        day = end != start
+        return {
+            '=': start <= actual < end if day else actual == start,
+            '>': actual >= end if day else actual > start,
+            '>=': actual >= start,
+            '<': actual < start,
+            '<=': actual < end if day else actual <= start
+        }[op]
+
+
+class BucketField(FieldSpec):
+    """Bucket of the primary or any additional testcase path"""
+
+    def parse(self, op, value):
+        return super().parse(op, value).upper()
+
+    def to_sql(self, op, value):
+        additional = db.session.query(TestcasePath.issue_id).filter(self.predicate(TestcasePath.bucket, op, value))
+        return db.or_(db.and_(Issue.bucket.isnot(None), self.predicate(Issue.bucket, op, value)),
+                      Issue.id.in_(additional))
+
+    def matches(self, issue, op, value):
+        buckets = [issue.bucket] + [path.bucket for path in issue.additional_paths]
+        return any(self.compare(bucket, op, value) for bucket in buckets)
+
+
+class PathField(FieldSpec):
+    """Primary or additional testcase path; without a wildcard, any path containing the value"""
+
+    def to_sql(self, op, value):
+        if '*' not in value:
+            value = f'*{value}*'
+        additional = db.session.query(TestcasePath.issue_id).filter(self.predicate(TestcasePath.testcase_path, op, value))
+        return db.or_(self.predicate(Issue.testcase_path, op, value), Issue.id.in_(additional))
+
+    def matches(self, issue, op, value):
+        if '*' not in value:
+            value = f'*{value}*'
+        paths = [issue.testcase_path] + [path.testcase_path for path in issue.additional_paths]
+        return any(self.compare(path, op, value) for path in paths)
+
+
+class TagField(FieldSpec):
+    def to_sql(self, op, value):
+        return Issue.tags.any(self.predicate(Tag.name, op, value))
+
+    def matches(self, issue, op, value):
+        return any(self.compare(tag.name, op, value) for tag in issue.tags)
+
+
+FIELDS = {spec.name: spec for spec in [
+    EnumField('status', Issue.status, STATUSES, index='idx_status'),
+    EnumField('severity', Issue.severity, SEVERITIES, ordered=True),
+    BucketField('bucket', Issue.bucket, index='idx_bucket'),
+    # Releases are same-width numbers ('251', '261'), so they compare as strings
+    FieldSpec('release', Issue.release, index='idx_issues_release', ordered=True),
+    FieldSpec('platform', Issue.platform, index='idx_issues_platform'),
+    FieldSpec('build', Issue.build),
+    FieldSpec('target', Issue.target),
+    FieldSpec('reporter', Issue.reporter_name, nullable=False),
+    FieldSpec('reviewer', Issue.reviewer_name),
+    FieldSpec('test_case_id', Issue.test_case_ids, index='idx_test_case_id', nullable=False),
+    TagField('tag', Tag.name, index='issue_tags primary key'),
+    PathField('path', Issue.testcase_path, nullable=False),
+    DateField('created', Issue.created_at, index='idx_created_at'),
+    DateField('updated', Issue.updated_at),
+    NumberField('id', Issue.id, index='PRIMARY'),
+]}
+ALIASES = {'is': 'status', 'reporter_name': 'reporter', 'tc': 'test_case_id', 'tags': 'tag', 'created_at': 'created'}
+
+
+# --- Parser --------------------------------------------------------------
+
+def _tokenize(text, plain=False):
+    """
+    Tokens of `text`. Parentheses within a word belong to it. With `plain`,
+    parentheses, OR and AND are ordinary text and only fields, phrases and
+    negation are recognized.
+    """
+    tokens = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position == len(text):
+            return tokens
+        match = _TOKEN_RE.match(text, position)
+        start = position
+        end = match.end()
+        if match.group('field'):
+            if match.group('quoted') is not None:
+                value = _UNESCAPE_RE.sub(r'\1', match.group('quoted'))
+            else:
+                if not plain:
+                    end = _word_end(text, match.start('value'), end)
+                value = text[match.start('value'):end]
+            tokens.append(('field', (match.group('field'), match.group('op') or '=', value, text[start:end]), start))
+        elif match.group('phrase') is not None:
+            phrase = _UNESCAPE_RE.sub(r'\1', match.group('phrase'))
+            if phrase.strip() or not plain:
+                tokens.append(('text', phrase, start))
+        elif match.group('word') or plain and not match.group('negate'):
+            end = _BARE_WORD_RE.match(text, start).end() if plain else _word_end(text, start, end)
+            word = text[start:end]
+            tokens.append(('or' if word == 'OR' and not plain else 'and' if word == 'AND' and not plain else 'text',
+                           word, start))
+        else:
+            kind = next(name for name in ('open', 'close', 'negate') if match.group(name))
+            tokens.append((kind, None, start))
+        position = end
+
+
+class _Parser:
+    def __init__(self, tokens, length):
+        self.tokens = tokens
+        self.index = 0
+        self.length = length
+        self.clauses = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else (None, None, self.length)
+
+    def take(self):
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def expression(self):
+        alternatives = [self.conjunction()]
+        while self.peek()[0] == 'or':
+            self.take()
+            alternatives.append(self.conjunction())
+        return alternatives[0] if len(alternatives) == 1 else Or(alternatives)
+
+    def conjunction(self):
+        children = []
+        while self.peek()[0] not in (None, 'or', 'close'):
+            if self.peek()[0] == 'and':
+                self.take()
+                continue
+            children.append(self.unary())
+        if not children:
+            raise _GroupingError('Expected a search term', self.peek()[2])
+        return children[0] if len(children) == 1 else And(children)
+
+    def nested(self, position, parse):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise QueryError(f'Queries are limited to {MAX_DEPTH} levels of nesting', position)
+        node = parse()
+        self.depth -= 1
+        return node
+
+    def unary(self):
+        kind, value, position = self.take()
+        if kind == 'negate':
+            return Not(self.nested(position, self.unary))
+        if kind == 'open':
+            node = self.nested(position, self.expression)
+            if self.take()[0] != 'close':
+                raise _GroupingError("Missing ')'", position)
+            return node
+        self.clauses += 1
+        if self.clauses > MAX_CLAUSES:
+            raise QueryError(f'Queries are limited to {MAX_CLAUSES} clauses', position)
+        if kind == 'text':
+            if not value.strip():
+                raise _GroupingError('Empty phrase', position)
+            return Text(value)
+        if kind == 'field':
+            name, op, raw, token = value
+            spec = FIELDS.get(ALIASES.get(name.lower(), name.lower()))
+            if spec is None:
+                return Text(token)  # Not a field: "Error: timeout", a URL, a Windows path
+            try:
+                return Field(spec, op, spec.parse(op, raw), raw)
+            except QueryError as e:
+                raise QueryError(str(e), position)
+        raise _GroupingError(f"Unexpected {'OR' if kind == 'or' else repr(')')}", position)
+
+
+def _parse(text, plain):
+    tokens = _tokenize(text, plain)
+    if not tokens:
+        return None
+    parser = _Parser(tokens, len(text))
+    node = parser.expression()
+    if parser.index < len(tokens):
+        raise _GroupingError("Unexpected ')'", parser.peek()[2])
+    return node
+
+
+def parse_query(text):
+    """
+    AST for a query string, or None for an empty query. Text whose
+    parentheses or OR don't parse is searched as plain words; QueryError is
+    raised for invalid values of known fields and for queries over the limits.
+    """
+    try:
+        return _parse(text or '', plain=False)
+    except _GroupingError:
+        return _parse(text, plain=True)
+
+
+# Structured filters accepted as separate request parameters, alongside the query language
+FILTER_PARAMS = {
+    'status': 'status', 'severity': 'severity', 'release': 'release', 'platform': 'platform',
+    'bucket': 'bucket', 'build': 'build', 'target': 'target', 'test_case_id': 'test_case_id',
+    'reporter_name': 'reporter'
+}
+
+
+def parse_search(text, params, tags=()):
+    """
+    AST for a query string ANDed with the filter parameters in `params`,
+    issues with any of `tags`, and from_date/to_date; None if all are empty
+    """
+    clauses = [parse_query(text)]
+    for param, field in FILTER_PARAMS.items():
+        if params.get(param):
+            clauses.append(field_clause(field, params[param]))
+    clauses.append(combine([field_clause('tag', tag.strip()) for tag in tags if tag.strip()], operator=Or))
+    if params.get('from_date'):
+        clauses.append(field_clause('created', params['from_date'], op='>='))
+    if params.get('to_date'):
+        clauses.append(field_clause('created', params['to_date'], op='<='))
+    return combine(clauses)
+
+
+def field_clause(name, value, op='='):
+    """A clause for a single structured filter (e.g. a legacy ?status= parameter)"""
+    spec = FIELDS[name]
+    return Field(spec, op, spec.parse(op, str(value)), str(value))
+
+
+def combine(nodes, operator=And):
+    """`operator` (And or Or) of the non-empty `nodes`; None if there are none"""
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else operator(nodes)
+
+
+# --- Planning ------------------------------------------------------------
+
+class Plan:
+    def __init__(self, node):
+        self.node = node
+        self.filter = node.to_sql() if node is not None else db.true()
+        self.terms = node.terms() if node is not None else []
+        # Best matching comment per issue over the text terms
+        self.comment_hits = {}
+        for term in self.terms:
+            for issue_id, hit in (term.comment_matches() or {}).items():
+                if issue_id not in self.comment_hits or hit[0] > self.comment_hits[issue_id][0]:
+                    self.comment_hits[issue_id] = hit
+
+    def order_by(self):
+        """Newest first, after the issues whose verified solution matched, best match first"""
+        verified = sorted((hit[0], issue_id) for issue_id, hit in self.comment_hits.items() if hit[2])
+        boosted = [issue_id for _, issue_id in reversed(verified[-MAX_BOOSTED:])]
+        if not boosted:
+            return [Issue.created_at.desc()]
+        rank = db.case({issue_id: i for i, issue_id in enumerate(boosted)}, value=Issue.id, else_=len(boosted))
+        return [rank, Issue.created_at.desc()]
+
+    def explain(self, query=None):
+        clauses = self.node.clauses() if self.node is not None else []
+        plan = {
+            'query': str(self.node) if self.node is not None else '',
+            'predicates': [clause.explain() for clause in clauses if isinstance(clause, Field)],
+            'text_terms': [clause.explain() for clause in clauses if isinstance(clause, Text)],
+        }
+        if query is not None:
+            try:
+                plan['sql'] = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            except Exception:
+                plan['sql'] = str(query.statement)
+        return plan
+
+
+def plan_query(node):
+    return Plan(node)
@@ -0,0 +1,177 @@
+"""
+Bulk serialization of issue lists, with sparse fieldsets.
+
+Issue.to_dict() runs two queries per issue for its additional testcase paths
+and loads every comment to count them, which suits a single issue page but
+turns a list of N issues into 3N+1 queries and ships every full description.
+Lists are serialized here instead: project() loads only the columns the
+requested fields need (and no relationships unless asked for), and
+serialize_issues() fills in tags, counts and paths for the whole page with
+one query each.
+
+Fields are requested with `fields=a,b,c` or a named view; `summary` is what
+the issue list cards show, `full` is Issue.to_dict().
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.orm import lazyload, load_only, selectinload
+
+from app import db
+from models import Attachment, Comment, Issue, TestcasePath
+
+PREVIEW_LENGTH = 200
+MAX_BATCH_SIZE = 1000  # Issues per batch request, which also bounds the IN lists
+
+COLUMN_FIELDS = (
+    'id', 'testcase_title', 'testcase_path', 'severity', 'test_case_ids', 'release', 'platform', 'bucket',
+    'build', 'target', 'description', 'additional_comments', 'reporter_name', 'reviewer_name', 'status',
+    'ccr_number', 'created_at', 'updated_at', 'upvotes', 'downvotes'
+)
+# Computed per issue, from these columns
+DERIVED_FIELDS = {
+    'platform_display': ('platform',),
+    'score': ('upvotes', 'downvotes'),
+    'description_preview': (),  # Selected as a SQL substring, without loading the description
+}
+# Filled in for the whole page with one query each
+BULK_FIELDS = ('tags', 'comment_count', 'has_verified_solution', 'testcase_count', 'additional_testcase_paths')
+FIELDS = COLUMN_FIELDS + tuple(DERIVED_FIELDS) + BULK_FIELDS
+# What Issue.to_dict() returns
+FULL_FIELDS = tuple(field for field in FIELDS if field != 'description_preview')
+# Related records, loaded for the whole page with one query each when asked for
+RELATED_FIELDS = ('comments', 'attachments')
+# Also accepted by GET /api/issues/<id>
+DETAIL_FIELDS = RELATED_FIELDS + ('same_signature_issues',)
+
+VIEWS = {
+    'summary': (
+        'id', 'testcase_title', 'testcase_path', 'severity', 'test_case_ids', 'release', 'platform',
+        'platform_display', 'bucket', 'build', 'target', 'reporter_name', 'reviewer_name', 'status', 'ccr_number',
+        'created_at', 'updated_at', 'upvotes', 'downvotes', 'score', 'tags', 'comment_count',
+        'has_verified_solution', 'testcase_count', 'description_preview'
+    ),
+    'full': None,  # Issue.to_dict()
+}
+
+
+class FieldsError(Exception):
+    pass
+
+
+def resolve_fields(fields=None, view='summary', extra=()):
+    """
+    Field names to serialize, from a `fields` list or comma-separated string,
+    else the named `view` (None for the full Issue.to_dict()). `extra` names
+    endpoint-specific fields that are also accepted.
+    """
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if fields:
+        unknown = [field for field in fields if field not in FIELDS and field not in extra]
+        if unknown:
+            raise FieldsError(f"Unknown field: {', '.join(map(str, unknown))}. Use any of: {', '.join(FIELDS + tuple(extra))}")
+        # Always identify the issue
+        return tuple(dict.fromkeys(['id'] + fields))
+    if view not in VIEWS:
+        raise FieldsError(f"Unknown view '{view}'. Use one of: {', '.join(VIEWS)}")
+    return VIEWS[view]
+
+
+def project(query, fields):
+    """
+    `query` (of Issue) loading only the columns `fields` need. Rows are
+    (issue, description preview or None).
+    """
+    columns = {'id'}
+    for field in fields:
+        if field in COLUMN_FIELDS:
+            columns.add(field)
+        columns.update(DERIVED_FIELDS.get(field, ()))
+    query = query.options(
+        load_only(*(getattr(Issue, column) for column in columns)),
+        selectinload(Issue.tags) if 'tags' in fields else lazyload(Issue.tags)
+    )
+    preview = func.substr(Issue.description, 1, PREVIEW_LENGTH) if 'description_preview' in fields else db.null()
+    return query.add_columns(preview)
+
+
+def _value(issue, field):
+    value = getattr(issue, field)
+    if field in ('created_at', 'updated_at'):
+        return value.isoformat() if value else None
+    return value
+
+
+def related_records(issue_ids, fields):
+    """{issue id: {'comments': [...], 'attachments': [...]}} for the RELATED_FIELDS in `fields`"""
+    related = {issue_id: {} for issue_id in issue_ids}
+    if not issue_ids:
+        return related
+    if 'comments' in fields:
+        for entry in related.values():
+            entry['comments'] = []
+        # Newest first, as GET /api/issues/<id> lists them
+        comments = Comment.query.filter(Comment.issue_id.in_(issue_ids)).order_by(Comment.created_at.desc())
+        for comment in comments:
+            related[comment.issue_id]['comments'].append(comment.to_dict())
+    if 'attachments' in fields:
+        for entry in related.values():
+            entry['attachments'] = []
+        for attachment in Attachment.query.filter(Attachment.issue_id.in_(issue_ids)).order_by(Attachment.id):
+            related[attachment.issue_id]['attachments'].append(attachment.to_dict())
+    return related
+
+
+def serialize_issues(rows, fields):
+    """Dicts of `fields` for the (issue, preview) rows of a projected query"""
+    issue_ids = [issue.id for issue, _ in rows]
+    comment_stats = {}
+    paths = defaultdict(list)
+    path_counts = {}
+    if issue_ids and {'comment_count', 'has_verified_solution'} & set(fields):
+        comment_stats = {
+            issue_id: (count, bool(verified)) for issue_id, count, verified in
+            db.session.query(Comment.issue_id, func.count(Comment.id), func.max(Comment.is_verified_solution))
+            .filter(Comment.issue_id.in_(issue_ids))
+            .group_by(Comment.issue_id)
+        }
+    if issue_ids and 'additional_testcase_paths' in fields:
+        for path in TestcasePath.query.filter(TestcasePath.issue_id.in_(issue_ids)).order_by(TestcasePath.id):
+            paths[path.issue_id].append(path.to_dict())
+        path_counts = {issue_id: len(issue_paths) for issue_id, issue_paths in paths.items()}
+    elif issue_ids and 'testcase_count' in fields:
+        path_counts = dict(
+            db.session.query(TestcasePath.issue_id, func.count(TestcasePath.id))
+            .filter(TestcasePath.issue_id.in_(issue_ids))
+            .group_by(TestcasePath.issue_id)
+        )
+
+    related = {}
+    if set(RELATED_FIELDS) & set(fields):
+        related = related_records(issue_ids, fields)
+
+    computed = {
+        'platform_display': lambda issue: Issue.get_platform_display_name(issue.platform) if issue.platform else None,
+        'score': lambda issue: (issue.upvotes or 0) - (issue.downvotes or 0),
+        'tags': lambda issue: [tag.name for tag in issue.tags],
+        'comment_count': lambda issue: comment_stats.get(issue.id, (0, False))[0],
+        'has_verified_solution': lambda issue: comment_stats.get(issue.id, (0, False))[1],
+        'testcase_count': lambda issue: 1 + path_counts.get(issue.id, 0),
+        'additional_testcase_paths': lambda issue: paths.get(issue.id, []),
+        'comments': lambda issue: related[issue.id]['comments'],
+        'attachments': lambda issue: related[issue.id]['attachments'],
+    }
+    entries = []
+    for issue, preview in rows:
+        entry = {}
+        for field in fields:
+            if field == 'description_preview':
+                entry[field] = preview or ''
+            elif field in computed:
+                entry[field] = computed[field](issue)
+            elif field in COLUMN_FIELDS:
+                entry[field] = _value(issue, field)
+        entries.append(entry)
+    return entries
@@ -0,0 +1,195 @@
+"""
+Attachment serving.
+
+send_attachment() answers GET /api/attachments/<id> with conditional and
+range support (ETag, Last-Modified, 304, 206) via Flask's send_file, which
+hands the open file to the WSGI server's file wrapper (sendfile where the
+server supports it) instead of copying bytes through Python. Deployments
+behind a front proxy can offload the transfer entirely:
+
+  USE_X_SENDFILE = True                          -> X-Sendfile (Apache, lighttpd)
+  ATTACHMENT_ACCEL_REDIRECT_PREFIX = '/_uploads/' -> X-Accel-Redirect (nginx internal location
+                                                    aliased to UPLOAD_FOLDER)
+
+Content-addressed blobs never change, so they are served with their SHA-256
+as a strong ETag and a year-long immutable Cache-Control. Blobs stored
+gzip-compressed (see compression.py) are passed through with
+Content-Encoding when the client accepts gzip, and decompressed on the fly
+(still honouring Range) when it does not.
+
+`?size=<px>` on an image returns a cached thumbnail (see thumbnails.py), as
+WebP when the browser advertises support for it.
+"""
+
+import gzip
+import io
+import os
+
+from flask import request, send_file, make_response, Response
+from werkzeug.http import quote_header_value
+from PIL import Image
+
+from app import app
+from storage import attachment_store, CHUNK_SIZE
+from thumbnails import get_thumbnail, snap_size
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+IMAGE_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+}
+
+
+def attachment_mime_type(attachment):
+    """MIME type recorded for an attachment, falling back to its image extension"""
+    if attachment.mime_type:
+        return attachment.mime_type
+    extension = os.path.splitext(attachment.filename or '')[1].lower()
+    return IMAGE_MIME_TYPES.get(extension)
+
+
+def is_image_attachment(attachment):
+    mime_type = attachment_mime_type(attachment)
+    return bool(mime_type and mime_type.startswith('image/'))
+
+
+def absolute_path(file_path):
+    """Attachment paths are recorded relative to the backend directory"""
+    return os.path.join(app.root_path, file_path)
+
+
+def accepts_encoding(encoding):
+    return encoding in request.accept_encodings
+
+
+def stored_encoding(attachment, path):
+    """
+    How the blob is actually stored on disk. Falls back to probing for the
+    compressed copy, since an upload that deduplicated against a blob while it
+    was being compressed may have recorded the identity encoding.
+    """
+    if attachment.content_encoding == 'gzip':
+        return 'gzip'
+    if not os.path.exists(path) and os.path.exists(path + '.gz'):
+        return 'gzip'
+    return None
+
+
+def send_attachment(attachment, force_download=False):
+    mime_type = attachment_mime_type(attachment)
+    inline = is_image_attachment(attachment) and not force_download
+    path = absolute_path(attachment.file_path)
+    immutable = bool(attachment.content_hash)
+    etag = attachment.content_hash or True
+    content_encoding = None
+
+    # Pass compressed blobs through; ranges always address the identity bytes
+    if stored_encoding(attachment, path) == 'gzip':
+        if inline or request.range or not accepts_encoding('gzip'):
+            return send_decompressed(attachment, path + '.gz', mime_type, inline)
+        path = path + '.gz'
+        content_encoding = 'gzip'
+        if attachment.content_hash:
+            etag = f'{attachment.content_hash}-gz'
+
+    accel_prefix = app.config.get('ATTACHMENT_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        response = accel_redirect_response(path, accel_prefix)
+        response.mimetype = mime_type or 'application/octet-stream'
+        if not inline:
+            response.headers['Content-Disposition'] = (
+                f'attachment; filename={quote_header_value(attachment.filename)}'
+            )
+        if isinstance(etag, str):
+            response.set_etag(etag)
+        response.last_modified = attachment.created_at
+        response = response.make_conditional(request)
+    else:
+        response = send_file(
+            path,
+            mimetype=mime_type,
+            as_attachment=not inline,
+            download_name=attachment.filename,
+            conditional=True,
+            etag=etag,
+            last_modified=attachment.created_at,
+            max_age=IMMUTABLE_MAX_AGE if immutable else None,
+        )
+
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+
+def send_decompressed(attachment, gz_path, mime_type, inline):
+    """Stream a gzip-stored blob as identity bytes, with Range and conditional support"""
+    gz_file = gzip.open(gz_path, 'rb')
+    response = Response(
+        _read_chunks(gz_file),
+        mimetype=mime_type or 'application/octet-stream',
+        direct_passthrough=True
+    )
+    response.content_length = attachment.file_size
+    if not inline:
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename={quote_header_value(attachment.filename)}'
+        )
+    if attachment.content_hash:
+        response.set_etag(attachment.content_hash)
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    response.last_modified = attachment.created_at
+    response.vary.add('Accept-Encoding')
+    # A range over the identity bytes skips forward through the chunks
+    return response.make_conditional(request, accept_ranges=True, complete_length=attachment.file_size)
+
+
+def _read_chunks(source):
+    # A generator rather than wrap_file: a server's sendfile file wrapper
+    # would send the compressed file underneath a GzipFile
+    with source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def accel_redirect_response(path, prefix):
+    """Empty response telling nginx to serve `path` from its internal uploads location"""
+    relative = os.path.relpath(path, attachment_store.base).replace(os.sep, '/')
+    response = make_response('')
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative
+    return response
+
+
+def send_thumbnail(attachment, requested_size):
+    """Serve a size-bucketed thumbnail of an image, or the original if it is small"""
+    want_webp = 'image/webp' in request.headers.get('Accept', '')
+    try:
+        source, mime_type = get_thumbnail(absolute_path(attachment.file_path), requested_size, want_webp)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Could not render thumbnail for attachment {attachment.id}: {e}")
+        source = None
+    if source is None:
+        return send_attachment(attachment)
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    etag = f'{attachment.content_hash or attachment.id}-{snap_size(requested_size)}-{mime_type.split("/")[1]}'
+    response = send_file(
+        source,
+        mimetype=mime_type,
+        conditional=True,
+        etag=etag,
+        last_modified=attachment.created_at,
+        max_age=IMMUTABLE_MAX_AGE if attachment.content_hash else None,
+    )
+    response.vary.add('Accept')
+    if attachment.content_hash:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
@@ -0,0 +1,279 @@
+"""
+Failure signatures for log attachments.
+
+When a text log is uploaded, a background task finds the first error in it,
+the stack frames that follow and any assertion text, masks the volatile parts
+(addresses, timestamps, paths, ids, numbers) and stores the result with a
+SHA-1 fingerprint in attachment_signatures. Two runs failing the same way
+produce the same fingerprint even when they ran on different hosts, at
+different times and from different work directories, so "other issues with
+this failure" and clustering open issues become indexed lookups.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+
+from sqlalchemy import func
+
+from app import app, db
+from compression import is_text_attachment
+from models import Attachment, AttachmentSignature, Issue
+from serving import absolute_path, stored_encoding
+
+app.config.setdefault('SIGNATURE_SCAN_BYTES', 64 * 1024 * 1024)
+app.config.setdefault('SIGNATURE_CONTEXT_LINES', 60)
+app.config.setdefault('SIGNATURE_MAX_FRAMES', 5)
+
+MAX_LINE_LENGTH = 1000
+
+ERROR_RE = re.compile(
+    r'(\bERROR\b|\bFATAL\b|\bFAIL(ED|URE)?\b|\bError\b:|Exception\b|^Traceback \(most recent call last\)'
+    r'|Segmentation fault|core dumped|\bpanic:|\bAssertion\b.*\bfailed\b)'
+)
+TRACEBACK_RE = re.compile(r'^Traceback \(most recent call last\)')
+EXCEPTION_RE = re.compile(r'^([\w.]+(Error|Exception|Exit|Interrupt))\b:?(.*)$')
+ASSERTION_RE = re.compile(r'assert', re.IGNORECASE)
+
+# Stack frame formats: Python, gdb/C backtraces, Java/JVM, Tcl
+FRAME_RES = (
+    re.compile(r'^\s*File "(?:[^"]*/)?([^"/]+)", line \d+, in (\S+)'),
+    re.compile(r'^\s*#\d+\s+(?:0x[0-9a-fA-F]+ in )?([\w:~<>]+)\s*\(.*?\)(?: at (?:\S*/)?(\S+?):\d+)?'),
+    re.compile(r'^\s*at ([\w$.<>]+)\((?:([\w$]+\.\w+):\d+|[^)]*)\)'),
+    re.compile(r'^\s*\(procedure "([^"]+)" line \d+\)()'),
+)
+
+# Applied in order; earlier masks protect their matches from later ones
+VOLATILE_PATTERNS = (
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'), '<TS>'),
+    (re.compile(r'\b(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun) (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d+ \d{2}:\d{2}:\d{2}(?: \w+)?(?: \d{4})?'), '<TS>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b'), '<TS>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<ID>'),
+    (re.compile(r'(?:[A-Za-z]:\\|~?/)[^\s:\'",;()\[\]]*'), '<PATH>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<ADDR>'),
+    (re.compile(r'\b[0-9a-fA-F]{8,}\b'), '<HEX>'),
+    (re.compile(r'\b\d+(?:\.\d+)*\b'), '<N>'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize_line(line):
+    """Mask volatile tokens so equivalent failures compare equal"""
+    line = line[:MAX_LINE_LENGTH]
+    for pattern, replacement in VOLATILE_PATTERNS:
+        line = pattern.sub(replacement, line)
+    return line.strip()
+
+
+def _parse_frame(line):
+    for pattern in FRAME_RES:
+        match = pattern.match(line)
+        if match:
+            function, location = match.group(1), match.group(2)
+            return f'{function} ({location})' if location else function
+    return None
+
+
+def extract_signature(lines):
+    """
+    Build a signature from an iterable of decoded log lines.
+    Returns a dict with first_error, frames, assertion, signature and
+    fingerprint, or None when the log contains no recognizable failure.
+    """
+    context_lines = app.config['SIGNATURE_CONTEXT_LINES']
+    error = None
+    frames = []
+    assertion = None
+    in_traceback = False
+    python_traceback = False
+    remaining = None
+
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        if error is None and remaining is None:
+            if not ERROR_RE.search(line):
+                continue
+            in_traceback = python_traceback = bool(TRACEBACK_RE.match(line))
+            if not in_traceback:
+                error = normalize_line(line)
+            remaining = context_lines
+            if ASSERTION_RE.search(line):
+                assertion = normalize_line(line)
+            continue
+
+        remaining -= 1
+        if remaining < 0:
+            break
+        frame = _parse_frame(line)
+        if frame:
+            frames.append(frame)
+            continue
+        if assertion is None and line.strip() and ASSERTION_RE.search(line):
+            assertion = normalize_line(line)
+        if in_traceback:
+            if not line.startswith((' ', '\t')) and EXCEPTION_RE.match(line.strip()):
+                # The exception line closes a Python traceback
+                error = normalize_line(line)
+                break
+        elif frames:
+            # Any other line ends the backtrace
+            break
+
+    if error is None and not frames:
+        return None
+    if error is None:
+        error = 'Traceback'
+
+    max_frames = app.config['SIGNATURE_MAX_FRAMES']
+    # Python tracebacks list the innermost call last; other formats list it first
+    frames = frames[-max_frames:] if python_traceback else frames[:max_frames]
+    parts = [error] + frames + ([assertion] if assertion and assertion != error else [])
+    signature = '\n'.join(parts)
+    return {
+        'first_error': error,
+        'frames': frames,
+        'assertion': assertion,
+        'signature': signature,
+        'fingerprint': hashlib.sha1(signature.encode('utf-8')).hexdigest(),
+    }
+
+
+def _read_lines(attachment):
+    """Decoded lines of the attachment, stopping after SIGNATURE_SCAN_BYTES"""
+    path = absolute_path(attachment.file_path)
+    if stored_encoding(attachment, path) == 'gzip':
+        source = gzip.open(path + '.gz', 'rb')
+    else:
+        source = open(path, 'rb')
+    limit = app.config['SIGNATURE_SCAN_BYTES']
+    scanned = 0
+    with source:
+        for raw in source:
+            scanned += len(raw)
+            yield raw.decode('utf-8', errors='replace')
+            if scanned >= limit:
+                break
+
+
+def extract_attachment_signature(attachment):
+    """Extract and store the failure signature of a text attachment; returns the row or None"""
+    if not is_text_attachment(attachment):
+        return None
+    existing = AttachmentSignature.query.filter_by(attachment_id=attachment.id).first()
+    if existing:
+        return existing
+
+    # Identical logs share a blob, so reuse a signature already computed for it
+    result = None
+    if attachment.content_hash:
+        twin = (AttachmentSignature.query
+                .join(Attachment, AttachmentSignature.attachment_id == Attachment.id)
+                .filter(Attachment.content_hash == attachment.content_hash)
+                .first())
+        if twin:
+            result = {'first_error': twin.first_error, 'signature': twin.signature, 'fingerprint': twin.fingerprint}
+    if result is None:
+        result = extract_signature(_read_lines(attachment))
+    if result is None:
+        return None
+
+    signature = AttachmentSignature(
+        attachment_id=attachment.id,
+        issue_id=attachment.issue_id,
+        fingerprint=result['fingerprint'],
+        first_error=result['first_error'][:500],
+        signature=result['signature']
+    )
+    db.session.add(signature)
+    db.session.commit()
+    return signature
+
+
+def same_signature_issues(issue_id, limit=20):
+    """Other issues with an attachment sharing a failure fingerprint with this issue"""
+    fingerprints = (db.session.query(AttachmentSignature.fingerprint)
+                    .filter(AttachmentSignature.issue_id == issue_id)
+                    .distinct()
+                    .subquery())
+    rows = (db.session.query(Issue.id, Issue.testcase_title, Issue.status, AttachmentSignature.fingerprint)
+            .join(AttachmentSignature, AttachmentSignature.issue_id == Issue.id)
+            .filter(AttachmentSignature.fingerprint.in_(db.session.query(fingerprints.c.fingerprint)))
+            .filter(Issue.id != issue_id)
+            .distinct()
+            .order_by(Issue.id.desc())
+            .limit(limit)
+            .all())
+    return [
+        {'id': row.id, 'testcase_title': row.testcase_title, 'status': row.status, 'fingerprint': row.fingerprint}
+        for row in rows
+    ]
+
+
+def signature_clusters(statuses=('open',), min_size=2, limit=50, issues_per_cluster=50):
+    """
+    Group issues in `statuses` by failure fingerprint, largest clusters first.
+    Returns a list of {fingerprint, first_error, signature, issue_count, issues}.
+    """
+    issue_count = func.count(func.distinct(AttachmentSignature.issue_id))
+    groups = (db.session.query(AttachmentSignature.fingerprint, issue_count.label('issue_count'))
+              .join(Issue, Issue.id == AttachmentSignature.issue_id)
+              .filter(Issue.status.in_(statuses))
+              .group_by(AttachmentSignature.fingerprint)
+              .having(issue_count >= min_size)
+              .order_by(issue_count.desc(), AttachmentSignature.fingerprint)
+              .limit(limit)
+              .all())
+    if not groups:
+        return []
+
+    fingerprints = [group.fingerprint for group in groups]
+    members = (db.session.query(AttachmentSignature.fingerprint, AttachmentSignature.first_error,
+                                AttachmentSignature.signature, Issue.id, Issue.testcase_title, Issue.status)
+               .join(Issue, Issue.id == AttachmentSignature.issue_id)
+               .filter(AttachmentSignature.fingerprint.in_(fingerprints), Issue.status.in_(statuses))
+               .order_by(Issue.id.desc())
+               .all())
+
+    clusters = {group.fingerprint: {
+        'fingerprint': group.fingerprint,
+        'first_error': None,
+        'signature': None,
+        'issue_count': group.issue_count,
+        'issues': []
+    } for group in groups}
+    seen = set()
+    for row in members:
+        cluster = clusters[row.fingerprint]
+        if cluster['signature'] is None:
+            cluster['first_error'] = row.first_error
+            cluster['signature'] = row.signature
+        if (row.fingerprint, row.id) in seen or len(cluster['issues']) >= issues_per_cluster:
+            continue
+        seen.add((row.fingerprint, row.id))
+        cluster['issues'].append({'id': row.id, 'testcase_title': row.testcase_title, 'status': row.status})
+    return [clusters[fingerprint] for fingerprint in fingerprints]
+
+
+def backfill_signatures(batch_size=500):
+    """Extract signatures for existing text attachments that have none; returns the number stored"""
+    stored = 0
+    last_id = 0
+    while True:
+        batch = (Attachment.query
+                 .filter(Attachment.id > last_id)
+                 .order_by(Attachment.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        for attachment in batch:
+            last_id = attachment.id
+            try:
+                if extract_attachment_signature(attachment) is not None:
+                    stored += 1
+            except OSError as e:
+                db.session.rollback()
+                print(f"Error extracting signature for attachment {attachment.id}: {e}")
+        db.session.expunge_all()
+    return stored
@@ -0,0 +1,142 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many people open the same list at once, every request would run the
+same query. coalesced(key, compute) lets the first request for a key compute
+the response payload while identical requests arriving in the meantime wait
+for it and share the result, so N concurrent requests cost one query. Only
+requests that overlap an in-flight computation share it; nothing is cached
+beyond that, so a result is never older than the query that produced it.
+
+With COALESCE_ACROSS_WORKERS, the computing request also takes a file lock
+(one of LOCK_STRIPES under INDEX_FOLDER/coalesce), so identical requests in
+other worker processes wait for it and read its result from a file instead
+of running the query again. Payloads shared that way must be JSON-serializable.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app import app
+from changefeed import index_path
+
+app.config.setdefault('COALESCE_ACROSS_WORKERS', os.getenv('COALESCE_ACROSS_WORKERS', 'false').lower() == 'true')
+app.config.setdefault('COALESCE_TIMEOUT', 30)  # Seconds to wait for another request before computing anyway
+
+LOCK_STRIPES = 256
+RESULT_TTL = 60  # Seconds before a result file is swept
+LOCK_POLL_INTERVAL = 0.005
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_last_sweep = 0
+
+
+def coalesced(key, compute):
+    """compute(), shared with concurrent calls for the same `key` (a hashable, repr-stable value)"""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        if flight.done.wait(app.config['COALESCE_TIMEOUT']):
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        return compute()
+
+    try:
+        if app.config['COALESCE_ACROSS_WORKERS']:
+            flight.result = _across_workers(key, compute)
+        else:
+            flight.result = compute()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _across_workers(key, compute):
+    text = repr(key)
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    folder = index_path('coalesce')
+    os.makedirs(folder, exist_ok=True)
+    result_path = os.path.join(folder, f'{digest}.json')
+    started = time.time()
+    with open(os.path.join(folder, f'{int(digest, 16) % LOCK_STRIPES}.lock'), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is computing this key (or one sharing its stripe)
+            if _wait_for_lock(lock, started + app.config['COALESCE_TIMEOUT']):
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                found, result = _read_result(result_path, text, started)
+                if found:
+                    return result
+            return compute()
+        try:
+            result = compute()
+            _write_result(result_path, text, result)
+            return result
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _wait_for_lock(lock, deadline):
+    while time.time() < deadline:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            time.sleep(LOCK_POLL_INTERVAL)
+    return False
+
+
+def _read_result(path, key, since):
+    """(True, result) if `path` holds a result for `key` written after `since`, else (False, None)"""
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    if entry.get('key') != key or entry.get('written', 0) < since:
+        return False, None
+    return True, entry['result']
+
+
+def _write_result(path, key, result):
+    global _last_sweep
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'key': key, 'written': time.time(), 'result': result}, f)
+    os.replace(tmp, path)
+    # Results are only read by requests that were already waiting; sweep old ones now and then
+    now = time.time()
+    if now - _last_sweep > RESULT_TTL:
+        _last_sweep = now
+        folder = os.path.dirname(path)
+        for name in os.listdir(folder):
+            if name.endswith('.json'):
+                old = os.path.join(folder, name)
+                try:
+                    if now - os.path.getmtime(old) > RESULT_TTL:
+                        os.remove(old)
+                except OSError:
+                    pass
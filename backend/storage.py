@@ -0,0 +1,136 @@
+"""
+Content-addressed attachment store.
+
+Every blob is named by the SHA-256 of its content and lives under a sharded
+layout: <root>/<ab>/<cd>/<sha256>. Identical uploads therefore share a single
+file on disk, and no directory ever holds more than a few thousand entries.
+Writers stream into a private temp file and atomically rename it into place,
+so concurrent uploads of the same content are safe.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+from app import app
+
+CHUNK_SIZE = 64 * 1024
+
+# content_encoding is 'gzip' when the blob is only kept compressed (see compression.py)
+StoredBlob = namedtuple('StoredBlob', ['content_hash', 'size', 'path', 'content_encoding', 'stored_size'])
+
+
+class AttachmentStore:
+    def __init__(self, root, base_dir):
+        # `root` is what gets recorded in attachments.file_path (relative to the
+        # app like the legacy 'uploads/<name>' rows); all I/O goes through `base`.
+        self.root = root
+        self.base = os.path.join(base_dir, root)
+        self.tmp_dir = os.path.join(self.base, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def relative_path(self, content_hash):
+        """Return the sharded path for a content hash, as stored in the database"""
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def blob_path(self, content_hash):
+        """Return the absolute on-disk path for a content hash"""
+        return os.path.join(self.base, content_hash[:2], content_hash[2:4], content_hash)
+
+    def exists(self, content_hash):
+        path = self.blob_path(content_hash)
+        return os.path.exists(path) or os.path.exists(path + '.gz')
+
+    def new_temp_file(self):
+        """Open a private temp file inside the store (same filesystem as the blobs)"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        return os.fdopen(fd, 'w+b'), tmp_path
+
+    def put_stream(self, stream):
+        """
+        Copy a readable stream into the store, hashing it on the way.
+        Returns a StoredBlob describing the (possibly pre-existing) blob.
+        """
+        out, tmp_path = self.new_temp_file()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        return self.commit(tmp_path, digest.hexdigest(), size)
+
+    def commit(self, tmp_path, content_hash, size):
+        """
+        Move a fully written temp file to its content address.
+        If the blob already exists the temp file is discarded (dedup) and the
+        existing blob's mtime is refreshed so cleanup treats it as recently used.
+        """
+        final_path = self.blob_path(content_hash)
+        for stored_path, encoding in ((final_path, None), (final_path + '.gz', 'gzip')):
+            if os.path.exists(stored_path):
+                _remove_quietly(tmp_path)
+                try:
+                    os.utime(stored_path)
+                    stored_size = os.path.getsize(stored_path)
+                except OSError:
+                    continue
+                return StoredBlob(content_hash, size, self.relative_path(content_hash), encoding, stored_size)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # os.replace is atomic; two writers racing on the same hash both
+        # produce identical bytes, so whichever rename lands last is fine.
+        os.replace(tmp_path, final_path)
+        return StoredBlob(content_hash, size, self.relative_path(content_hash), None, size)
+
+    def release(self, content_hash, grace_seconds=3600):
+        """
+        Delete a blob that is no longer referenced by any attachment.
+        Blobs touched within the grace period are kept, since an in-flight
+        upload may have just deduplicated against them.
+        """
+        from models import Attachment
+
+        if not content_hash or Attachment.count_references(content_hash) > 0:
+            return False
+        released = False
+        for path in self.blob_files(content_hash):
+            try:
+                if time.time() - os.path.getmtime(path) < grace_seconds:
+                    return released
+                os.unlink(path)
+                released = True
+            except FileNotFoundError:
+                pass
+        return released
+
+    def blob_files(self, content_hash):
+        """The blob plus every derived file stored next to it (compressed copy, thumbnails)"""
+        path = self.blob_path(content_hash)
+        directory = os.path.dirname(path)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in sorted(names) if name.startswith(content_hash)]
+
+
+def _remove_quietly(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+attachment_store = AttachmentStore(app.config['UPLOAD_FOLDER'], app.root_path)
@@ -0,0 +1,183 @@
+"""
+Typeahead suggestions for titles, tags, buckets, testcase paths, reporters
+and test case ids.
+
+Each kind keeps its distinct values in a list sorted by lowercased value, so
+the values starting with a prefix are one bisect away. Usage counts (how many
+issues use a tag, bucket or reporter) live in a Counter per kind that the
+change log keeps exact: the index remembers what each issue contributed and
+swaps that out when the issue changes. Values first seen after the sorted
+lists were built sit in a small side set that is scanned per query, until a
+background rebuild folds them in. Nothing here touches the database on the
+request path beyond a change log catch-up at most once per SYNC_INTERVAL.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+import heapq
+import threading
+import time
+
+from app import db
+from background import run_in_background
+from changefeed import ChangeCursor, LazyIndex, changed_issues, stable_change_id
+from models import Issue, Tag, TestcasePath
+
+KINDS = ('title', 'tag', 'bucket', 'path', 'reporter', 'test_case_id')
+RANK_SCAN = 5000  # Prefix ranges up to this size are ranked by count, larger ones alphabetically
+REBUILD_THRESHOLD = 2000  # Side-set values that trigger a rebuild of the sorted lists
+SYNC_BATCH_SIZE = 1000
+SYNC_INTERVAL = 1.0  # Seconds between change log catch-ups; keystrokes in between are served from memory
+LOAD_BATCH_SIZE = 5000
+
+
+def _rows(query, id_column, issue_ids, batch_size):
+    if issue_ids is None:
+        return query.yield_per(batch_size)
+    return (row for start in range(0, len(issue_ids), batch_size)
+            for row in query.filter(id_column.in_(issue_ids[start:start + batch_size])).all())
+
+
+def _issue_terms(issue_ids=None, batch_size=LOAD_BATCH_SIZE):
+    """{issue id: [(kind, value), ...]} for `issue_ids` (default: all issues)"""
+    terms = {}
+    issues = db.session.query(Issue.id, Issue.testcase_title, Issue.testcase_path, Issue.bucket,
+                              Issue.reporter_name, Issue.test_case_ids)
+    for issue_id, title, path, bucket, reporter, test_case_ids in _rows(issues, Issue.id, issue_ids, batch_size):
+        entry = terms.setdefault(issue_id, [])
+        entry += [('title', title), ('path', path), ('bucket', bucket), ('reporter', reporter)]
+        entry += [('test_case_id', value.strip()) for value in (test_case_ids or '').split(',')]
+
+    paths = db.session.query(TestcasePath.issue_id, TestcasePath.testcase_path, TestcasePath.bucket)
+    for issue_id, path, bucket in _rows(paths, TestcasePath.issue_id, issue_ids, batch_size):
+        terms.setdefault(issue_id, []).extend([('path', path), ('bucket', bucket)])
+
+    issue_tags = Issue.tags.property.secondary
+    tags = db.session.query(issue_tags.c.issue_id, Tag.name).join(Tag, Tag.id == issue_tags.c.tag_id)
+    for issue_id, name in _rows(tags, issue_tags.c.issue_id, issue_ids, batch_size):
+        terms.setdefault(issue_id, []).append(('tag', name))
+
+    # Each issue counts once per value
+    return {issue_id: sorted({(kind, value) for kind, value in entry if value}) for issue_id, entry in terms.items()}
+
+
+def _prefix_range(keys, prefix):
+    """Slice bounds of the sorted `keys` that start with `prefix`"""
+    if not prefix:
+        return 0, len(keys)
+    start = bisect_left(keys, prefix)
+    return start, bisect_left(keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo=start)
+
+
+def _sorted_values(counter):
+    values = sorted(value for value, count in counter.items() if count > 0)
+    values.sort(key=str.lower)
+    return [value.lower() for value in values], values
+
+
+class SuggestIndex:
+    def __init__(self, issue_terms, change_id):
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self.changes = ChangeCursor(change_id)
+        self.synced_at = time.monotonic()
+        self.issue_terms = issue_terms
+        self.counts = {kind: Counter() for kind in KINDS}
+        for entry in issue_terms.values():
+            for kind, value in entry:
+                self.counts[kind][value] += 1
+        self.sorted = {kind: _sorted_values(self.counts[kind]) for kind in KINDS}
+        self.added = {kind: set() for kind in KINDS}  # Values missing from self.sorted
+
+    def _is_sorted(self, kind, value):
+        keys, values = self.sorted[kind]
+        start, end = _prefix_range(keys, value.lower())
+        return value in values[start:end]
+
+    def _set_issue(self, issue_id, entry):
+        for kind, value in self.issue_terms.pop(issue_id, ()):
+            self.counts[kind][value] -= 1
+        if entry is None:
+            return
+        self.issue_terms[issue_id] = entry
+        for kind, value in entry:
+            counter = self.counts[kind]
+            if counter[value] <= 0 and value not in self.added[kind] and not self._is_sorted(kind, value):
+                self.added[kind].add(value)
+            counter[value] += 1
+
+    def sync(self, max_age=0):
+        """Apply changes from the change log, unless it was read less than `max_age` seconds ago"""
+        if time.monotonic() - self.synced_at < max_age:
+            return
+        with self._lock:
+            self.synced_at = time.monotonic()
+            while True:
+                changes = self.changes.read(SYNC_BATCH_SIZE)
+                if not changes:
+                    break
+                refreshed, deleted = changed_issues(changes)
+                loaded = _issue_terms(issue_ids=list(refreshed)) if refreshed else {}
+                for issue_id in refreshed | deleted:
+                    self._set_issue(issue_id, loaded.get(issue_id))
+                self.changes.advance(changes)
+            rebuild = sum(len(values) for values in self.added.values()) > REBUILD_THRESHOLD and not self._rebuilding
+            if rebuild:
+                self._rebuilding = True
+        if rebuild:
+            run_in_background(self.rebuild)
+
+    def rebuild(self):
+        """Re-sort every kind with the side-set values folded in, then swap"""
+        try:
+            with self._lock:
+                counts = {kind: Counter(counter) for kind, counter in self.counts.items()}
+            rebuilt = {kind: _sorted_values(counts[kind]) for kind in KINDS}
+            with self._lock:
+                self.sorted = rebuilt
+                # Values first seen while sorting stay in the side set
+                for kind in KINDS:
+                    self.added[kind] = {value for value in self.added[kind] if counts[kind][value] <= 0}
+        finally:
+            self._rebuilding = False
+
+    def suggest(self, kind, prefix, limit):
+        """[(value, count)] for values of `kind` starting with `prefix`, case-insensitively"""
+        prefix = prefix.lower()
+        with self._lock:
+            counter = self.counts[kind]
+            keys, values = self.sorted[kind]
+            start, end = _prefix_range(keys, prefix)
+            extra = [value for value in self.added[kind] if value.lower().startswith(prefix)]
+            if end - start + len(extra) <= RANK_SCAN:
+                # Most used first
+                matches = [(value, counter[value]) for value in values[start:end] + extra if counter[value] > 0]
+                return heapq.nsmallest(limit, matches, key=lambda match: (-match[1], match[0].lower()))
+            matches = []
+            for i in range(start, end):
+                value = values[i]
+                if counter[value] > 0:
+                    matches.append((value, counter[value]))
+                    if len(matches) == limit:
+                        break
+            return matches
+
+
+def _load_index():
+    change_id = stable_change_id()
+    return SuggestIndex(_issue_terms(), change_id)
+
+
+suggest_index = LazyIndex(_load_index)
+
+
+def suggest(prefix, kinds=KINDS, limit=10):
+    """{kind: [{'value', 'count'}]} for each of `kinds`; None while the index is loading"""
+    index = suggest_index.get()
+    if index is None:
+        return None
+    index.sync(max_age=SYNC_INTERVAL)
+    return {
+        kind: [{'value': value, 'count': count} for value, count in index.suggest(kind, prefix, limit)]
+        for kind in kinds
+    }
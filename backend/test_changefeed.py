@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for ChangeCursor (changefeed.py): changes committed out of id order
+are still read, and ids that never commit stop holding the watermark back.
+"""
+
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp())
+
+from app import app, db  # noqa: E402
+from changefeed import GAP_TIMEOUT, ChangeCursor, stable_change_id  # noqa: E402
+from models import ChangeLog  # noqa: E402
+
+
+@pytest.fixture
+def change_log():
+    with app.app_context():
+        ChangeLog.__table__.create(db.engine, checkfirst=True)
+        db.session.query(ChangeLog).delete()
+        db.session.commit()
+
+        def add(change_id, age=timedelta()):
+            db.session.execute(ChangeLog.__table__.insert(), [{
+                'id': change_id, 'entity': 'issue', 'entity_id': change_id, 'issue_id': change_id,
+                'action': 'update', 'created_at': datetime.now() - age
+            }])
+            db.session.commit()
+
+        yield add
+        db.session.remove()
+
+
+def read(cursor):
+    changes = cursor.read()
+    cursor.advance(changes)
+    return [change.id for change in changes]
+
+
+def test_late_commit_is_read(change_log):
+    for change_id in (1, 2, 4, 5):
+        change_log(change_id)
+    cursor = ChangeCursor()
+    assert read(cursor) == [1, 2, 4, 5]
+    assert cursor.watermark == 2
+    assert stable_change_id() == 2
+
+    change_log(3)  # Its transaction took id 3 before 4 and 5 but committed after them
+    assert read(cursor) == [3]
+    assert cursor.watermark == 5
+    assert read(cursor) == []
+
+
+def test_unused_ids_expire(change_log):
+    change_log(1)
+    change_log(5, age=GAP_TIMEOUT * 2)  # Ids 2-4 were rolled back long ago
+    change_log(9)
+    cursor = ChangeCursor()
+    assert read(cursor) == [1, 5, 9]
+    assert cursor.watermark == 5
+    assert read(cursor) == []
+
+
+def test_starts_past_position(change_log):
+    for change_id in range(1, 6):
+        change_log(change_id)
+    cursor = ChangeCursor(3)
+    assert read(cursor) == [4, 5]
+    assert cursor.watermark == 5
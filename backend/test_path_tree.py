@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the testcase path tree (path_tree.py): nodes count distinct issues,
+stay correct as paths are added, moved, edited and removed, and match a full
+rebuild.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp())
+
+from app import app, db  # noqa: E402
+import models  # noqa: E402
+from models import Issue, PathNode  # noqa: E402
+from path_tree import rebuild_tree  # noqa: E402
+
+
+@pytest.fixture
+def session():
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+def add_issue(session, path, *additional_paths):
+    issue = Issue(testcase_title='t', testcase_path=path, severity='Low', test_case_ids='1',
+                  description='d', reporter_name='r')
+    for additional_path in additional_paths:
+        issue.additional_paths.append(models.TestcasePath(testcase_path=additional_path, added_by='r'))
+    session.add(issue)
+    session.commit()
+    return issue
+
+
+def issue_counts():
+    return {node.prefix: node.issue_count for node in PathNode.query}
+
+
+def assert_matches_rebuild():
+    counts = issue_counts()
+    rebuild_tree()
+    assert issue_counts() == counts
+
+
+def test_issue_counted_once_per_node(session):
+    add_issue(session, '/a/b/t1', '/a/b/t2', '/a/c/t3')
+    add_issue(session, '/a/b/t4')
+    assert issue_counts() == {'/a': 2, '/a/b': 2, '/a/c': 1,
+                              '/a/b/t1': 1, '/a/b/t2': 1, '/a/b/t4': 1, '/a/c/t3': 1}
+    assert_matches_rebuild()
+
+
+def test_moved_path(session):
+    first = add_issue(session, '/a/b/t1')
+    second = add_issue(session, '/a/b/t2')
+    path = models.TestcasePath(issue_id=second.id, testcase_path='/a/c/t3', added_by='r')
+    session.add(path)
+    session.commit()
+    assert issue_counts()['/a/c'] == 1
+
+    path.issue = first
+    session.commit()
+    assert issue_counts()['/a/c'] == 1
+    assert_matches_rebuild()
+
+
+def test_edited_and_deleted(session):
+    first = add_issue(session, '/a/b/t1', '/a/c/t2')
+    add_issue(session, '/a/b/t3')
+    first.testcase_path = '/z/t1'
+    session.commit()
+    assert issue_counts()['/a/b'] == 1
+    assert issue_counts()['/z'] == 1
+    assert_matches_rebuild()
+
+    session.delete(first)
+    session.commit()
+    assert issue_counts() == {'/a': 1, '/a/b': 1, '/a/b/t3': 1}
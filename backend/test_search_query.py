@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the search query parser (search_query.py): what free text parses
+to, which queries are rejected, and that str() of a query parses back to
+the same query (saved searches store it that way).
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Import the backend the way run_app.py does, without a database or upload folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp())
+
+from app import app  # noqa: E402,F401  (routes must load before search_query)
+from search_query import And, Field, Not, Or, QueryError, Text, parse_query, parse_search  # noqa: E402
+
+
+def texts(node):
+    return [clause.text for clause in node.clauses() if isinstance(clause, Text)]
+
+
+def test_fields_and_grouping():
+    node = parse_query('status:open (severity:>=High OR tag:flaky) -"timeout error"')
+    assert isinstance(node, And)
+    status, alternatives, negated = node.children
+    assert isinstance(status, Field) and status.value == 'open'
+    assert isinstance(alternatives, Or) and alternatives.children[0].value == 'High'
+    assert isinstance(negated, Not) and negated.child.text == 'timeout error'
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('AssertionError: timeout', ['AssertionError:', 'timeout']),
+    ('http://ci.example.com/job/42', ['http://ci.example.com/job/42']),
+    ('C:\\builds\\log.txt', ['C:\\builds\\log.txt']),
+    ("<script>alert('xss')</script>", ["<script>alert('xss')</script>"]),
+    ('!@#$%^&*()_+-=[]{}|;\':",./<>?', ['!@#$%^&*()_+-=[]{}|;\':",./<>?']),
+    ('foo"bar', ['foo"bar']),
+    ('"unterminated phrase', ['"unterminated', 'phrase']),
+    ('missing (paren', ['missing', '(paren']),
+    ('extra paren)', ['extra', 'paren)']),
+    ('trailing OR', ['trailing', 'OR']),
+])
+def test_free_text_is_searched_as_text(query, expected):
+    assert texts(parse_query(query)) == expected
+
+
+def test_parentheses_inside_words():
+    node = parse_query('(crash OR f(x))')
+    assert isinstance(node, Or)
+    assert texts(node) == ['crash', 'f(x)']
+
+
+@pytest.mark.parametrize('query', [
+    'status:bogus',
+    'severity:>=Extreme',
+    'id:abc',
+    'created:yesterday',
+    'status:>open',
+    ' '.join(['word'] * 51),
+    '(' * 400,
+    '-' * 400 + 'x',
+])
+def test_rejected_queries(query):
+    with pytest.raises(QueryError):
+        parse_query(query)
+
+
+def test_empty_query():
+    assert parse_query('') is None
+    assert parse_query('   ') is None
+
+
+@pytest.mark.parametrize('query', [
+    'status:open severity:>=High bucket:GUI target:25.11-* "timeout error" -tag:flaky',
+    'a b OR c (d OR -e)',
+    '-(a b) -c',
+    '"a \\"quoted\\" word" "back\\\\slash"',
+    '"OR" "-dash" "key:value" "(paren"',
+    'reporter:"O\\"Brien" reviewer:">x"',
+    'AssertionError: timeout',
+    '!@#$%^&*()_+-=[]{}|;\':",./<>?',
+    'created:>=2024-05-01 updated:<2024-06-01T12:00 id:<=10',
+])
+def test_str_round_trip(query):
+    node = parse_query(query)
+    assert str(parse_query(str(node))) == str(node)
+
+
+@pytest.mark.parametrize('params', [
+    {'reporter_name': 'O"Brien'},
+    {'reporter_name': 'Mary Ann "M" Smith'},
+    {'target': '25.11 (beta)', 'build': '>latest'},
+    {'test_case_id': 'TC\\1'},
+])
+def test_filter_parameters_round_trip(params):
+    node = parse_search('', params)
+    reparsed = parse_query(str(node))
+    assert str(reparsed) == str(node)
+    assert [clause.raw for clause in reparsed.clauses()] == [clause.raw for clause in node.clauses()]
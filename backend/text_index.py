@@ -0,0 +1,247 @@
+"""
+Positional inverted index over issue titles, descriptions and comments.
+
+Every document (an issue's title, its description, each comment) is split
+into lowercased words, and the index maps each word to the documents
+containing it with the word positions in each. The character span of every
+word is kept alongside, so a matched phrase can be highlighted and cut into
+a snippet straight from its positions, without searching the text again.
+
+Comment matches feed /api/search: a query phrase is answered by intersecting
+the postings of its words and checking that they occur consecutively.
+Matching comments are scored with tf-idf (log-scaled phrase count times the
+summed idf of its words); verified solutions are multiplied by
+VERIFIED_BOOST, so an issue whose fix matches ranks above one where the words
+only come up in discussion.
+
+The index is built from the database when first used and follows the change
+log: any change to an issue or its comments (an edit, a new comment, a
+deletion, verifying a solution) reloads that issue's documents, which also
+picks up the bulk un-verify in verify_solution.
+"""
+
+from array import array
+from collections import namedtuple
+from math import log
+import re
+import threading
+
+from app import db
+from changefeed import ChangeCursor, LazyIndex, changed_issues, stable_change_id
+from models import Comment, Issue
+
+WORD_RE = re.compile(r'\w+')
+FIELDS = ('title', 'description', 'comment')
+VERIFIED_BOOST = 2.0
+MAX_MATCHES = 20000  # Issues listed per phrase; broader phrases fall back to SQL
+SNIPPET_LENGTH = 200
+SNIPPET_CONTEXT = 60  # Characters shown before the first highlight
+SYNC_BATCH_SIZE = 1000
+LOAD_BATCH_SIZE = 5000
+
+# starts/ends: character span of each word, by position
+Document = namedtuple('Document', 'issue_id field comment_id verified text starts ends words')
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def _rows(query, issue_column, issue_ids, batch_size):
+    if issue_ids is None:
+        return query.yield_per(batch_size)
+    return (row for start in range(0, len(issue_ids), batch_size)
+            for row in query.filter(issue_column.in_(issue_ids[start:start + batch_size])).all())
+
+
+def _load_documents(issue_ids=None, batch_size=LOAD_BATCH_SIZE):
+    """(issue id, field, comment id, verified, text) for the issues in `issue_ids` (default: all issues)"""
+    issues = db.session.query(Issue.id, Issue.testcase_title, Issue.description)
+    for issue_id, title, description in _rows(issues, Issue.id, issue_ids, batch_size):
+        yield issue_id, 'title', None, False, title
+        yield issue_id, 'description', None, False, description
+    comments = db.session.query(Comment.issue_id, Comment.id, Comment.is_verified_solution, Comment.content)
+    for issue_id, comment_id, verified, content in _rows(comments, Comment.issue_id, issue_ids, batch_size):
+        yield issue_id, 'comment', comment_id, bool(verified), content
+
+
+def _phrase_starts(positions):
+    """Positions where a phrase starts, given the position lists of its words in one document"""
+    following = [set(word_positions) for word_positions in positions[1:]]
+    return [start for start in positions[0]
+            if all(start + offset in word_positions for offset, word_positions in enumerate(following, start=1))]
+
+
+def _merge(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _snippet(document, spans):
+    """Up to SNIPPET_LENGTH characters around the first highlight, with highlight offsets into the snippet"""
+    text = document.text
+    start, end = 0, len(text)
+    if document.field != 'title' and len(text) > SNIPPET_LENGTH:
+        first_start, first_end = spans[0]
+        start = max(0, first_start - SNIPPET_CONTEXT)
+        space = text.find(' ', start, first_start)
+        if start and space != -1:
+            start = space + 1
+        end = min(len(text), max(start + SNIPPET_LENGTH, first_end))
+        space = text.rfind(' ', first_end, end)
+        if end < len(text) and space != -1:
+            end = space
+    prefix = '…' if start else ''
+    suffix = '…' if end < len(text) else ''
+    shift = len(prefix) - start
+    snippet = {
+        'field': document.field,
+        'text': prefix + text[start:end] + suffix,
+        'highlights': [[span_start + shift, span_end + shift] for span_start, span_end in spans
+                       if span_start >= start and span_end <= end]
+    }
+    if document.comment_id is not None:
+        snippet['comment_id'] = document.comment_id
+    return snippet
+
+
+class TextIndex:
+    def __init__(self, documents, change_id):
+        self._lock = threading.Lock()
+        self.changes = ChangeCursor(change_id)
+        self.documents = {}  # document id -> Document
+        self.by_issue = {}  # issue id -> document ids
+        self.postings = {}  # word -> {document id: positions}
+        self.comment_count = 0
+        self._next_id = 0
+        for document in documents:
+            self._add(*document)
+
+    def _add(self, issue_id, field, comment_id, verified, text):
+        doc_id = self._next_id
+        self._next_id += 1
+        text = text or ''
+        starts, ends = array('l'), array('l')
+        positions = {}
+        for position, match in enumerate(WORD_RE.finditer(text)):
+            starts.append(match.start())
+            ends.append(match.end())
+            positions.setdefault(match.group().lower(), []).append(position)
+        for word, word_positions in positions.items():
+            self.postings.setdefault(word, {})[doc_id] = word_positions
+        self.documents[doc_id] = Document(issue_id, field, comment_id, verified, text, starts, ends, tuple(positions))
+        self.by_issue.setdefault(issue_id, set()).add(doc_id)
+        if field == 'comment':
+            self.comment_count += 1
+
+    def _remove_issue(self, issue_id):
+        for doc_id in self.by_issue.pop(issue_id, ()):
+            document = self.documents.pop(doc_id)
+            if document.field == 'comment':
+                self.comment_count -= 1
+            for word in document.words:
+                postings = self.postings[word]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[word]
+
+    def sync(self):
+        """Apply changes from the change log"""
+        with self._lock:
+            while True:
+                changes = self.changes.read(SYNC_BATCH_SIZE)
+                if not changes:
+                    break
+                refreshed, deleted = changed_issues(changes)
+                for issue_id in refreshed | deleted:
+                    self._remove_issue(issue_id)
+                for document in _load_documents(issue_ids=list(refreshed)):
+                    self._add(*document)
+                self.changes.advance(changes)
+
+    def search_comments(self, phrase):
+        """
+        {issue id: (score, comment id, verified)} for the best-scoring comment
+        per issue containing `phrase`, or None if the phrase has no words or
+        matches more than MAX_MATCHES issues.
+        """
+        words = tokenize(phrase)
+        if not words:
+            return None
+        with self._lock:
+            lists = [self.postings.get(word) for word in words]
+            if not all(lists):
+                return {}
+            weight = sum(log(1 + max(self.comment_count, 1) / len(postings)) for postings in lists)
+            best = {}
+            for doc_id in min(lists, key=len):
+                document = self.documents[doc_id]
+                if document.field != 'comment' or any(doc_id not in postings for postings in lists):
+                    continue
+                count = len(_phrase_starts([postings[doc_id] for postings in lists]))
+                if not count:
+                    continue
+                score = (1 + log(count)) * weight * (VERIFIED_BOOST if document.verified else 1)
+                issue_id = document.issue_id
+                if issue_id not in best or score > best[issue_id][0]:
+                    best[issue_id] = (score, document.comment_id, document.verified)
+                    if len(best) > MAX_MATCHES:
+                        return None
+            return best
+
+    def snippets(self, issue_id, phrases, comment_id=None):
+        """
+        Snippets of the title, description and comment `comment_id` of an
+        issue that contain any of `phrases`, with the phrases highlighted
+        """
+        phrases = [words for words in map(tokenize, phrases) if words]
+        results = []
+        with self._lock:
+            doc_ids = sorted(self.by_issue.get(issue_id, ()),
+                             key=lambda doc_id: (FIELDS.index(self.documents[doc_id].field), doc_id))
+            for doc_id in doc_ids:
+                document = self.documents[doc_id]
+                if document.field == 'comment' and document.comment_id != comment_id:
+                    continue
+                spans = []
+                for words in phrases:
+                    positions = [self.postings.get(word, {}).get(doc_id) for word in words]
+                    if not all(positions):
+                        continue
+                    for start in _phrase_starts(positions):
+                        spans.append((document.starts[start], document.ends[start + len(words) - 1]))
+                if spans:
+                    results.append(_snippet(document, _merge(spans)))
+        return results
+
+
+def _load_index():
+    change_id = stable_change_id()
+    return TextIndex(_load_documents(), change_id)
+
+
+text_index = LazyIndex(_load_index)
+
+
+def comment_matches(phrase):
+    """Best matching comment per issue for `phrase` (see TextIndex.search_comments), or None if the index can't answer"""
+    index = text_index.get()
+    if index is None:
+        return None
+    index.sync()
+    return index.search_comments(phrase)
+
+
+def issue_snippets(issue_ids, phrases, comment_ids=None):
+    """{issue id: snippets} for `issue_ids` (see TextIndex.snippets); None while the index is loading"""
+    index = text_index.get()
+    if index is None:
+        return None
+    index.sync()
+    comment_ids = comment_ids or {}
+    return {issue_id: index.snippets(issue_id, phrases, comment_ids.get(issue_id)) for issue_id in issue_ids}
@@ -0,0 +1,151 @@
+"""
+Thumbnails for image attachments.
+
+Screenshots are rendered into a few fixed width buckets, each as WebP and as
+JPEG (PNG when the image has transparency), and cached next to the original as
+`<original>.thumb-<size>.<ext>`. They are produced in the background when an
+image is uploaded; a request for a thumbnail that does not exist yet renders it
+on demand and keeps the result in a bounded in-memory LRU, so a burst of views
+of a freshly uploaded image renders it once.
+"""
+
+from collections import OrderedDict
+import io
+import os
+import threading
+
+from PIL import Image, ImageOps
+
+from app import app
+
+SIZE_BUCKETS = (160, 480, 1024)
+
+app.config.setdefault('THUMBNAIL_LRU_BYTES', 64 * 1024 * 1024)
+
+# Refuse to decode absurdly large images (decompression bombs)
+Image.MAX_IMAGE_PIXELS = 100 * 1000 * 1000
+
+
+def snap_size(requested):
+    """Smallest bucket that is at least `requested` pixels wide (capped at the largest)"""
+    for size in SIZE_BUCKETS:
+        if requested <= size:
+            return size
+    return SIZE_BUCKETS[-1]
+
+
+def thumbnail_path(original_path, size, fmt):
+    return f'{original_path}.thumb-{size}.{fmt}'
+
+
+class ThumbnailCache:
+    """LRU of rendered thumbnail bytes, bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.total -= len(previous)
+            self._items[key] = data
+            self.total += len(data)
+            while self.total > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total -= len(evicted)
+
+
+thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_LRU_BYTES'])
+
+
+def _load(original_path):
+    image = Image.open(original_path)
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image, has_alpha
+
+
+def _render(image, size, fmt):
+    thumb = image.copy()
+    thumb.thumbnail((size, size * 4), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == 'webp':
+        thumb.save(out, 'WEBP', quality=80, method=4)
+    elif fmt == 'png':
+        thumb.save(out, 'PNG', optimize=True)
+    else:
+        thumb.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+    os.replace(tmp_path, path)
+
+
+def fallback_format(has_alpha):
+    return 'png' if has_alpha else 'jpg'
+
+
+def generate_thumbnails(original_path):
+    """Render every bucket smaller than the image, in WebP and the fallback format"""
+    image, has_alpha = _load(original_path)
+    for size in SIZE_BUCKETS:
+        if size >= image.width:
+            break
+        for fmt in ('webp', fallback_format(has_alpha)):
+            path = thumbnail_path(original_path, size, fmt)
+            if not os.path.exists(path):
+                _write_atomic(path, _render(image, size, fmt))
+
+
+def get_thumbnail(original_path, requested_size, want_webp):
+    """
+    Return (bytes or path, mime_type) for the thumbnail bucket that fits
+    `requested_size`, rendering it on demand if needed. Returns (None, None)
+    when the original is already no larger than the bucket.
+    """
+    size = snap_size(requested_size)
+    formats = ('webp',) if want_webp else ('jpg', 'png')
+    for fmt in formats:
+        path = thumbnail_path(original_path, size, fmt)
+        if os.path.exists(path):
+            return path, _mime_type(fmt)
+        data = thumbnail_cache.get((original_path, size, fmt))
+        if data is not None:
+            # An empty entry records that the original is small enough already
+            return (data or None), (_mime_type(fmt) if data else None)
+
+    image, has_alpha = _load(original_path)
+    fmt = 'webp' if want_webp else fallback_format(has_alpha)
+    key = (original_path, size, fmt)
+    if size >= image.width:
+        thumbnail_cache.put(key, b'')
+        return None, None
+    data = _render(image, size, fmt)
+    thumbnail_cache.put(key, data)
+    try:
+        _write_atomic(thumbnail_path(original_path, size, fmt), data)
+    except OSError as e:
+        print(f"Could not cache thumbnail for {original_path}: {e}")
+    return data, _mime_type(fmt)
+
+
+def _mime_type(fmt):
+    return {'webp': 'image/webp', 'png': 'image/png', 'jpg': 'image/jpeg'}[fmt]
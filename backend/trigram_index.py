@@ -0,0 +1,346 @@
+"""
+Trigram index over testcase paths and titles.
+
+Every issue contributes one document for its title, one for its primary
+testcase path and one per additional path. Each document is split into
+overlapping three-character grams (lowercased), and the index maps every
+gram to the sorted ids of the documents containing it. A query is answered
+from the postings of its own grams:
+
+- substring: intersect the postings of all its grams, then check the
+  candidates really contain the query (grams can match out of order);
+  matches at the start of the text or of a path segment or word rank as
+  prefix matches.
+- fuzzy: an edit changes at most three grams, so a document within k edits
+  of the query shares at least n - 3k of its n grams. The documents sharing
+  the most grams are checked with a bit-parallel edit distance (Myers) for
+  the best-matching substring.
+
+The base postings are flat numpy arrays (CSR) built in one vectorized pass;
+documents added since then go to an in-memory tail, and replaced or deleted
+documents are masked out. The index is built from the database when first
+used, follows the change log, and compacts itself in the background once the
+tail and masked documents grow past COMPACT_FRACTION of the base.
+"""
+
+import threading
+
+import numpy as np
+
+from app import db
+from background import run_in_background
+from changefeed import ChangeCursor, LazyIndex, changed_issues, stable_change_id
+from models import Issue, TestcasePath
+
+FIELDS = ('title', 'path')
+MIN_QUERY_LENGTH = 3
+MAX_VERIFY = 20000  # Substring candidates checked per query
+VERIFY_DIRECTLY = 256  # Stop intersecting postings below this many candidates
+FUZZY_CANDIDATES = 500  # Documents checked for edit distance per query
+COMPACT_FRACTION = 0.25
+SYNC_BATCH_SIZE = 1000
+LOAD_BATCH_SIZE = 5000
+BOUNDARIES = ('/', ' ', '_', '-', '.')
+
+
+def gram_codes(text):
+    """Distinct trigram codes of an already lowercased string"""
+    return {(ord(text[i]) << 42) | (ord(text[i + 1]) << 21) | ord(text[i + 2]) for i in range(len(text) - 2)}
+
+
+def max_edits(query):
+    """Edits a fuzzy match may need: none for very short queries, at most two"""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+def substring_distance(pattern, text):
+    """Fewest edits turning `pattern` into some substring of `text` (Myers' bit-parallel algorithm)"""
+    m = len(pattern)
+    if not m:
+        return 0
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    best = m
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        if score < best:
+            best = score
+    return best
+
+
+def _build_postings(texts):
+    """(sorted gram codes, offsets, document ids) for documents 0..len(texts)-1"""
+    if not texts:
+        return np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int32)
+    lowered = [text.lower() for text in texts]
+    # One code point array for every document, separated by NULs so no gram spans two
+    chars = np.frombuffer('\0'.join(lowered).encode('utf-32-le'), np.uint32).astype(np.int64)
+    lengths = np.array([len(text) for text in lowered], np.int64)
+    docs = np.repeat(np.arange(len(lowered), dtype=np.int32), lengths + 1)[:len(chars)]
+    grams = (chars[:-2] << 42) | (chars[1:-1] << 21) | chars[2:]
+    valid = (chars[:-2] != 0) & (chars[1:-1] != 0) & (chars[2:] != 0)
+    grams, docs = grams[valid], docs[:len(chars) - 2][valid]
+    order = np.lexsort((docs, grams))
+    grams, docs = grams[order], docs[order]
+    distinct = np.ones(len(grams), bool)
+    distinct[1:] = (grams[1:] != grams[:-1]) | (docs[1:] != docs[:-1])
+    grams, docs = grams[distinct], docs[distinct]
+    keys, starts = np.unique(grams, return_index=True)
+    offsets = np.append(starts, len(grams)).astype(np.int64)
+    return keys, offsets, docs
+
+
+def _load_documents(issue_ids=None, batch_size=LOAD_BATCH_SIZE):
+    """(issue id, field, text) for the titles and testcase paths of `issue_ids` (default: all issues)"""
+    for model, columns in ((Issue, (Issue.testcase_title, Issue.testcase_path)),
+                           (TestcasePath, (TestcasePath.testcase_path,))):
+        issue_column = Issue.id if model is Issue else TestcasePath.issue_id
+        if issue_ids is not None:
+            for start in range(0, len(issue_ids), batch_size):
+                rows = (db.session.query(issue_column, *columns)
+                        .filter(issue_column.in_(issue_ids[start:start + batch_size]))
+                        .all())
+                yield from _documents(rows, model)
+            continue
+        last_id = 0
+        while True:
+            rows = (db.session.query(model.id, issue_column, *columns)
+                    .filter(model.id > last_id)
+                    .order_by(model.id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            yield from _documents([row[1:] for row in rows], model)
+
+
+def _documents(rows, model):
+    for row in rows:
+        if model is Issue:
+            issue_id, title, path = row
+            yield issue_id, 0, title or ''
+            yield issue_id, 1, path or ''
+        else:
+            issue_id, path = row
+            yield issue_id, 1, path or ''
+
+
+class TrigramIndex:
+    def __init__(self, documents, change_id):
+        self._lock = threading.Lock()
+        self._compacting = False
+        self.changes = ChangeCursor(change_id)
+        documents = list(documents)
+        self.issue_ids = np.array([doc[0] for doc in documents], np.int64)
+        self.fields = np.array([doc[1] for doc in documents], np.int8)
+        self.texts = [doc[2] for doc in documents]
+        self.alive = np.ones(len(documents), bool)
+        self.keys, self.offsets, self.postings = _build_postings(self.texts)
+        self.base_size = len(documents)
+        self.tail = {}  # gram code -> ids of tail documents containing it
+
+    def _append(self, documents):
+        if not documents:
+            return
+        first = len(self.texts)
+        for doc_id, (_, _, text) in enumerate(documents, start=first):
+            for code in gram_codes(text.lower()):
+                self.tail.setdefault(code, []).append(doc_id)
+        self.issue_ids = np.concatenate([self.issue_ids, np.array([doc[0] for doc in documents], np.int64)])
+        self.fields = np.concatenate([self.fields, np.array([doc[1] for doc in documents], np.int8)])
+        self.texts.extend(doc[2] for doc in documents)
+        self.alive = np.concatenate([self.alive, np.ones(len(documents), bool)])
+
+    def _remove_issues(self, issue_ids):
+        if issue_ids:
+            self.alive[np.isin(self.issue_ids, list(issue_ids))] = False
+
+    def sync(self):
+        """Apply changes from the change log"""
+        with self._lock:
+            while True:
+                changes = self.changes.read(SYNC_BATCH_SIZE)
+                if not changes:
+                    break
+                refreshed, deleted = changed_issues(changes)
+                self._remove_issues(refreshed | deleted)
+                self._append(list(_load_documents(issue_ids=list(refreshed))))
+                self.changes.advance(changes)
+            stale = len(self.texts) - self.base_size + int((~self.alive[:self.base_size]).sum())
+            compact = stale > COMPACT_FRACTION * max(self.base_size, LOAD_BATCH_SIZE) and not self._compacting
+            if compact:
+                self._compacting = True
+        if compact:
+            run_in_background(self.compact)
+
+    def compact(self):
+        """Rebuild the base postings from the live documents, off the request path"""
+        try:
+            with self._lock:
+                size = len(self.texts)
+                keep = np.flatnonzero(self.alive)
+                documents = [(int(self.issue_ids[i]), int(self.fields[i]), self.texts[i]) for i in keep]
+            keys, offsets, postings = _build_postings([doc[2] for doc in documents])
+            with self._lock:
+                # Documents appended or removed while building are carried over
+                still_alive = self.alive[keep]
+                later = [(int(self.issue_ids[i]), int(self.fields[i]), self.texts[i])
+                         for i in range(size, len(self.texts)) if self.alive[i]]
+                self.issue_ids = self.issue_ids[keep]
+                self.fields = self.fields[keep]
+                self.texts = [doc[2] for doc in documents]
+                self.alive = still_alive
+                self.keys, self.offsets, self.postings = keys, offsets, postings
+                self.base_size = len(documents)
+                self.tail = {}
+                self._append(later)
+        finally:
+            self._compacting = False
+
+    def _postings(self, code):
+        i = np.searchsorted(self.keys, code)
+        base = self.postings[self.offsets[i]:self.offsets[i + 1]] if i < len(self.keys) and self.keys[i] == code else None
+        tail = self.tail.get(code)
+        if tail is None:
+            return base if base is not None else np.zeros(0, np.int32)
+        tail = np.array(tail, np.int32)
+        return tail if base is None else np.concatenate([base, tail])
+
+    def _candidates(self, codes):
+        """(postings of each gram, live documents that may contain all of them); call with the lock held"""
+        lists = sorted((self._postings(code) for code in codes), key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if len(candidates) <= VERIFY_DIRECTLY:
+                break  # Cheaper to check the few left than to intersect long lists
+            candidates = np.intersect1d(candidates, postings)
+        return lists, candidates[self.alive[candidates]]
+
+    def search(self, query, limit=20, fuzzy=True):
+        """
+        Best match per issue as (issue id, field, text, kind, distance), prefix
+        matches first, then substrings, then fuzzy matches by distance.
+        """
+        query = query.lower()
+        codes = gram_codes(query)
+        if not codes:
+            return []
+        with self._lock:
+            lists, candidates = self._candidates(codes)
+            candidates = candidates[:MAX_VERIFY]
+
+            best = {}  # issue id -> (rank key, match)
+
+            def consider(doc_id, kind, distance):
+                issue_id = int(self.issue_ids[doc_id])
+                text = self.texts[doc_id]
+                key = (kind, distance, len(text))
+                if issue_id not in best or key < best[issue_id][0]:
+                    best[issue_id] = (key, (issue_id, FIELDS[self.fields[doc_id]], text, kind, distance))
+
+            matched = set()
+            for doc_id in candidates.tolist():
+                lowered = self.texts[doc_id].lower()
+                if query not in lowered:
+                    continue
+                matched.add(doc_id)
+                prefix = lowered.startswith(query) or any(boundary + query in lowered for boundary in BOUNDARIES)
+                consider(doc_id, 0 if prefix else 1, 0)
+
+            edits = max_edits(query)
+            if fuzzy and edits and len(best) < limit:
+                hits = np.bincount(np.concatenate(lists), minlength=len(self.texts))
+                hits[~self.alive] = 0
+                needed = max(1, len(codes) - 3 * edits)
+                near = np.flatnonzero(hits >= needed)
+                near = near[np.argsort(-hits[near], kind='stable')][:FUZZY_CANDIDATES]
+                for doc_id in near.tolist():
+                    if doc_id in matched:
+                        continue
+                    distance = substring_distance(query, self.texts[doc_id].lower())
+                    if distance <= edits:
+                        consider(doc_id, 2, distance)
+
+        ranked = sorted(best.values(), key=lambda entry: entry[0])
+        return [match for _, match in ranked[:limit]]
+
+    def issue_ids_containing(self, query):
+        """Ids of every issue with `query` in its title or a path, or None if there are too many candidates to check"""
+        query = query.lower()
+        codes = gram_codes(query)
+        if not codes:
+            return None
+        with self._lock:
+            _, candidates = self._candidates(codes)
+            if len(candidates) > MAX_VERIFY:
+                return None
+            return sorted({int(self.issue_ids[doc_id]) for doc_id in candidates.tolist()
+                           if query in self.texts[doc_id].lower()})
+
+
+def _load_index():
+    change_id = stable_change_id()
+    return TrigramIndex(_load_documents(), change_id)
+
+
+trigram_index = LazyIndex(_load_index)
+
+KINDS = ('prefix', 'substring', 'fuzzy')
+
+
+def search_paths_and_titles(query, limit=20, fuzzy=True):
+    """Issues whose title or testcase path matches `query`; None while the index is loading"""
+    index = trigram_index.get()
+    if index is None:
+        return None
+    index.sync()
+    matches = index.search(query, limit=limit, fuzzy=fuzzy)
+    issues = {}
+    if matches:
+        rows = (db.session.query(Issue.id, Issue.testcase_title, Issue.status)
+                .filter(Issue.id.in_([match[0] for match in matches]))
+                .all())
+        issues = {row.id: row for row in rows}
+    return [{
+        'issue_id': issue_id,
+        'testcase_title': issues[issue_id].testcase_title,
+        'status': issues[issue_id].status,
+        'field': field,
+        'text': text,
+        'match': KINDS[kind],
+        'distance': distance
+    } for issue_id, field, text, kind, distance in matches if issue_id in issues]
+
+
+def issues_containing(query):
+    """
+    Ids of all issues with `query` in a title or path, or None if the index
+    can't answer it (not ready, too short, too broad); callers then scan the
+    paths with ILIKE
+    """
+    if len(query.strip()) < MIN_QUERY_LENGTH:
+        return None
+    index = trigram_index.get()
+    if index is None:
+        return None
+    index.sync()
+    return index.issue_ids_containing(query.strip())
@@ -0,0 +1,266 @@
+"""
+Streaming multipart uploads.
+
+Werkzeug normally spools every uploaded part into a SpooledTemporaryFile (in
+memory up to 500KB) before the view runs, and the view then copies it again.
+StreamingUploadRequest instead hands the multipart parser a HashingSpool that
+writes each chunk straight into a temp file inside the attachment store while
+hashing and counting it. Size and type limits are checked as soon as a part's
+headers arrive (type) and on every chunk (size), so oversized or disallowed
+uploads are rejected without ever being buffered in full.
+
+Files larger than a single request (regression logs, core dumps) use the
+resumable chunked protocol instead: an UploadSession records how many chunks
+have been written and verified into <store>/tmp/<upload_id>.part, so an
+interrupted client can ask where to resume and carry on from there.
+"""
+
+import hashlib
+import os
+import re
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from app import app
+from storage import attachment_store
+
+app.config.setdefault('MAX_ATTACHMENT_SIZE', 16 * 1024 * 1024)
+app.config.setdefault('UPLOAD_ALLOWED_EXTENSIONS', {
+    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp',
+    'pdf', 'txt', 'log', 'out', 'csv', 'json', 'xml', 'html', 'diff', 'patch',
+    'zip', 'gz', 'tgz', 'tar', 'bz2', 'xz', 'core',
+})
+# Files without an extension are accepted only for these MIME families
+app.config.setdefault('UPLOAD_ALLOWED_MIME_PREFIXES', ('image/', 'text/'))
+# Whole filenames allowed regardless of extension: core dumps are named core or core.<pid>
+app.config.setdefault('UPLOAD_ALLOWED_NAME_PATTERN', re.compile(r'core(\.\d+)?', re.IGNORECASE))
+# Chunked uploads: whole-file cap and chunk size bounds (each chunk is one request)
+app.config.setdefault('MAX_CHUNKED_UPLOAD_SIZE', 4 * 1024 * 1024 * 1024)
+app.config.setdefault('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+app.config.setdefault('UPLOAD_MIN_CHUNK_SIZE', 256 * 1024)
+
+
+def check_upload_allowed(filename, content_type):
+    """Raise UnsupportedMediaType unless the file type is on the allow-list"""
+    if app.config['UPLOAD_ALLOWED_NAME_PATTERN'].fullmatch(os.path.basename(filename or '')):
+        return
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension:
+        if extension in app.config['UPLOAD_ALLOWED_EXTENSIONS']:
+            return
+    elif content_type and content_type.startswith(app.config['UPLOAD_ALLOWED_MIME_PREFIXES']):
+        return
+    raise UnsupportedMediaType(f'File type not allowed: {filename}')
+
+
+def check_upload_size(size):
+    """Raise RequestEntityTooLarge once an upload exceeds the per-file limit"""
+    max_size = app.config['MAX_ATTACHMENT_SIZE']
+    if max_size and size > max_size:
+        raise RequestEntityTooLarge(f'File exceeds the upload limit of {max_size} bytes')
+
+
+class HashingSpool:
+    """
+    Writable/readable temp file in the attachment store that tracks the
+    SHA-256 and size of everything written to it. Committing moves the file
+    to its content address without copying; an uncommitted spool deletes its
+    temp file when closed.
+    """
+
+    def __init__(self):
+        self._file, self.tmp_path = attachment_store.new_temp_file()
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        try:
+            check_upload_size(self.size)
+        except RequestEntityTooLarge:
+            self.close()
+            raise
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def commit(self):
+        """Finish writing and move the spool into the store; returns a StoredBlob"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.committed = True
+        return attachment_store.commit(self.tmp_path, self.content_hash, self.size)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            self.committed = True
+            try:
+                os.unlink(self.tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        check_upload_allowed(filename, content_type)
+        if content_length:
+            check_upload_size(content_length)
+        return HashingSpool()
+
+
+def store_upload(file):
+    """Move an uploaded FileStorage into the attachment store; returns a StoredBlob"""
+    if isinstance(file.stream, HashingSpool):
+        return file.stream.commit()
+    # Uploads that did not go through the streaming parser (e.g. tests
+    # passing a plain stream) are hashed while being copied into the store.
+    check_upload_allowed(file.filename, file.content_type)
+    return attachment_store.put_stream(file.stream)
+
+
+class ChunkError(Exception):
+    """A chunk was rejected; carries the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+SHA256_RE = re.compile(r'[0-9a-fA-F]{64}')
+
+
+def choose_chunk_size(requested):
+    """Clamp a client-requested chunk size to what a single request can carry"""
+    max_chunk = min(app.config['UPLOAD_CHUNK_SIZE'] * 2, app.config['MAX_CONTENT_LENGTH'] or 2 ** 31)
+    if requested is None:
+        return min(app.config['UPLOAD_CHUNK_SIZE'], max_chunk)
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        raise ChunkError('chunk_size must be a positive integer')
+    if requested <= 0:
+        raise ChunkError('chunk_size must be a positive integer')
+    return max(app.config['UPLOAD_MIN_CHUNK_SIZE'], min(requested, max_chunk))
+
+
+def check_sha256(value, name):
+    """The lower-cased hex digest, or ChunkError if `value` is not 64 hex characters"""
+    if not isinstance(value, str) or not SHA256_RE.fullmatch(value):
+        raise ChunkError(f'{name} must be a SHA-256 hex digest (64 hex characters)')
+    return value.lower()
+
+
+def upload_part_path(upload_id):
+    return os.path.join(attachment_store.tmp_dir, f'{upload_id}.part')
+
+
+def write_chunk(upload, index, stream, expected_checksum):
+    """
+    Stream one chunk of an upload session to its offset in the part file,
+    verifying its SHA-256 against `expected_checksum`. Chunks must arrive in
+    order; a chunk that was already accepted is acknowledged without being
+    rewritten, which makes client retries after a lost response harmless.
+    Returns True if the chunk was newly written.
+    """
+    if index < upload.chunks_received:
+        return False
+    if index > upload.chunks_received:
+        raise ChunkError(f'Expected chunk {upload.chunks_received}, got {index}', 409)
+    if index >= upload.total_chunks:
+        raise ChunkError('Chunk index is past the end of the file')
+    if not expected_checksum:
+        raise ChunkError('X-Chunk-SHA256 header is required')
+    expected_checksum = check_sha256(expected_checksum, 'X-Chunk-SHA256')
+
+    expected_length = upload.expected_chunk_length(index)
+    offset = index * upload.chunk_size
+    part_path = upload_part_path(upload.id)
+    digest = hashlib.sha256()
+    length = 0
+    try:
+        # Only the first chunk creates the part file; a later chunk with no
+        # file to extend would leave a hole where the earlier chunks were.
+        part = open(part_path, 'r+b' if index else 'w+b')
+    except FileNotFoundError:
+        raise ChunkError('The chunks received so far are gone; start a new upload', 410)
+    with part:
+        part.seek(offset)
+        while True:
+            data = stream.read(64 * 1024)
+            if not data:
+                break
+            length += len(data)
+            if length > expected_length:
+                break
+            digest.update(data)
+            part.write(data)
+        ok = length == expected_length and digest.hexdigest() == expected_checksum
+        # Never leave unverified bytes behind: the file always ends at the
+        # last good chunk, which is exactly where a resumed upload restarts.
+        part.truncate(offset + (expected_length if ok else 0))
+        if ok:
+            part.flush()
+            os.fsync(part.fileno())
+
+    if length != expected_length:
+        raise ChunkError(f'Chunk {index} must be exactly {expected_length} bytes')
+    if not ok:
+        raise ChunkError(f'Checksum mismatch for chunk {index}', 422)
+
+    upload.chunks_received = index + 1
+    upload.bytes_received = offset + expected_length
+    return True
+
+
+def assemble_upload(upload):
+    """
+    Hash the completed part file and move it into the attachment store.
+    Returns a StoredBlob; raises ChunkError if chunks are missing or the
+    whole-file checksum does not match.
+    """
+    if upload.chunks_received < upload.total_chunks:
+        raise ChunkError(f'Upload incomplete: {upload.chunks_received}/{upload.total_chunks} chunks received', 409)
+    part_path = upload_part_path(upload.id)
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as part:
+        for data in iter(lambda: part.read(1024 * 1024), b''):
+            digest.update(data)
+    content_hash = digest.hexdigest()
+    if upload.expected_hash and upload.expected_hash != content_hash:
+        raise ChunkError('Checksum mismatch for assembled file', 422)
+    return attachment_store.commit(part_path, content_hash, upload.total_size)
+
+
+def discard_upload(upload):
+    try:
+        os.unlink(upload_part_path(upload.id))
+    except FileNotFoundError:
+        pass
+
+
+# Route all multipart uploads through the streaming parser
+app.request_class = StreamingUploadRequest
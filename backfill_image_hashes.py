@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Backfill script for perceptual hashes of existing image attachments
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from app import app
+from image_similarity import backfill_image_hashes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=500, help='Attachments loaded per query')
+    args = parser.parse_args()
+
+    with app.app_context():
+        stored = backfill_image_hashes(batch_size=args.batch_size)
+    print(f"Stored {stored} image hashes")
+
+if __name__ == "__main__":
+    print("Hashing existing image attachments...")
+    main()
+    print("Done.")
@@ -1,39 +1,52 @@
 #!/usr/bin/env python3
 """
-Backfill script for release and platform columns in issues table
+Backfill script for release, platform and bucket columns in the issues and
+testcase_paths tables
 """
 
+import argparse
 import sys
 import os
-import re
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 from app import app, db
-from models import Issue
+from models import Issue, TestcasePath
+from path_parser import parse_paths
 
-def parse_testcase_path(path):
-    if not path:
-        return None, None
-    pattern = r'/lan/fed/etpv5/release/(\d+)/([^/]+)/etautotest/'
-    match = re.match(pattern, path)
-    if match:
-        return match.group(1), match.group(2)
-    return None, None
+def backfill_table(model, batch_size):
+    """Walk `model` in id order, parsing each batch of paths in one call"""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(model.id, model.testcase_path, model.release, model.platform, model.bucket)
+                .filter(model.id > last_id)
+                .order_by(model.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        last_id = rows[-1].id
+        changes = []
+        for row, parsed in zip(rows, parse_paths([row.testcase_path for row in rows])):
+            if (parsed.release, parsed.platform, parsed.bucket) != (row.release, row.platform, row.bucket):
+                changes.append({'id': row.id, 'release': parsed.release, 'platform': parsed.platform, 'bucket': parsed.bucket})
+        if changes:
+            db.session.bulk_update_mappings(model, changes)
+            db.session.commit()
+            updated += len(changes)
+    return updated
 
-def backfill():
+def backfill(batch_size):
     with app.app_context():
-        issues = Issue.query.all()
-        updated = 0
-        for issue in issues:
-            release, platform = parse_testcase_path(issue.testcase_path)
-            if release != issue.release or platform != issue.platform:
-                issue.release = release
-                issue.platform = platform
-                updated += 1
-        db.session.commit()
-        print(f"Backfill complete. Updated {updated} issues.")
+        issues = backfill_table(Issue, batch_size)
+        paths = backfill_table(TestcasePath, batch_size)
+        print(f"Backfill complete. Updated {issues} issues and {paths} additional testcase paths.")
 
 if __name__ == "__main__":
-    print("Backfilling release and platform columns for issues...")
-    backfill()
-    print("Done.") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows loaded per query')
+    args = parser.parse_args()
+
+    print("Backfilling release, platform and bucket columns for issues...")
+    backfill(args.batch_size)
+    print("Done.")
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Backfill script for failure signatures of existing log attachments
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from app import app
+from signatures import backfill_signatures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=500, help='Attachments loaded per query')
+    args = parser.parse_args()
+
+    with app.app_context():
+        stored = backfill_signatures(batch_size=args.batch_size)
+    print(f"Stored {stored} failure signatures")
+
+if __name__ == "__main__":
+    print("Extracting failure signatures from existing attachments...")
+    main()
+    print("Done.")
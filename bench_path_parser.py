@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of testcase path parsing: the per-call re.match functions the
+models used before path_parser, against the compiled single-pass parser
+"""
+
+import argparse
+import random
+import re
+import sys
+import os
+import timeit
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from path_parser import parse_path, parse_paths, _parse
+
+PLATFORMS = ['lnx86', 'lnx86_64', 'sun4v', 'ibmrs', 'win64']
+BUCKETS = ['gui', 'sim', 'netlist', 'timing', 'power', 'layout', 'drc', 'lvs']
+
+def legacy_parse(path):
+    """The two regex calls each issue path went through before path_parser"""
+    release = platform = bucket = None
+    match = re.match(r'/lan/fed/etpv5/release/(\d+)/([^/]+)/etautotest/', path)
+    if match:
+        release, platform = match.group(1), match.group(2)
+    match = re.match(r'/lan/fed/etpv5/release/\d+/[^/]+/etautotest/([^/]+)', path)
+    if match:
+        bucket = match.group(1).upper()
+    return release, platform, bucket
+
+def make_paths(count, distinct):
+    rng = random.Random(0)
+    pool = [
+        f"/lan/fed/etpv5/release/{rng.randint(200, 260)}/{rng.choice(PLATFORMS)}/etautotest/"
+        f"{rng.choice(BUCKETS)}/suite{rng.randint(0, 99)}/test_{i}"
+        for i in range(distinct)
+    ]
+    return [rng.choice(pool) for _ in range(count)]
+
+def bench(label, func, paths, repeat):
+    best = min(timeit.repeat(lambda: func(paths), number=1, repeat=repeat))
+    print(f"{label:<28} {best * 1000:9.1f} ms  {best / len(paths) * 1e9:7.0f} ns/path")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--paths', type=int, default=200000, help='Paths parsed per run')
+    parser.add_argument('--distinct', type=int, default=5000, help='Distinct paths among them')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per variant (best is reported)')
+    args = parser.parse_args()
+
+    paths = make_paths(args.paths, args.distinct)
+    for path in paths[:1000]:
+        parsed = parse_path(path)
+        assert legacy_parse(path) == (parsed.release, parsed.platform, parsed.bucket)
+
+    legacy = bench('legacy re.match x2', lambda ps: [legacy_parse(p) for p in ps], paths, args.repeat)
+    bench('compiled, uncached', lambda ps: [_parse(p) for p in ps], paths, args.repeat)
+    bench('parse_path (LRU)', lambda ps: [parse_path(p) for p in ps], paths, args.repeat)
+    batch = bench('parse_paths (batch)', parse_paths, paths, args.repeat)
+    print(f"Batch speedup over legacy: {legacy / batch:.1f}x")
+
+if __name__ == "__main__":
+    print("Benchmarking testcase path parsing...")
+    main()
+    print("Done.")
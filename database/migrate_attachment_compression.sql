@@ -0,0 +1,12 @@
+-- Migration for compression at rest of text attachments
+-- file_size and mime_type keep describing the original file; content_encoding
+-- and stored_size describe what is on disk.
+
+USE testing_platform;
+
+ALTER TABLE attachments ADD COLUMN content_encoding VARCHAR(20) NULL COMMENT 'gzip when stored compressed';
+ALTER TABLE attachments ADD COLUMN stored_size BIGINT NULL COMMENT 'Bytes on disk';
+
+-- Then run: python recompress_attachments.py
+
+DESCRIBE attachments;
@@ -0,0 +1,23 @@
+-- Migration for failure signatures extracted from log attachments
+-- One normalized signature per text attachment; issues whose logs share a
+-- fingerprint failed the same way.
+
+USE testing_platform;
+
+CREATE TABLE IF NOT EXISTS attachment_signatures (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    attachment_id INT NOT NULL UNIQUE,
+    issue_id INT NOT NULL,
+    fingerprint CHAR(40) NOT NULL,
+    first_error VARCHAR(500) NOT NULL,
+    signature TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id),
+    INDEX idx_fingerprint_issue (fingerprint, issue_id)
+);
+
+-- Then run: python backfill_signatures.py
+
+DESCRIBE attachment_signatures;
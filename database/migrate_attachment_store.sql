@@ -0,0 +1,13 @@
+-- Migration for the content-addressed attachment store
+-- Attachments now reference a blob stored under uploads/<ab>/<cd>/<sha256>;
+-- rows sharing a content_hash share one file on disk.
+
+USE testing_platform;
+
+-- SHA-256 of the stored blob (NULL for legacy flat uploads)
+ALTER TABLE attachments ADD COLUMN content_hash CHAR(64) NULL COMMENT 'SHA-256 of the stored blob';
+
+-- Reference counting and dedup lookups go through this index
+CREATE INDEX idx_attachments_content_hash ON attachments(content_hash);
+
+DESCRIBE attachments;
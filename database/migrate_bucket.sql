@@ -0,0 +1,16 @@
+-- Migration to add an indexed bucket column to issues and testcase_paths
+-- The bucket is the first directory after etautotest/ in the testcase path,
+-- upper-cased; it was previously only recorded as a tag.
+
+USE testing_platform;
+
+ALTER TABLE issues ADD COLUMN bucket VARCHAR(100) NULL AFTER platform;
+ALTER TABLE testcase_paths ADD COLUMN bucket VARCHAR(100) NULL AFTER platform;
+
+CREATE INDEX idx_issues_bucket ON issues(bucket);
+CREATE INDEX idx_testcase_paths_bucket_issue ON testcase_paths(bucket, issue_id);
+
+-- Then run: python backfill_release_platform.py
+
+DESCRIBE issues;
+DESCRIBE testcase_paths;
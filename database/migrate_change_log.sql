@@ -0,0 +1,19 @@
+-- Migration for the change log
+-- Issue and comment writes are appended here in the same transaction so the
+-- in-memory indexes of every worker process can catch up incrementally.
+
+USE testing_platform;
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL,
+    entity_id INT NOT NULL,
+    issue_id INT NULL,
+    action ENUM('insert', 'update', 'delete') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created_at (created_at)
+);
+
+-- Then run: python rebuild_duplicate_index.py
+
+DESCRIBE change_log;
@@ -0,0 +1,32 @@
+-- Migration for resumable chunked uploads
+-- Large regression logs and core dumps are uploaded in verified chunks and
+-- assembled server-side into the attachment store.
+
+USE testing_platform;
+
+-- Attachments can now exceed 2GB
+ALTER TABLE attachments MODIFY COLUMN file_size BIGINT;
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    issue_id INT NOT NULL,
+    comment_id INT NULL,
+    filename VARCHAR(255) NOT NULL,
+    mime_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    chunk_size INT NOT NULL,
+    chunks_received INT DEFAULT 0,
+    bytes_received BIGINT DEFAULT 0,
+    expected_hash CHAR(64) NULL,
+    status ENUM('uploading', 'complete') DEFAULT 'uploading',
+    attachment_id INT NULL,
+    created_by VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    FOREIGN KEY (comment_id) REFERENCES comments(id) ON DELETE CASCADE,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE SET NULL,
+    INDEX idx_status_updated (status, updated_at)
+);
+
+DESCRIBE upload_sessions;
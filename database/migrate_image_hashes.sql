@@ -0,0 +1,21 @@
+-- Migration for perceptual hashes of image attachments
+-- pHash and dHash of each screenshot, stored as signed 64-bit integers; the
+-- similar-screenshot index is loaded from and tails this table.
+
+USE testing_platform;
+
+CREATE TABLE IF NOT EXISTS image_hashes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    attachment_id INT NOT NULL UNIQUE,
+    issue_id INT NOT NULL,
+    phash BIGINT NOT NULL,
+    dhash BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id)
+);
+
+-- Then run: python backfill_image_hashes.py
+
+DESCRIBE image_hashes;
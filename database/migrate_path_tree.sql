@@ -0,0 +1,21 @@
+-- Migration for the materialized testcase path tree
+-- One row per directory prefix of every primary and additional testcase path,
+-- with the number of distinct issues with a path at or below it; kept current
+-- on every write.
+
+USE testing_platform;
+
+CREATE TABLE IF NOT EXISTS path_nodes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    prefix VARCHAR(200) NOT NULL UNIQUE,
+    parent VARCHAR(200) NOT NULL,
+    name VARCHAR(200) NOT NULL,
+    path_count INT NOT NULL DEFAULT 0,
+    leaf_count INT NOT NULL DEFAULT 0,
+    issue_count INT NOT NULL DEFAULT 0,
+    INDEX idx_parent_name (parent, name)
+);
+
+-- Then run: python rebuild_indexes.py paths
+
+DESCRIBE path_nodes;
@@ -0,0 +1,32 @@
+-- Migration for saved searches
+-- Each saved search keeps the ids of its matching issues, updated from the
+-- change log, and the change it was last viewed at for "new since last view".
+
+USE testing_platform;
+
+CREATE TABLE IF NOT EXISTS saved_searches (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    query_text TEXT NOT NULL,
+    change_id INT NOT NULL DEFAULT 0,
+    viewed_change_id INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    viewed_at TIMESTAMP NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_user_id (user_id)
+);
+
+CREATE TABLE IF NOT EXISTS saved_search_results (
+    saved_search_id INT NOT NULL,
+    issue_id INT NOT NULL,
+    added_change_id INT NOT NULL,
+    PRIMARY KEY (saved_search_id, issue_id),
+    FOREIGN KEY (saved_search_id) REFERENCES saved_searches(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id),
+    INDEX idx_search_added (saved_search_id, added_change_id)
+);
+
+DESCRIBE saved_searches;
+DESCRIBE saved_search_results;
@@ -24,6 +24,7 @@ CREATE TABLE IF NOT EXISTS issues (
     test_case_ids VARCHAR(200) NOT NULL,
     `release` VARCHAR(10),
     platform VARCHAR(20),
+    bucket VARCHAR(100),
     build VARCHAR(20),
     target VARCHAR(100),
     description TEXT NOT NULL,
@@ -38,7 +39,8 @@ CREATE TABLE IF NOT EXISTS issues (
     downvotes INT DEFAULT 0,
     INDEX idx_status (status),
     INDEX idx_test_case_id (test_case_ids),
-    INDEX idx_created_at (created_at)
+    INDEX idx_created_at (created_at),
+    INDEX idx_bucket (bucket)
 );
 
 -- Tags table
@@ -80,14 +82,117 @@ CREATE TABLE IF NOT EXISTS attachments (
     comment_id INT NULL,
     filename VARCHAR(255) NOT NULL,
     file_path VARCHAR(500) NOT NULL,
-    file_size INT,
+    file_size BIGINT,
     mime_type VARCHAR(100),
+    content_hash CHAR(64) NULL,
+    content_encoding VARCHAR(20) NULL,
+    stored_size BIGINT NULL,
     uploaded_by VARCHAR(100) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
     FOREIGN KEY (comment_id) REFERENCES comments(id) ON DELETE CASCADE,
     INDEX idx_issue_id (issue_id),
-    INDEX idx_comment_id (comment_id)
+    INDEX idx_comment_id (comment_id),
+    INDEX idx_content_hash (content_hash)
+);
+
+-- Resumable chunked upload sessions
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    issue_id INT NOT NULL,
+    comment_id INT NULL,
+    filename VARCHAR(255) NOT NULL,
+    mime_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    chunk_size INT NOT NULL,
+    chunks_received INT DEFAULT 0,
+    bytes_received BIGINT DEFAULT 0,
+    expected_hash CHAR(64) NULL,
+    status ENUM('uploading', 'complete') DEFAULT 'uploading',
+    attachment_id INT NULL,
+    created_by VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    FOREIGN KEY (comment_id) REFERENCES comments(id) ON DELETE CASCADE,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE SET NULL,
+    INDEX idx_status_updated (status, updated_at)
+);
+
+-- Failure signatures extracted from log attachments
+CREATE TABLE IF NOT EXISTS attachment_signatures (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    attachment_id INT NOT NULL UNIQUE,
+    issue_id INT NOT NULL,
+    fingerprint CHAR(40) NOT NULL,
+    first_error VARCHAR(500) NOT NULL,
+    signature TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id),
+    INDEX idx_fingerprint_issue (fingerprint, issue_id)
+);
+
+-- Perceptual hashes of image attachments (similar-screenshot lookup)
+CREATE TABLE IF NOT EXISTS image_hashes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    attachment_id INT NOT NULL UNIQUE,
+    issue_id INT NOT NULL,
+    phash BIGINT NOT NULL,
+    dhash BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id)
+);
+
+-- Directory tree of testcase paths with path counts (tree browser)
+CREATE TABLE IF NOT EXISTS path_nodes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    prefix VARCHAR(200) NOT NULL UNIQUE,
+    parent VARCHAR(200) NOT NULL,
+    name VARCHAR(200) NOT NULL,
+    path_count INT NOT NULL DEFAULT 0,
+    leaf_count INT NOT NULL DEFAULT 0,
+    issue_count INT NOT NULL DEFAULT 0,
+    INDEX idx_parent_name (parent, name)
+);
+
+-- Saved searches and their materialized results (kept current from the change log)
+CREATE TABLE IF NOT EXISTS saved_searches (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    query_text TEXT NOT NULL,
+    change_id INT NOT NULL DEFAULT 0,
+    viewed_change_id INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    viewed_at TIMESTAMP NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_user_id (user_id)
+);
+
+CREATE TABLE IF NOT EXISTS saved_search_results (
+    saved_search_id INT NOT NULL,
+    issue_id INT NOT NULL,
+    added_change_id INT NOT NULL,
+    PRIMARY KEY (saved_search_id, issue_id),
+    FOREIGN KEY (saved_search_id) REFERENCES saved_searches(id) ON DELETE CASCADE,
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_issue_id (issue_id),
+    INDEX idx_search_added (saved_search_id, added_change_id)
+);
+
+-- Change log of issue and comment writes (feeds the in-memory indexes)
+CREATE TABLE IF NOT EXISTS change_log (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL,
+    entity_id INT NOT NULL,
+    issue_id INT NULL,
+    action ENUM('insert', 'update', 'delete') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created_at (created_at)
 );
 
 -- Additional testcase paths table
@@ -97,9 +202,11 @@ CREATE TABLE IF NOT EXISTS testcase_paths (
     testcase_path VARCHAR(200) NOT NULL,
     `release` VARCHAR(10),
     platform VARCHAR(20),
+    bucket VARCHAR(100),
     added_by VARCHAR(100) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE
+    FOREIGN KEY (issue_id) REFERENCES issues(id) ON DELETE CASCADE,
+    INDEX idx_bucket_issue (bucket, issue_id)
 );
 
 -- Bucket reviewers mapping table
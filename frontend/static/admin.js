@@ -184,7 +184,7 @@ async function loadIssuesForAdmin() {
 
     
     try {
-        let url = '/api/issues?per_page=50';
+        let url = '/api/issues?per_page=50&fields=id,testcase_title,status,severity,reporter_name,created_at';
         if (status) url += `&status=${status}`;
         if (severity) url += `&severity=${severity}`;
         
@@ -282,6 +282,10 @@ document.addEventListener('DOMContentLoaded', function() {
         updateInfoFromPath();
     }
     
+    // Autocomplete paths and tags already used by other issues
+    attachSuggestions(testcasePathInput, ['path']);
+    attachSuggestions(tagInput, ['tag', 'bucket']);
+    
     // Handle Enter key for tag input
     if (tagInput) {
         tagInput.addEventListener('keypress', function(e) {
@@ -414,7 +414,7 @@ function updateIssueDisplay(issue) {
             if (showAsImage) {
                 return `<div class="attachment-item image-attachment">
                     <div class="attachment-link" onclick="openImageModal('/api/attachments/${attachment.id}', '${attachment.filename}')">
-                        <img src="/api/attachments/${attachment.id}" alt="${attachment.filename}" class="attachment-thumbnail" 
+                        <img src="/api/attachments/${attachment.id}?size=480" alt="${attachment.filename}" class="attachment-thumbnail" loading="lazy" 
                              onerror="console.error('Failed to load image:', '/api/attachments/${attachment.id}'); this.parentElement.innerHTML='<div class=\\'attachment-error\\'>❌ Failed to load: ${attachment.filename}</div>'" />
                     </div>
                 </div>`;
@@ -441,6 +441,48 @@ function updateIssueDisplay(issue) {
     
     // Load comments
     loadComments(issue.id);
+    
+    // Load similar issues for the "Related Issues" panel
+    loadRelatedIssues(issue.id);
+}
+
+async function loadRelatedIssues(issueId) {
+    const relatedSection = document.getElementById('related-section');
+    const relatedList = document.getElementById('related-list');
+    if (!relatedSection || !relatedList) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(`/api/issues/${issueId}/related?limit=8`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        if (!data.related || data.related.length === 0) {
+            relatedSection.style.display = 'none';
+            return;
+        }
+        
+        relatedList.innerHTML = data.related.map(related => `
+            <li class="related-item">
+                <a href="/issues/${related.id}" class="related-link">#${related.id} ${escapeHtml(related.testcase_title)}</a>
+                <span class="tag status-${related.status}">${related.status.toUpperCase()}</span>
+                <span class="related-score">${Math.round(related.score * 100)}% similar</span>
+            </li>
+        `).join('');
+        relatedSection.style.display = 'block';
+    } catch (error) {
+        console.error('Error loading related issues:', error);
+        relatedSection.style.display = 'none';
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text || '';
+    return div.innerHTML;
 }
 
 async function loadComments(issueId) {
@@ -843,7 +885,7 @@ async function moveToCcr(issueId) {
 
     // First, get the current issue data to check status
     try {
-        const issueResponse = await fetch(`/api/issues/${issueId}`);
+        const issueResponse = await fetch(`/api/issues/${issueId}?fields=status`);
         if (issueResponse.ok) {
             const issue = await issueResponse.json();
             if (issue.status === 'resolved') {
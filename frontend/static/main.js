@@ -91,6 +91,47 @@ function debounce(fn, delay) {
     };
 }
 
+// --- Typeahead suggestions ---
+// Fills a <datalist> for the input from /api/suggest on every keystroke;
+// responses that arrive after a newer keystroke are dropped.
+function attachSuggestions(input, kinds) {
+    if (!input) return;
+    const list = document.createElement('datalist');
+    list.id = `${input.id}-suggestions`;
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.after(list);
+    let latest = 0;
+    input.addEventListener('input', async () => {
+        const query = input.value.trim();
+        const requestId = ++latest;
+        if (!query) {
+            list.innerHTML = '';
+            return;
+        }
+        try {
+            const res = await fetch(`/api/suggest?q=${encodeURIComponent(query)}&kind=${kinds.join(',')}&limit=8`);
+            if (!res.ok || requestId !== latest) return;
+            const data = await res.json();
+            if (requestId !== latest) return;
+            const values = [];
+            kinds.forEach(kind => {
+                (data.suggestions[kind] || []).forEach(suggestion => {
+                    if (!values.includes(suggestion.value)) values.push(suggestion.value);
+                });
+            });
+            list.innerHTML = '';
+            values.forEach(value => {
+                const option = document.createElement('option');
+                option.value = value;
+                list.appendChild(option);
+            });
+        } catch (error) {
+            console.warn('Suggestions unavailable:', error);
+        }
+    });
+}
+
 // --- SPA Main Logic for Tester Talk ---
 const issuesList = document.getElementById('issues-list');
 const searchForm = document.getElementById('search-form');
@@ -122,8 +163,35 @@ async function logout() {
     }
 }
 
+// --- Load the user, reference data and first page of issues in one request ---
+// Reference data is kept in localStorage and only sent again when its version changes
+async function loadBootstrap(withSearch) {
+    let cached = null;
+    try {
+        cached = JSON.parse(localStorage.getItem('referenceData'));
+    } catch (error) {
+        cached = null;
+    }
+    const params = new URLSearchParams();
+    if (cached && cached.version) params.set('reference_version', cached.version);
+    if (!withSearch) params.set('search', '0');
+
+    const response = await fetch(`/api/bootstrap?${params}`, { credentials: 'include' });
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const data = await response.json();
+    if (data.reference) {
+        localStorage.setItem('referenceData', JSON.stringify({ version: data.reference_version, data: data.reference }));
+    } else if (cached && cached.version === data.reference_version) {
+        data.reference = cached.data;
+    }
+    return data;
+}
+
 // --- Check authentication status and update header ---
-async function updateHeader() {
+// knownUser: the user from /api/bootstrap (null when logged out); fetched when not given
+async function updateHeader(knownUser) {
     const loginBtn = document.getElementById('login-btn');
     const createBtn = document.getElementById('create-issue-btn');
     const navCreateLink = document.getElementById('nav-create-link');
@@ -132,9 +200,12 @@ async function updateHeader() {
     if (!loginBtn) return;
     
     try {
-        const response = await fetch('/api/auth/me', { credentials: 'include' });
-        if (response.ok) {
-            const user = await response.json();
+        let user = knownUser;
+        if (user === undefined) {
+            const response = await fetch('/api/auth/me', { credentials: 'include' });
+            user = response.ok ? await response.json() : null;
+        }
+        if (user) {
             localStorage.setItem('currentUser', JSON.stringify(user));
             
             // Update button to show logout
@@ -196,8 +267,18 @@ async function updateHeader() {
 
 // --- On page load, render only the correct view ---
 async function setupEventListeners() {
+    const match = window.location.pathname.match(/^\/issues\/(\d+)$/);
+
+    // One request for the user, dropdown options and (on the list page) the first issues
+    let boot = null;
+    try {
+        boot = await loadBootstrap(!match);
+    } catch (error) {
+        console.error('Error loading bootstrap data:', error);
+    }
+
     // Check authentication status and update header first
-    await updateHeader();
+    await updateHeader(boot ? boot.user : undefined);
     
     // Add create issue button functionality
     const createBtn = document.getElementById('create-issue-btn');
@@ -257,6 +338,7 @@ async function setupEventListeners() {
             performSearch();
         });
     }
+    attachSuggestions(searchInput, ['title', 'test_case_id', 'tag', 'bucket']);
     
     // Add quick filter functionality
     quickFilters.forEach(filter => {
@@ -292,9 +374,8 @@ async function setupEventListeners() {
     });
     
     // Populate dropdowns with real API data
-    await populateDropdowns();
-    
-    const match = window.location.pathname.match(/^\/issues\/(\d+)$/);
+    await populateDropdowns(boot ? boot.reference : null);
+
     if (match) {
         issuesList.style.display = 'none';
         issueDetailView.style.display = 'block';
@@ -302,7 +383,11 @@ async function setupEventListeners() {
     } else {
         issueDetailView.style.display = 'none';
         issuesList.style.display = '';
-        performSearch();
+        if (boot && boot.search) {
+            renderIssuesList(boot.search.issues || []);
+        } else {
+            performSearch();
+        }
     }
 }
 
@@ -322,14 +407,19 @@ const SEVERITY_OPTIONS = [
 ];
 
 // --- Populate Filter Dropdowns with Real API Data ---
-async function populateDropdowns() {
+// Build targets per release from the bootstrap reference data
+let referenceTargets = {};
+
+async function populateDropdowns(reference) {
     try {
         // Populate status and severity dropdowns
         populateSelect(statusSelect, STATUS_OPTIONS);
         populateSelect(severitySelect, SEVERITY_OPTIONS);
 
-        // Populate builds from API
-        await populateBuilds();
+        referenceTargets = (reference && reference.targets) || {};
+
+        // Populate builds from the reference data, or the API
+        await populateBuilds(reference ? reference.builds : null);
         
         // Populate platforms from API
         await populatePlatforms();
@@ -362,11 +452,11 @@ function populateSelect(select, options) {
     });
 }
 
-async function populateBuilds() {
+async function populateBuilds(knownBuilds) {
     try {
-        const response = await fetch('/api/builds');
-        if (response.ok) {
-            const builds = await response.json();
+        const response = knownBuilds ? null : await fetch('/api/builds');
+        if (knownBuilds || response.ok) {
+            const builds = knownBuilds || await response.json();
             buildSelect.innerHTML = '<option value="">All</option>';
             builds.forEach(build => {
                 const option = document.createElement('option');
@@ -434,7 +524,20 @@ async function populateTargets(release) {
         targetSelect.disabled = true;
         return;
     }
-    
+
+    const knownTargets = referenceTargets[release];
+    if (knownTargets) {
+        targetSelect.innerHTML = '<option value="">All</option>';
+        knownTargets.forEach(target => {
+            const option = document.createElement('option');
+            option.value = target;
+            option.textContent = target;
+            targetSelect.appendChild(option);
+        });
+        targetSelect.disabled = false;
+        return;
+    }
+
     try {
         const response = await fetch(`/api/targets/${release}`);
         if (response.ok) {
@@ -570,10 +673,20 @@ function renderIssueCard(issue) {
     
     card.appendChild(tags);
     
+    // Search results carry snippets of where the text matched
+    const snippets = issue.snippets || [];
+    const titleSnippet = snippets.find(snippet => snippet.field === 'title');
+    const descSnippet = snippets.find(snippet => snippet.field === 'description');
+    const commentSnippet = snippets.find(snippet => snippet.field === 'comment');
+
     // Title
     const title = document.createElement('div');
     title.className = 'issue-title';
-    title.textContent = issue.testcase_title;
+    if (titleSnippet) {
+        appendHighlighted(title, titleSnippet);
+    } else {
+        title.textContent = issue.testcase_title;
+    }
     card.appendChild(title);
     
     // Path
@@ -620,8 +733,23 @@ function renderIssueCard(issue) {
     // Description
     const desc = document.createElement('div');
     desc.className = 'issue-desc';
-    desc.textContent = issue.description.substring(0, 200) + (issue.description.length > 200 ? '...' : '');
+    if (descSnippet) {
+        appendHighlighted(desc, descSnippet);
+    } else {
+        // List responses only carry the start of the description
+        const text = issue.description_preview ?? issue.description ?? '';
+        desc.textContent = text.substring(0, 200) + (text.length >= 200 ? '...' : '');
+    }
     card.appendChild(desc);
+
+    if (commentSnippet) {
+        const comment = document.createElement('div');
+        comment.className = 'issue-comment-snippet';
+        const matched = issue.matched_comment || {};
+        comment.textContent = `💬 ${matched.is_verified_solution ? '✔ ' : ''}${matched.commenter_name || 'Comment'}: `;
+        appendHighlighted(comment, commentSnippet);
+        card.appendChild(comment);
+    }
     
     // Resolution indicator for resolved issues
     if (issue.status === 'resolved' && issue.updated_at && issue.created_at) {
@@ -644,7 +772,7 @@ function renderIssueCard(issue) {
         <div class="footer-left">
             <span class="time-ago">&#x1F550; ${timeAgo(issue.created_at)}</span>
             <span class="comment-count">${issue.comment_count || 0} comments</span>
-            <span class="testcase-count">Found in: ${1 + (issue.additional_testcase_paths?.length || 0)} testcase(s)</span>
+            <span class="testcase-count">Found in: ${issue.testcase_count || 1 + (issue.additional_testcase_paths?.length || 0)} testcase(s)</span>
         </div>
         <div class="footer-right">
             <span class="created-date">Created: ${new Date(issue.created_at).toLocaleString()}</span>
@@ -794,6 +922,21 @@ function renderCommentHTML(comment, issue) {
     `;
 }
 
+// Append snippet text to an element with its highlights wrapped in <mark>.
+// Highlight offsets count characters (code points), hence Array.from.
+function appendHighlighted(element, snippet) {
+    const chars = Array.from(snippet.text);
+    let last = 0;
+    snippet.highlights.forEach(([start, end]) => {
+        element.appendChild(document.createTextNode(chars.slice(last, start).join('')));
+        const mark = document.createElement('mark');
+        mark.textContent = chars.slice(start, end).join('');
+        element.appendChild(mark);
+        last = end;
+    });
+    element.appendChild(document.createTextNode(chars.slice(last).join('')));
+}
+
 function makeTag(text, cls) {
     const tag = document.createElement('span');
     tag.className = `tag ${cls}`;
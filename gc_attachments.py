@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Garbage collector for the attachment store.
+Removes blobs no attachment row references any more, legacy flat uploads
+left behind by deleted issues, stale temp files and chunked upload sessions
+that were abandoned. Runs as a dry run unless --delete is given.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from app import app
+from attachment_gc import collect_garbage
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--delete', action='store_true', help='Actually delete orphaned files (default is a dry run)')
+    parser.add_argument('--grace-seconds', type=int, default=None, help='Keep files modified more recently than this (default: ATTACHMENT_GC_GRACE_SECONDS)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows fetched per query')
+    args = parser.parse_args()
+
+    with app.app_context():
+        report = collect_garbage(dry_run=not args.delete, grace_seconds=args.grace_seconds, batch_size=args.batch_size)
+
+    counts = report['counts']
+    verb = 'Would reclaim' if report['dry_run'] else 'Reclaimed'
+    print(f"Scanned {counts['blobs_scanned']} stored blobs")
+    print(f"Orphaned blobs: {counts['orphan_blobs']}")
+    print(f"Orphaned legacy uploads: {counts['orphan_legacy_files']}")
+    print(f"Stale temp files: {counts['stale_temp_files']}")
+    print(f"Expired upload sessions: {counts['expired_upload_sessions']}")
+    print(f"Skipped (within grace period): {counts['skipped_in_grace_period']}")
+    if counts['missing_blobs']:
+        print(f"Warning: {counts['missing_blobs']} referenced blobs are missing from disk")
+    print(f"{verb} {report['reclaimed_bytes']} bytes")
+    for sample in report['samples']:
+        print(f"  {sample['category']}: {sample['path']}")
+
+if __name__ == "__main__":
+    print("Collecting orphaned attachments...")
+    main()
+    print("Done.")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Rebuild the snapshots of the in-memory search and similarity indexes from
+the database. Running servers keep serving their current index and switch to
+(or load) the new snapshots on their next sync or start. `paths` recounts the
+path_nodes tree table in place.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from app import app
+from near_duplicates import rebuild_index as rebuild_duplicates
+from related import rebuild_snapshot as rebuild_related
+from path_tree import rebuild_tree as rebuild_paths
+
+# name -> (rebuild function, what its count is of)
+INDEXES = {
+    'duplicates': (lambda args: rebuild_duplicates(workers=args.workers), 'issues'),
+    'related': (lambda args: rebuild_related(), 'issues'),
+    'paths': (lambda args: rebuild_paths(), 'testcase paths'),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('indexes', nargs='*', help=f"Indexes to rebuild: {', '.join(sorted(INDEXES))} (default: all)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes for parallel builds')
+    args = parser.parse_args()
+    unknown = set(args.indexes) - set(INDEXES)
+    if unknown:
+        parser.error(f"unknown index: {', '.join(sorted(unknown))}")
+
+    with app.app_context():
+        for name in args.indexes or sorted(INDEXES):
+            rebuild, unit = INDEXES[name]
+            indexed = rebuild(args)
+            if indexed is None:
+                print(f"{name}: another process is already rebuilding, skipped")
+            else:
+                print(f"{name}: indexed {indexed} {unit}")
+
+if __name__ == "__main__":
+    print("Rebuilding indexes...")
+    main()
+    print("Done.")
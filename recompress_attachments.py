@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Background recompression job for existing attachments.
+Moves legacy flat uploads (uploads/<timestamp>_<name>) into the
+content-addressed store and gzip-compresses text/log blobs at rest.
+Safe to re-run; attachments that are already compressed are skipped.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from app import app
+from compression import recompress_existing
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without touching files')
+    parser.add_argument('--batch-size', type=int, default=500, help='Attachments loaded per query')
+    parser.add_argument('--limit', type=int, default=None, help='Stop after scanning this many attachments')
+    args = parser.parse_args()
+
+    with app.app_context():
+        summary = recompress_existing(batch_size=args.batch_size, dry_run=args.dry_run, limit=args.limit)
+
+    print(f"Scanned {summary['scanned']} attachments")
+    print(f"Migrated {summary['migrated']} legacy uploads into the attachment store")
+    print(f"Compressed {summary['compressed']} text attachments")
+    if not args.dry_run and summary['bytes_before']:
+        print(f"Text attachments: {summary['bytes_before']} -> {summary['bytes_after']} bytes")
+    if summary['errors']:
+        print(f"{summary['errors']} attachments failed; see log above")
+
+if __name__ == "__main__":
+    print("Recompressing existing attachments...")
+    main()
+    print("Done.")